@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+import numpy as np
+from .metrics import ANSWER_CACHE_LOOKUPS
+
+logger = logging.getLogger(__name__)
+
+REDIS_URL = os.getenv("REDIS_URL")
+# "redis", "memory" or "off"
+ANSWER_CACHE_BACKEND = os.getenv("ANSWER_CACHE_BACKEND", "redis" if REDIS_URL else "memory")
+# Seconds a cached answer stays valid
+ANSWER_CACHE_TTL = int(os.getenv("ANSWER_CACHE_TTL", 3600))
+# Total entries kept by the in-memory backend before least-recently-used ones are evicted
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 10000))
+# Entries kept per (user, retrieved document set) bucket
+ANSWER_CACHE_BUCKET_SIZE = int(os.getenv("ANSWER_CACHE_BUCKET_SIZE", 50))
+# Minimum cosine similarity between question embeddings for a cached answer to be reused
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", 0.95))
+
+def documents_fingerprint(document_versions: Dict[int, Optional[str]]) -> str:
+    """Stable key for the set of retrieved documents and their versions (content hashes)."""
+    payload = ",".join(f"{doc_id}:{version or ''}" for doc_id, version in sorted(document_versions.items()))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def _normalize(embedding) -> np.ndarray:
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+class InMemoryAnswerCache:
+    def __init__(self, ttl: int, max_entries: int, bucket_size: int, similarity: float):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bucket_size = bucket_size
+        self.similarity = similarity
+        self._lock = threading.Lock()
+        # entry_id -> (bucket_key, document_ids, embedding, answer, expires_at), in LRU order
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._buckets: Dict[tuple, list] = {}
+        self._by_document: Dict[tuple, set] = {}
+
+    def get(self, owner_id: int, fingerprint: str, embedding) -> Optional[str]:
+        query = _normalize(embedding)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, self.similarity
+            for entry_id in list(self._buckets.get((owner_id, fingerprint), [])):
+                _, _, cached_embedding, _, expires_at = self._entries[entry_id]
+                if expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                score = float(np.dot(query, cached_embedding))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                return None
+            self._entries.move_to_end(best_id)
+            return self._entries[best_id][3]
+
+    def set(self, owner_id: int, fingerprint: str, document_ids: Iterable[int], embedding, answer: str):
+        bucket_key = (owner_id, fingerprint)
+        document_ids = tuple(document_ids)
+        entry_id = uuid.uuid4().hex
+        with self._lock:
+            self._entries[entry_id] = (bucket_key, document_ids, _normalize(embedding), answer, time.monotonic() + self.ttl)
+            bucket = self._buckets.setdefault(bucket_key, [])
+            bucket.append(entry_id)
+            for document_id in document_ids:
+                self._by_document.setdefault((owner_id, document_id), set()).add(entry_id)
+            while len(bucket) > self.bucket_size:
+                self._remove(bucket[0])
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_document(self, owner_id: int, document_id: int):
+        with self._lock:
+            entry_ids = self._by_document.pop((owner_id, document_id), set())
+            for entry_id in entry_ids:
+                self._remove(entry_id)
+        if entry_ids:
+            logger.info(f"Invalidated {len(entry_ids)} cached answers for document {document_id}.")
+
+    def _remove(self, entry_id: str):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        bucket_key, document_ids = entry[0], entry[1]
+        bucket = self._buckets.get(bucket_key)
+        if bucket is not None:
+            bucket.remove(entry_id)
+            if not bucket:
+                del self._buckets[bucket_key]
+        for document_id in document_ids:
+            entry_ids = self._by_document.get((bucket_key[0], document_id))
+            if entry_ids is not None:
+                entry_ids.discard(entry_id)
+                if not entry_ids:
+                    del self._by_document[(bucket_key[0], document_id)]
+
+class RedisAnswerCache:
+    """Buckets are Redis lists of JSON entries; eviction relies on key TTLs, per-bucket trimming and Redis maxmemory policy."""
+    KEY_PREFIX = "askmydocs:answers"
+
+    def __init__(self, url: str, ttl: int, bucket_size: int, similarity: float):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self.ttl = ttl
+        self.bucket_size = bucket_size
+        self.similarity = similarity
+
+    def _bucket_key(self, owner_id: int, fingerprint: str) -> str:
+        return f"{self.KEY_PREFIX}:{owner_id}:{fingerprint}"
+
+    def _document_key(self, owner_id: int, document_id: int) -> str:
+        return f"{self.KEY_PREFIX}:doc:{owner_id}:{document_id}"
+
+    def get(self, owner_id: int, fingerprint: str, embedding) -> Optional[str]:
+        query = _normalize(embedding)
+        best_answer, best_score = None, self.similarity
+        for raw in self._client.lrange(self._bucket_key(owner_id, fingerprint), 0, -1):
+            entry = json.loads(raw)
+            score = float(np.dot(query, np.asarray(entry["embedding"], dtype=np.float32)))
+            if score >= best_score:
+                best_answer, best_score = entry["answer"], score
+        return best_answer
+
+    def set(self, owner_id: int, fingerprint: str, document_ids: Iterable[int], embedding, answer: str):
+        bucket_key = self._bucket_key(owner_id, fingerprint)
+        entry = json.dumps({"embedding": _normalize(embedding).tolist(), "answer": answer})
+        pipe = self._client.pipeline()
+        pipe.rpush(bucket_key, entry)
+        pipe.ltrim(bucket_key, -self.bucket_size, -1)
+        pipe.expire(bucket_key, self.ttl)
+        for document_id in document_ids:
+            document_key = self._document_key(owner_id, document_id)
+            pipe.sadd(document_key, bucket_key)
+            pipe.expire(document_key, self.ttl)
+        pipe.execute()
+
+    def invalidate_document(self, owner_id: int, document_id: int):
+        document_key = self._document_key(owner_id, document_id)
+        bucket_keys = self._client.smembers(document_key)
+        if bucket_keys:
+            self._client.delete(*bucket_keys)
+            logger.info(f"Invalidated {len(bucket_keys)} cached answer buckets for document {document_id}.")
+        self._client.delete(document_key)
+
+class AnswerCache:
+    """Facade that records hit/miss metrics and never lets a cache failure break a query."""
+
+    def __init__(self, backend):
+        self._backend = backend
+
+    def get(self, owner_id: int, document_versions: Dict[int, Optional[str]], embedding) -> Optional[str]:
+        if self._backend is None:
+            return None
+        try:
+            answer = self._backend.get(owner_id, documents_fingerprint(document_versions), embedding)
+        except Exception as e:
+            logger.warning(f"Answer cache lookup failed: {e}")
+            answer = None
+        ANSWER_CACHE_LOOKUPS.labels(result="hit" if answer is not None else "miss").inc()
+        return answer
+
+    def set(self, owner_id: int, document_versions: Dict[int, Optional[str]], embedding, answer: str):
+        if self._backend is None:
+            return
+        try:
+            self._backend.set(owner_id, documents_fingerprint(document_versions), document_versions.keys(), embedding, answer)
+        except Exception as e:
+            logger.warning(f"Answer cache store failed: {e}")
+
+    def invalidate_document(self, owner_id: int, document_id: int):
+        if self._backend is None:
+            return
+        try:
+            self._backend.invalidate_document(owner_id, document_id)
+        except Exception as e:
+            logger.warning(f"Answer cache invalidation failed for document {document_id}: {e}")
+
+def _create_backend():
+    if ANSWER_CACHE_BACKEND == "off":
+        logger.info("Answer cache disabled.")
+        return None
+    if ANSWER_CACHE_BACKEND == "redis":
+        logger.info("Using Redis answer cache.")
+        return RedisAnswerCache(REDIS_URL, ANSWER_CACHE_TTL, ANSWER_CACHE_BUCKET_SIZE, ANSWER_CACHE_SIMILARITY)
+    logger.info("Using in-process answer cache.")
+    return InMemoryAnswerCache(ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_BUCKET_SIZE, ANSWER_CACHE_SIMILARITY)
+
+answer_cache = AnswerCache(_create_backend())
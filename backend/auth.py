@@ -1,11 +1,19 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from passlib.context import CryptContext
 from datetime import datetime, timedelta, timezone
-from typing import Union, Any
+from typing import Dict, Optional, Set, Tuple, Union, Any
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from .db.database import get_db
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import event, select
 from .db import models
 from pydantic import BaseModel
 import logging # Import logging
@@ -16,9 +24,28 @@ logger = logging.getLogger(__name__)
 SECRET_KEY = "YOUR_SUPER_SECRET_KEY" # TODO: Load from environment variable
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30 # Example: 30 minutes
+# Validated token -> principal cache; entries never outlive the token's own expiry. The TTL also bounds how
+# long a changed or deleted user can stay cached where an invalidation does not arrive (see invalidate_user_cache)
+AUTH_CACHE_TTL = int(os.getenv("AUTH_CACHE_TTL", 60))
+AUTH_CACHE_MAX_ENTRIES = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", 10000))
+# With Redis configured, invalidations are published on this channel so every worker process evicts the user
+REDIS_URL = os.getenv("REDIS_URL")
+AUTH_CACHE_INVALIDATION_CHANNEL = os.getenv("AUTH_CACHE_INVALIDATION_CHANNEL", "askmydocs:auth:invalidate")
+
+# bcrypt cost factor; hashes with a different cost are transparently rehashed on the next successful login
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+# Threads dedicated to bcrypt, and how many further requests may wait for one before we answer 429
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", 32))
 
 # Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
 
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
@@ -26,6 +53,30 @@ def verify_password(plain_password, hashed_password):
 def get_password_hash(password):
     return pwd_context.hash(password)
 
+_password_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_password_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_LIMIT)
+
+async def _run_password_task(fn, *args):
+    """Run CPU-heavy password work on the dedicated executor, rejecting with 429 when it is saturated."""
+    if not _password_slots.acquire(blocking=False):
+        logger.warning("Password hashing executor saturated; rejecting request.")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many authentication requests. Please retry shortly.",
+            headers={"Retry-After": "1"},
+        )
+    # The slot is released when the work finishes, even if the awaiting request is cancelled first
+    future = _password_executor.submit(fn, *args)
+    future.add_done_callback(lambda _: _password_slots.release())
+    return await asyncio.wrap_future(future)
+
+async def hash_password_async(password: str) -> str:
+    return await _run_password_task(get_password_hash, password)
+
+async def verify_and_update_password_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password; also returns a new hash when the stored one uses outdated settings (else None)."""
+    return await _run_password_task(pwd_context.verify_and_update, plain_password, hashed_password)
+
 def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None):
     to_encode = data.copy()
     if expires_delta:
@@ -39,7 +90,116 @@ def create_access_token(data: dict, expires_delta: Union[timedelta, None] = None
 # OAuth2PasswordBearer for token extraction from headers
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login") # tokenUrl should point to your login endpoint
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+class UserPrincipal(BaseModel):
+    """Lightweight authenticated identity handed to endpoints instead of an attached ORM User."""
+    id: int
+    username: str
+
+class PrincipalCache:
+    """Size-bounded LRU of token -> principal with per-entry expiry."""
+
+    def __init__(self, ttl: int, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[UserPrincipal, float]]" = OrderedDict()
+        self._tokens_by_user: Dict[int, Set[str]] = {}
+
+    def get(self, token: str) -> Optional[UserPrincipal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if expires_at <= time.time():
+                self._remove(token)
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def set(self, token: str, principal: UserPrincipal, token_expires_at: Optional[float]):
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        with self._lock:
+            self._entries[token] = (principal, expires_at)
+            self._entries.move_to_end(token)
+            self._tokens_by_user.setdefault(principal.id, set()).add(token)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for token in self._tokens_by_user.pop(user_id, set()):
+                self._entries.pop(token, None)
+
+    def _remove(self, token: str):
+        entry = self._entries.pop(token, None)
+        if entry is not None:
+            tokens = self._tokens_by_user.get(entry[0].id)
+            if tokens is not None:
+                tokens.discard(token)
+                if not tokens:
+                    del self._tokens_by_user[entry[0].id]
+
+principal_cache = PrincipalCache(AUTH_CACHE_TTL, AUTH_CACHE_MAX_ENTRIES)
+
+# Publishing happens off the calling thread: invalidations fire inside ORM flushes on the event loop
+_invalidation_publisher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="auth-invalidate")
+_redis_client = None
+
+def _redis():
+    global _redis_client
+    if _redis_client is None:
+        import redis
+        _redis_client = redis.Redis.from_url(REDIS_URL, socket_timeout=5)
+    return _redis_client
+
+def _publish_invalidation(user_id: int):
+    try:
+        _redis().publish(AUTH_CACHE_INVALIDATION_CHANNEL, str(user_id))
+    except Exception as e:
+        logger.error(f"Failed to broadcast auth cache invalidation for user {user_id}; other workers keep it for up to {AUTH_CACHE_TTL}s: {e}")
+
+def invalidate_user_cache(user_id: int):
+    """Drop cached principals for a user in this process and, with Redis configured, in every other worker.
+
+    ORM updates and deletes of User call this automatically. Core update()/delete() statements on users
+    bypass the mapper events and must call it themselves; without Redis, other processes keep the user
+    until AUTH_CACHE_TTL expires.
+    """
+    principal_cache.invalidate_user(user_id)
+    if REDIS_URL:
+        _invalidation_publisher.submit(_publish_invalidation, user_id)
+    logger.debug(f"Invalidated cached principals for user {user_id}.")
+
+def listen_for_invalidations():
+    """Evict users invalidated by other processes; runs forever on a daemon thread (see start_invalidation_listener)."""
+    while True:
+        try:
+            pubsub = _redis().pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(AUTH_CACHE_INVALIDATION_CHANNEL)
+            for message in pubsub.listen():
+                principal_cache.invalidate_user(int(message["data"]))
+        except Exception as e:
+            # Anything cached meanwhile still expires after AUTH_CACHE_TTL
+            logger.error(f"Auth cache invalidation listener failed, reconnecting: {e}")
+            time.sleep(5)
+
+def start_invalidation_listener():
+    """Start the cross-process invalidation listener; call once per worker process, after fork."""
+    if REDIS_URL:
+        threading.Thread(target=listen_for_invalidations, name="auth-invalidation-listener", daemon=True).start()
+
+@event.listens_for(models.User, "after_update")
+@event.listens_for(models.User, "after_delete")
+def _invalidate_user_on_change(mapper, connection, target):
+    invalidate_user_cache(target.id)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)) -> UserPrincipal:
+    cached_principal = principal_cache.get(token)
+    if cached_principal is not None:
+        return cached_principal
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -68,12 +228,17 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
 
     # Retrieve user from database
     try:
-        user = db.query(models.User).filter(models.User.id == user_id_int).first()
+        result = await db.execute(select(models.User).where(models.User.id == user_id_int))
+        user = result.scalars().first()
         if user is None:
             logger.warning(f"User with ID {user_id_int} not found in DB.")
             raise credentials_exception
         logger.debug(f"Retrieved user {user.id} from DB.")
-        return user
+        principal = UserPrincipal(id=user.id, username=user.username)
+        principal_cache.set(token, principal, payload.get("exp"))
+        return principal
+    except HTTPException:
+        raise
     except SQLAlchemyError as e:
          logger.error(f"Database error retrieving user {user_id_int} for authentication: {e}", exc_info=True)
          raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error during authentication.")
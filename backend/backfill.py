@@ -0,0 +1,62 @@
+"""Embed (and index) document chunks stored before chunks had embeddings.
+
+    python -m backend.backfill
+
+Chunks with embedding IS NULL are invisible to vector search. This walks them in id order, fills in
+text_hash and embedding (reusing the embedding cache), and indexes them in Elasticsearch under their
+chunk id so BM25 hits can be fused with vector hits. Safe to interrupt and re-run.
+"""
+import os
+import logging
+from sqlalchemy import select, update
+from .db.database import SessionLocal
+from .db import models
+from .dedup import text_hash
+from .embeddings import encode_batched, load_embedding_model, EMBEDDING_MODEL_NAME
+from .elasticsearch_client import index_document_chunks
+from .ingestion import embed_with_cache
+
+logger = logging.getLogger(__name__)
+
+# Chunks embedded and written per transaction
+BACKFILL_BATCH_SIZE = int(os.getenv("BACKFILL_BATCH_SIZE", 500))
+
+def backfill_embeddings(batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """Embed every chunk without an embedding; returns the number of chunks updated."""
+    model = load_embedding_model(EMBEDDING_MODEL_NAME)
+    last_id = 0
+    total = 0
+    while True:
+        db = SessionLocal()
+        try:
+            rows = db.execute(
+                select(models.DocumentChunk.id, models.DocumentChunk.document_id, models.DocumentChunk.chunk_text, models.Document.owner_id)
+                .join(models.Document, models.Document.id == models.DocumentChunk.document_id)
+                .where(models.DocumentChunk.embedding.is_(None), models.DocumentChunk.id > last_id)
+                .order_by(models.DocumentChunk.id)
+                .limit(batch_size)
+            ).all()
+            if not rows:
+                break
+            embeddings = embed_with_cache(db, [row.chunk_text for row in rows], lambda texts: encode_batched(model, texts))
+            db.execute(update(models.DocumentChunk), [
+                {"id": row.id, "text_hash": text_hash(row.chunk_text), "embedding": embedding}
+                for row, embedding in zip(rows, embeddings)
+            ])
+            db.commit()
+        finally:
+            db.close()
+        by_document = {}
+        for row in rows:
+            by_document.setdefault((row.document_id, row.owner_id), []).append({"chunk_id": row.id, "chunk_text": row.chunk_text})
+        for (document_id, owner_id), chunks in by_document.items():
+            index_document_chunks(document_id, owner_id, chunks)
+        last_id = rows[-1].id
+        total += len(rows)
+        logger.info(f"Backfilled {total} chunk embeddings (last chunk id {last_id}).")
+    return total
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    updated = backfill_embeddings()
+    logger.info(f"Backfill complete: {updated} chunks embedded.")
@@ -0,0 +1,85 @@
+"""Auth-path latency: get_current_user with and without the principal cache, under concurrent load.
+
+    python -m backend.benchmarks.auth_cache [--concurrency 1 16 64] [--requests 5000]
+
+Needs a scratch PostgreSQL database at DATABASE_URL, migrated to head. A throwaway user and token are
+created; each request opens an AsyncSession as the get_db dependency does and calls get_current_user.
+"uncached" runs with the cache capacity set to zero, so each request pays the JWT decode and the user
+lookup as before the cache existed; "cached" serves every call after the first from the cache. The user is
+deleted at the end.
+"""
+import time
+import uuid
+import asyncio
+import argparse
+from typing import List
+from sqlalchemy import delete
+from ..auth import create_access_token, get_current_user, principal_cache
+from ..db import models
+from ..db.database import AsyncSessionLocal, SessionLocal, async_engine
+from .common import percentile, print_table
+
+def create_user() -> int:
+    db = SessionLocal()
+    try:
+        suffix = uuid.uuid4().hex[:12]
+        user = models.User(username=f"benchmark-{suffix}", email=f"benchmark-{suffix}@example.invalid", hashed_password="!")
+        db.add(user)
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+def remove_user(user_id: int):
+    db = SessionLocal()
+    try:
+        db.execute(delete(models.User).where(models.User.id == user_id))
+        db.commit()
+    finally:
+        db.close()
+
+async def authenticate(token: str) -> float:
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        await get_current_user(token, db)
+    return time.perf_counter() - started
+
+async def drive(token: str, concurrency: int, total: int):
+    latencies: List[float] = []
+    remaining = iter(range(total))
+
+    async def caller():
+        for _ in remaining:
+            latencies.append(await authenticate(token))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return total / (time.perf_counter() - started), latencies
+
+async def run(concurrency_levels: List[int], total: int):
+    user_id = create_user()
+    token = create_access_token({"sub": str(user_id)})
+    rows = []
+    max_entries = principal_cache.max_entries
+    try:
+        for cached in (False, True):
+            principal_cache.max_entries = max_entries if cached else 0
+            # Warm the connection pool (and, for the cached run, the cache entry)
+            await drive(token, 4, 50)
+            for concurrency in concurrency_levels:
+                throughput, latencies = await drive(token, concurrency, total)
+                rows.append(["cached" if cached else "uncached", concurrency, throughput,
+                             percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000])
+    finally:
+        principal_cache.max_entries = max_entries
+        await async_engine.dispose()
+        remove_user(user_id)
+    print(f"{total} get_current_user calls per level")
+    print_table(["auth path", "callers", "req/s", "p50 ms", "p99 ms"], rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="get_current_user latency with and without the principal cache.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64], help="concurrent callers per level")
+    parser.add_argument("--requests", type=int, default=5000, help="calls per level")
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.requests))
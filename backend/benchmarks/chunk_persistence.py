@@ -0,0 +1,83 @@
+"""Chunk write throughput: ORM add_all (the old upload path) versus executemany batches versus COPY FROM STDIN.
+
+    python -m backend.benchmarks.chunk_persistence [--sizes 10000 100000]
+
+Needs a scratch PostgreSQL database with pgvector at DATABASE_URL, migrated to head. Every run inserts its
+rows for a throwaway user and document inside one transaction and rolls it back, so nothing is left
+behind. Timings include the HNSW index maintenance PostgreSQL does for each inserted embedding.
+"""
+import time
+import uuid
+import argparse
+from typing import Callable, List
+import numpy as np
+from sqlalchemy.orm import Session
+from ..db import models
+from ..db.bulk import ChunkRow, _copy_insert_chunks, _executemany_insert_chunks
+from ..db.database import SessionLocal
+from ..db.models import EMBEDDING_DIMENSION
+from ..dedup import text_hash
+from .common import load_corpus_chunks, print_table
+
+def sample_rows(count: int, seed: int) -> List[ChunkRow]:
+    rng = np.random.default_rng(seed)
+    texts = [text for _, text in load_corpus_chunks()]
+    embeddings = rng.standard_normal((count, EMBEDDING_DIMENSION)).astype(np.float32)
+    rows = []
+    for i in range(count):
+        chunk_text = f"{texts[i % len(texts)]} ({i})"
+        metadata = {"page": i // 20 + 1, "type": "NarrativeText", "elements": [i], "offsets": [i * 1000, i * 1000 + len(chunk_text)]}
+        rows.append((chunk_text, text_hash(chunk_text), metadata, embeddings[i].tolist()))
+    return rows
+
+def orm_insert_chunks(db: Session, document_id: int, rows: List[ChunkRow]) -> List[int]:
+    chunks = [
+        models.DocumentChunk(document_id=document_id, chunk_text=chunk_text, text_hash=chunk_hash, chunk_metadata=metadata, embedding=embedding)
+        for chunk_text, chunk_hash, metadata, embedding in rows
+    ]
+    db.add_all(chunks)
+    db.flush()
+    return [chunk.id for chunk in chunks]
+
+def timed_insert(insert: Callable[[Session, int, List[ChunkRow]], List[int]], rows: List[ChunkRow]) -> float:
+    db = SessionLocal()
+    try:
+        suffix = uuid.uuid4().hex[:12]
+        user = models.User(username=f"benchmark-{suffix}", email=f"benchmark-{suffix}@example.invalid", hashed_password="!")
+        db.add(user)
+        db.flush()
+        document = models.Document(filename="benchmark.txt", storage_path="", status="indexed", owner_id=user.id)
+        db.add(document)
+        db.flush()
+        started = time.perf_counter()
+        ids = insert(db, document.id, rows)
+        elapsed = time.perf_counter() - started
+        if len(ids) != len(rows):
+            raise RuntimeError(f"{insert.__name__} returned {len(ids)} ids for {len(rows)} rows")
+        return elapsed
+    finally:
+        db.rollback()
+        db.close()
+
+def run(sizes: List[int], seed: int):
+    strategies = [
+        ("orm add_all", orm_insert_chunks),
+        ("executemany", _executemany_insert_chunks),
+        ("copy", _copy_insert_chunks),
+    ]
+    rows = []
+    for size in sizes:
+        sample = sample_rows(size, seed)
+        baseline = None
+        for name, insert in strategies:
+            seconds = timed_insert(insert, sample)
+            baseline = baseline or seconds
+            rows.append([size, name, seconds, size / seconds, baseline / seconds])
+    print_table(["chunks", "strategy", "seconds", "rows/s", "speedup"], rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk chunk persistence against the ORM path.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000], help="chunks written per run")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.sizes, args.seed)
@@ -0,0 +1,56 @@
+"""Chunk count and chunk+embed time: the old per-element splitter versus the structure-aware chunker.
+
+    python -m backend.benchmarks.chunking_report [--corpus DIR] [--repeats 3]
+
+The old upload path ran RecursiveCharacterTextSplitter (1000 characters, 200 overlap) on every parsed
+element separately, so each title and one-line paragraph became a chunk of its own; chunk_elements
+merges consecutive elements of a section up to CHUNK_TARGET_TOKENS first. Both run on the same parsed
+elements of the fixture corpus, and every resulting chunk is embedded with EMBEDDING_MODEL.
+"""
+import time
+import argparse
+from typing import Callable, Dict, List
+from ..chunking import CHUNK_TARGET_TOKENS, chunk_elements
+from ..embeddings import EMBEDDING_MODEL_NAME, encode_batched, load_embedding_model
+from .common import CORPUS_DIR, Element, load_corpus_elements, print_table
+
+def per_element_chunks(elements: List[Element]) -> List[str]:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, length_function=len)
+    return [piece.page_content for text, _ in elements for piece in splitter.create_documents([text])]
+
+def structured_chunks(elements: List[Element]) -> List[str]:
+    return [text for text, _ in chunk_elements(elements)]
+
+def ingest(chunker: Callable[[List[Element]], List[str]], documents: Dict[str, List[Element]], model):
+    """Chunk and embed every document; returns (chunk count, total characters, seconds)."""
+    started = time.perf_counter()
+    count = characters = 0
+    for elements in documents.values():
+        texts = chunker(elements)
+        encode_batched(model, texts)
+        count += len(texts)
+        characters += sum(len(text) for text in texts)
+    return count, characters, time.perf_counter() - started
+
+def run(corpus_dir: str, repeats: int):
+    documents = load_corpus_elements(corpus_dir)
+    element_count = sum(len(elements) for elements in documents.values())
+    model = load_embedding_model(EMBEDDING_MODEL_NAME)
+    encode_batched(model, ["warm up"])
+    rows = []
+    baseline = None
+    for name, chunker in (("per-element splitter", per_element_chunks), (f"chunk_elements ({CHUNK_TARGET_TOKENS} tokens)", structured_chunks)):
+        count, characters, _ = ingest(chunker, documents, model)
+        seconds = min(ingest(chunker, documents, model)[2] for _ in range(repeats))
+        baseline = baseline or (count, seconds)
+        rows.append([name, count, characters // max(count, 1), 1 - count / baseline[0], seconds * 1000, 1 - seconds / baseline[1]])
+    print(f"{len(documents)} documents, {element_count} parsed elements from {corpus_dir}, model {EMBEDDING_MODEL_NAME}, best of {repeats}")
+    print_table(["chunker", "chunks", "avg chars", "chunk reduction", "chunk+embed ms", "time reduction"], rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Chunk count and ingest time of the old and new chunkers.")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="directory of .md documents")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per chunker; the fastest is reported")
+    args = parser.parse_args()
+    run(args.corpus, args.repeats)
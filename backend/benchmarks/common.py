@@ -0,0 +1,48 @@
+import os
+import json
+import math
+from typing import Dict, List, Sequence, Tuple
+from ..parsers import parse_markdown
+from ..chunking import chunk_elements
+
+# Small markdown corpus and question set shared by the offline benchmarks
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+CORPUS_DIR = os.path.join(FIXTURES_DIR, "corpus")
+QUERIES_PATH = os.path.join(FIXTURES_DIR, "queries.json")
+
+Element = Tuple[str, dict] # (element_text, element_metadata)
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of values (pct in 0-100); 0.0 for an empty sequence."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def corpus_paths(corpus_dir: str = CORPUS_DIR) -> List[str]:
+    return sorted(os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir) if name.endswith(".md"))
+
+def load_corpus_elements(corpus_dir: str = CORPUS_DIR) -> Dict[str, List[Element]]:
+    """Parsed elements of every fixture document, keyed by file name."""
+    return {os.path.basename(path): parse_markdown(path) for path in corpus_paths(corpus_dir)}
+
+def load_corpus_chunks(corpus_dir: str = CORPUS_DIR) -> List[Tuple[str, str]]:
+    """(file name, chunk text) for every chunk of the fixture corpus, chunked the way ingestion does."""
+    chunks = []
+    for name, elements in load_corpus_elements(corpus_dir).items():
+        chunks.extend((name, text) for text, _ in chunk_elements(elements))
+    return chunks
+
+def load_queries(path: str = QUERIES_PATH) -> List[dict]:
+    """Questions with the exact "answer" substring a relevant chunk must contain."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def print_table(headers: Sequence[str], rows: Sequence[Sequence]):
+    """Print rows as a fixed-width table; floats are shown with three decimals."""
+    cells = [[f"{value:.3f}" if isinstance(value, float) else str(value) for value in row] for row in rows]
+    widths = [max(len(header), *(len(row[i]) for row in cells)) if cells else len(header) for i, header in enumerate(headers)]
+    print("  ".join(header.rjust(width) for header, width in zip(headers, widths)))
+    for row in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
@@ -0,0 +1,96 @@
+"""Prompt size and LLM latency: joining chunks into the prompt versus token-budgeted context assembly.
+
+    python -m backend.benchmarks.context_assembly [--library-copies 1] [--corpus DIR --queries FILE]
+
+For every fixture question three prompts are built: the original one joining every chunk the user owns,
+one joining all retrieved candidates (retrieval without assembly), and the current one from assemble_context.
+Candidates are ranked in process like hybrid retrieval (BM25 and vector fused with reciprocal rank fusion),
+so no PostgreSQL or Elasticsearch is needed. --library-copies stores the corpus several times as separate
+documents, to see how each prompt grows with the size of a user's library.
+
+Each prompt is sent to the configured LLM (LLM_BACKEND). With LLM_BACKEND=fake, set FAKE_LLM_PROMPT_WORD_DELAY
+(and FAKE_LLM_TOKEN_DELAY) to give the stub a prompt-proportional latency. "answer in prompt" is the share of
+questions whose answer string survives in the prompt, so a smaller prompt is not bought with lost context.
+"""
+import time
+import argparse
+from typing import Dict, List
+import numpy as np
+from ..chunking import chunk_elements
+from ..context import CONTEXT_CANDIDATES, CONTEXT_TOKEN_BUDGET, assemble_context, build_prompt, estimate_tokens
+from ..db import models
+from ..dedup import text_hash
+from ..embeddings import EMBEDDING_MODEL_NAME, encode_batched, load_embedding_model
+from ..llm import create_llm
+from ..retrieval import RETRIEVAL_CANDIDATES, reciprocal_rank_fusion
+from .common import CORPUS_DIR, QUERIES_PATH, load_corpus_elements, load_queries, percentile, print_table
+from .retrieval_eval import BM25, normalize
+
+def original_prompt(question: str, context_text: str) -> str:
+    # The prompt query_documents built before retrieval and context assembly
+    return f"You are an assistant for question-answering tasks. Use the following context to answer the question. If you don't know the answer, say so.\n\nContext:\n{context_text}\n\nQuestion: {question}\n\nAnswer:"
+
+def load_library(corpus_dir: str, copies: int, model):
+    """In-memory (unsaved) DocumentChunk rows of the corpus stored copies times, and their document filenames."""
+    chunks: List[models.DocumentChunk] = []
+    filenames: Dict[int, str] = {}
+    parsed = [(name, chunk_elements(elements)) for name, elements in load_corpus_elements(corpus_dir).items()]
+    embedding_rows = normalize(encode_batched(model, [text for _, pieces in parsed for text, _ in pieces]))
+    for copy in range(copies):
+        row = 0
+        for name, pieces in parsed:
+            document_id = len(filenames) + 1
+            filenames[document_id] = name if copy == 0 else f"copy{copy}-{name}"
+            for text, metadata in pieces:
+                chunks.append(models.DocumentChunk(
+                    id=len(chunks) + 1, document_id=document_id, chunk_text=text, text_hash=text_hash(text),
+                    chunk_metadata=metadata, embedding=embedding_rows[row].tolist(),
+                ))
+                row += 1
+    return chunks, filenames
+
+def run(corpus_dir: str, queries_path: str, copies: int):
+    llm = create_llm()
+    if llm is None:
+        raise SystemExit("No LLM available: set GEMINI_API_KEY, or LLM_BACKEND=fake")
+    model = load_embedding_model(EMBEDDING_MODEL_NAME)
+    chunks, filenames = load_library(corpus_dir, copies, model)
+    vectors = np.array([chunk.embedding for chunk in chunks], dtype=np.float32)
+    bm25 = BM25([chunk.chunk_text for chunk in chunks])
+    queries = load_queries(queries_path)
+    everything = "\n".join(chunk.chunk_text for chunk in chunks)
+
+    results = {name: {"tokens": [], "latency": [], "answered": 0} for name in ("join all chunks", "join retrieved", "assemble_context")}
+    for query in queries:
+        question = query["query"]
+        query_embedding = normalize(encode_batched(model, [question]))[0]
+        vector_ranking = [int(i) for i in np.argsort(-(vectors @ query_embedding))[:RETRIEVAL_CANDIDATES]]
+        fused = reciprocal_rank_fusion([bm25.rank(question, RETRIEVAL_CANDIDATES), vector_ranking])[:CONTEXT_CANDIDATES]
+        retrieved = [(chunks[i], score) for i, score in fused]
+        prompts = {
+            "join all chunks": original_prompt(question, everything),
+            "join retrieved": original_prompt(question, "\n".join(chunk.chunk_text for chunk, _ in retrieved)),
+            "assemble_context": build_prompt(question, assemble_context(query_embedding.tolist(), retrieved, filenames).text),
+        }
+        for name, prompt in prompts.items():
+            started = time.perf_counter()
+            llm.generate(prompt)
+            results[name]["latency"].append(time.perf_counter() - started)
+            results[name]["tokens"].append(estimate_tokens(prompt))
+            results[name]["answered"] += query["answer"] in prompt
+
+    print(f"{len(chunks)} chunks in {len(filenames)} documents, {len(queries)} questions, LLM {llm.model_name}, "
+          f"{CONTEXT_CANDIDATES} candidates, budget {CONTEXT_TOKEN_BUDGET} tokens")
+    print_table(["prompt", "avg tokens", "max tokens", "answer in prompt", "llm p50 ms", "llm p99 ms"], [
+        [name, sum(result["tokens"]) // len(queries), max(result["tokens"]), result["answered"] / len(queries),
+         percentile(result["latency"], 50) * 1000, percentile(result["latency"], 99) * 1000]
+        for name, result in results.items()
+    ])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prompt tokens and LLM latency with and without context assembly.")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="directory of .md documents")
+    parser.add_argument("--queries", default=QUERIES_PATH, help='JSON list of {"query", "answer"} objects')
+    parser.add_argument("--library-copies", type=int, default=1, help="times the corpus is stored, as separate documents")
+    args = parser.parse_args()
+    run(args.corpus, args.queries, args.library_copies)
@@ -0,0 +1,49 @@
+"""CPU microbenchmark: chunks/sec for one encode() call per chunk versus batched encoding.
+
+    python -m backend.benchmarks.embedding_throughput [--chunks 512] [--batch-sizes 8 32 64 128]
+
+Texts are the fixture corpus chunks, repeated up to --chunks. CUDA is hidden from the process so both
+strategies run on CPU; the model is EMBEDDING_MODEL, so onnx:/onnx-int8: names are measured too.
+"""
+import os
+import time
+import argparse
+from typing import Callable, List
+from ..embeddings import EMBEDDING_BATCH_SIZE, EMBEDDING_MODEL_NAME, encode_batched, load_embedding_model
+from .common import load_corpus_chunks, print_table
+
+def sample_texts(count: int) -> List[str]:
+    texts = [text for _, text in load_corpus_chunks()]
+    return [texts[i % len(texts)] for i in range(count)]
+
+def chunks_per_second(encode: Callable[[List[str]], object], texts: List[str], repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        encode(texts)
+        best = min(best, time.perf_counter() - started)
+    return len(texts) / best
+
+def run(chunk_count: int, batch_sizes: List[int], repeats: int):
+    model = load_embedding_model(EMBEDDING_MODEL_NAME)
+    texts = sample_texts(chunk_count)
+    # Warm up, so neither strategy pays for lazy initialisation
+    encode_batched(model, texts[:8])
+
+    per_chunk = chunks_per_second(lambda batch: [model.encode(text) for text in batch], texts, repeats)
+    rows = [["per-chunk", "1", per_chunk, 1.0]]
+    for batch_size in batch_sizes:
+        rate = chunks_per_second(lambda batch: encode_batched(model, batch, batch_size), texts, repeats)
+        rows.append(["batched", str(batch_size), rate, rate / per_chunk])
+    print(f"{len(texts)} chunks, model {EMBEDDING_MODEL_NAME}, CPU, best of {repeats}")
+    print_table(["strategy", "batch", "chunks/s", "speedup"], rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-chunk vs batched embedding throughput on CPU.")
+    parser.add_argument("--chunks", type=int, default=512, help="number of chunks encoded per run")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=sorted({8, 32, EMBEDDING_BATCH_SIZE, 128}))
+    parser.add_argument("--repeats", type=int, default=3, help="runs per strategy; the fastest is reported")
+    args = parser.parse_args()
+    # Must happen before torch is imported (load_embedding_model imports it lazily)
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+    run(args.chunks, args.batch_sizes, args.repeats)
@@ -0,0 +1,81 @@
+"""/health latency while a storm of logins runs against a live API.
+
+    python -m backend.benchmarks.login_storm [--url http://localhost:8000] [--concurrency 32] [--duration 20]
+
+Registers a throwaway user (benchmark-<random>@example.invalid), then probes /health one request at a
+time, first on an idle server and then while --concurrency clients log in back to back. With bcrypt on
+the event loop the probe waits behind every hash; with the password executor it stays flat and excess
+logins are answered 429. Point it at a single worker (uvicorn, or gunicorn -w 1) for a clean signal.
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from .common import percentile, print_table
+
+def request(url: str, payload: Optional[dict] = None, timeout: float = 30) -> int:
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"} if data else {})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def probe(base_url: str, duration: float, interval: float) -> List[float]:
+    latencies = []
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        request(f"{base_url}/health")
+        latencies.append(time.perf_counter() - started)
+        time.sleep(interval)
+    return latencies
+
+def login_loop(base_url: str, credentials: dict, stop: threading.Event, outcomes: Counter, lock: threading.Lock):
+    while not stop.is_set():
+        code = request(f"{base_url}/auth/login", credentials)
+        with lock:
+            outcomes[code] += 1
+
+def run(base_url: str, concurrency: int, duration: float, interval: float):
+    suffix = uuid.uuid4().hex[:12]
+    credentials = {"email": f"benchmark-{suffix}@example.invalid", "password": uuid.uuid4().hex}
+    code = request(f"{base_url}/auth/register", {"username": f"benchmark-{suffix}", **credentials})
+    if code != 201:
+        raise SystemExit(f"registration failed with HTTP {code}")
+
+    idle = probe(base_url, duration, interval)
+
+    stop = threading.Event()
+    outcomes: Counter = Counter()
+    lock = threading.Lock()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for _ in range(concurrency):
+            executor.submit(login_loop, base_url, credentials, stop, outcomes, lock)
+        try:
+            storm = probe(base_url, duration, interval)
+        finally:
+            stop.set()
+
+    print(f"{base_url}: {concurrency} concurrent logins for {duration:.0f}s; login responses {dict(sorted(outcomes.items()))}")
+    print_table(["phase", "probes", "/health p50 ms", "/health p99 ms", "max ms"], [
+        [name, len(latencies), percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000, max(latencies, default=0.0) * 1000]
+        for name, latencies in (("idle", idle), ("login storm", storm))
+    ])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/health latency during a login storm.")
+    parser.add_argument("--url", default="http://localhost:8000", help="base URL of a running API")
+    parser.add_argument("--concurrency", type=int, default=32, help="clients logging in back to back")
+    parser.add_argument("--duration", type=float, default=20, help="seconds per phase")
+    parser.add_argument("--interval", type=float, default=0.05, help="pause between /health probes")
+    args = parser.parse_args()
+    run(args.url.rstrip("/"), args.concurrency, args.duration, args.interval)
@@ -0,0 +1,77 @@
+"""Per-chunk storage bytes of chunk metadata and the Elasticsearch _source, before and after compaction.
+
+    python -m backend.benchmarks.metadata_size [FILE ...]
+
+Without arguments the fixture corpus is measured. Pass real documents (PDF, DOCX, ...) to parse them with
+unstructured, whose element metadata is far larger than the markdown parser's. The old format is the
+chunk's element metadata plus filename, local_path, document_db_id and owner_id, stored in PostgreSQL and
+copied into _source next to the ids and the embedding; the new format is schemas.ChunkMetadata in
+PostgreSQL and owner_id, document_db_id and chunk_text in _source. Sizes are serialized JSON bytes; the
+embedding is a random unit vector of the model's dimension, which serializes like a real one.
+"""
+import os
+import json
+import argparse
+from typing import Dict, List
+import numpy as np
+from ..chunking import chunk_elements
+from ..db.models import EMBEDDING_DIMENSION
+from ..parsers import DocumentParser
+from ..storage import LOCAL_STORAGE_DIR
+from .common import Element, corpus_paths, print_table
+
+# Stand-ins for the ids stored with every chunk
+OWNER_ID = 1042
+DOCUMENT_ID = 73512
+
+def json_bytes(value, **kwargs) -> int:
+    return len(json.dumps(value, ensure_ascii=False, **kwargs).encode("utf-8"))
+
+def measure(filename: str, elements: List[Element], rng: np.random.Generator) -> Dict[str, int]:
+    totals = {"chunks": 0, "old metadata": 0, "new metadata": 0, "old _source": 0, "new _source": 0}
+    for chunk_id, (chunk_text, metadata) in enumerate(chunk_elements(elements), start=1):
+        first_element = metadata.get("elements", [0])[0]
+        old_metadata = dict(elements[first_element][1])
+        # unstructured reported file_directory too; the parser now drops it so parse output can be shared
+        old_metadata.update({
+            "file_directory": os.path.join(LOCAL_STORAGE_DIR, str(OWNER_ID)),
+            "filename": filename,
+            "local_path": os.path.join(LOCAL_STORAGE_DIR, str(OWNER_ID), filename),
+            "document_db_id": DOCUMENT_ID,
+            "owner_id": OWNER_ID,
+        })
+        embedding = rng.standard_normal(EMBEDDING_DIMENSION)
+        embedding = (embedding / np.linalg.norm(embedding)).astype(np.float32).tolist()
+        old_source = {"document_id": DOCUMENT_ID, "chunk_id": chunk_id, "owner_id": OWNER_ID, "document_db_id": DOCUMENT_ID,
+                      "chunk_text": chunk_text, "embedding": embedding, "metadata": old_metadata}
+        new_source = {"owner_id": OWNER_ID, "document_db_id": DOCUMENT_ID, "chunk_text": chunk_text}
+        totals["chunks"] += 1
+        # The old path stored json.dumps(metadata, default=str); the new one writes compact JSON into jsonb
+        totals["old metadata"] += json_bytes(old_metadata, default=str)
+        totals["new metadata"] += json_bytes(metadata, separators=(",", ":"))
+        totals["old _source"] += json_bytes(old_source, separators=(",", ":"), default=str)
+        totals["new _source"] += json_bytes(new_source, separators=(",", ":"))
+    return totals
+
+def run(paths: List[str]):
+    parser = DocumentParser(num_processes=0)
+    rng = np.random.default_rng(0)
+    rows = []
+    overall = None
+    for path in paths:
+        totals = measure(os.path.basename(path), parser.parse(path, None), rng)
+        overall = totals if overall is None else {key: overall[key] + value for key, value in totals.items()}
+        rows.append([os.path.basename(path), totals])
+    rows.append(["all", overall])
+    print_table(["document", "chunks", "old metadata B", "new metadata B", "old _source B", "new _source B", "metadata saved", "_source saved"], [
+        [name, totals["chunks"],
+         *(totals[key] // max(totals["chunks"], 1) for key in ("old metadata", "new metadata", "old _source", "new _source")),
+         1 - totals["new metadata"] / max(totals["old metadata"], 1), 1 - totals["new _source"] / max(totals["old _source"], 1)]
+        for name, totals in rows
+    ])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-chunk metadata and _source bytes, old vs new format.")
+    parser.add_argument("paths", nargs="*", help="documents to measure (default: the fixture corpus)")
+    args = parser.parse_args()
+    run(args.paths or corpus_paths())
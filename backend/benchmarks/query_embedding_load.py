@@ -0,0 +1,59 @@
+"""Query-embedding throughput and p50/p99 latency at 1, 16 and 64 concurrent callers.
+
+    python -m backend.benchmarks.query_embedding_load [--concurrency 1 16 64] [--requests 2000]
+
+Compares MicroBatchEmbedder (the query path) with each caller encoding its own text in a worker thread,
+which is what every request did before. Questions come from the fixture query set. The model is
+EMBEDDING_MODEL, so onnx:/onnx-int8: backends are measured by setting it; batching is tuned with
+EMBEDDING_MAX_BATCH and EMBEDDING_MAX_WAIT_MS as in the API.
+"""
+import time
+import asyncio
+import argparse
+from typing import Awaitable, Callable, List
+from ..embedding_service import EMBEDDING_MAX_BATCH, EMBEDDING_MAX_WAIT_MS, MicroBatchEmbedder
+from ..embeddings import EMBEDDING_MODEL_NAME, load_embedding_model
+from .common import load_queries, percentile, print_table
+
+async def drive(encode: Callable[[str], Awaitable], questions: List[str], concurrency: int, total: int):
+    """Run total encodes from concurrency callers; returns (requests per second, per-request latencies)."""
+    latencies: List[float] = []
+    remaining = iter(range(total))
+
+    async def caller():
+        for i in remaining:
+            started = time.perf_counter()
+            await encode(questions[i % len(questions)])
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(caller() for _ in range(concurrency)))
+    return total / (time.perf_counter() - started), latencies
+
+async def run(concurrency_levels: List[int], total: int):
+    model = load_embedding_model(EMBEDDING_MODEL_NAME)
+    questions = [query["query"] for query in load_queries()]
+    embedder = MicroBatchEmbedder(model)
+    strategies = {
+        "direct (thread per call)": lambda question: asyncio.to_thread(model.encode, question),
+        "micro-batched": embedder.encode,
+    }
+    rows = []
+    try:
+        for name, encode in strategies.items():
+            # Warm up, so lazy initialisation is not charged to the first level measured
+            await drive(encode, questions, 4, 16)
+            for concurrency in concurrency_levels:
+                throughput, latencies = await drive(encode, questions, concurrency, total)
+                rows.append([name, concurrency, throughput, percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000])
+    finally:
+        embedder.stop()
+    print(f"model {EMBEDDING_MODEL_NAME}, {total} requests per level, max batch {EMBEDDING_MAX_BATCH}, max wait {EMBEDDING_MAX_WAIT_MS:g} ms")
+    print_table(["strategy", "callers", "req/s", "p50 ms", "p99 ms"], rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent query-embedding throughput and latency.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64], help="concurrent callers per level")
+    parser.add_argument("--requests", type=int, default=2000, help="encode requests per level")
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.requests))
@@ -0,0 +1,116 @@
+"""Offline recall@k / latency evaluation of BM25, vector and hybrid (RRF) retrieval.
+
+    python -m backend.benchmarks.retrieval_eval [--rrf-k 60 ...] [--candidates 50] [--corpus DIR --queries FILE]
+
+Runs entirely in process, without PostgreSQL or Elasticsearch: the fixture corpus is parsed and chunked
+the way ingestion does, BM25 is scored with Okapi BM25 (the Elasticsearch default similarity), vector
+ranking uses the configured EMBEDDING_MODEL with cosine similarity, and hybrid ranking fuses both with
+retrieval.reciprocal_rank_fusion. A chunk is relevant to a question when it contains the question's
+"answer" string; recall@k is the share of questions with a relevant chunk in the top k.
+"""
+import re
+import math
+import time
+import argparse
+from collections import Counter
+from typing import Dict, List
+import numpy as np
+from ..embeddings import encode_batched, load_embedding_model, EMBEDDING_MODEL_NAME
+from ..retrieval import reciprocal_rank_fusion, RETRIEVAL_CANDIDATES, RRF_K
+from .common import CORPUS_DIR, QUERIES_PATH, load_corpus_chunks, load_queries, percentile, print_table
+
+CUTOFFS = (1, 5, 10)
+_TOKEN = re.compile(r"\w+")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+class BM25:
+    """Okapi BM25 over an in-memory list of texts, with Elasticsearch's default k1 and b."""
+
+    def __init__(self, texts: List[str], k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.term_counts = [Counter(tokenize(text)) for text in texts]
+        self.lengths = [sum(counts.values()) for counts in self.term_counts]
+        self.average_length = sum(self.lengths) / max(len(self.lengths), 1)
+        document_frequency = Counter(term for counts in self.term_counts for term in counts)
+        total = len(texts)
+        self.idf = {term: math.log(1 + (total - df + 0.5) / (df + 0.5)) for term, df in document_frequency.items()}
+
+    def rank(self, query: str, limit: int) -> List[int]:
+        terms = [term for term in set(tokenize(query)) if term in self.idf]
+        scores: Dict[int, float] = {}
+        for index, counts in enumerate(self.term_counts):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[index] / self.average_length)
+            for term in terms:
+                tf = counts.get(term)
+                if tf:
+                    score += self.idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            if score > 0:
+                scores[index] = score
+        return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def evaluate(corpus_dir: str, queries_path: str, rrf_ks: List[int], candidates: int):
+    chunks = load_corpus_chunks(corpus_dir)
+    texts = [text for _, text in chunks]
+    queries = load_queries(queries_path)
+    relevant = [{i for i, text in enumerate(texts) if query["answer"] in text} for query in queries]
+    for query, hits in zip(queries, relevant):
+        if not hits:
+            print(f"warning: no chunk contains the answer to {query['query']!r}; it counts as a miss")
+
+    model = load_embedding_model(EMBEDDING_MODEL_NAME)
+    chunk_vectors = normalize(encode_batched(model, texts))
+    bm25 = BM25(texts)
+    # Warm up the model so the first query does not carry one-off initialisation in its latency
+    encode_batched(model, [queries[0]["query"]])
+
+    rankings: Dict[str, List[List[int]]] = {"bm25": [], "vector": []}
+    latencies: Dict[str, List[float]] = {"bm25": [], "vector": []}
+    for query in queries:
+        started = time.perf_counter()
+        rankings["bm25"].append(bm25.rank(query["query"], candidates))
+        bm25_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        query_vector = normalize(encode_batched(model, [query["query"]]))[0]
+        similarities = chunk_vectors @ query_vector
+        rankings["vector"].append([int(i) for i in np.argsort(-similarities)[:candidates]])
+        vector_seconds = time.perf_counter() - started
+
+        latencies["bm25"].append(bm25_seconds)
+        latencies["vector"].append(vector_seconds)
+
+    # Hybrid latency is both retrievals (run sequentially here) plus the fusion itself
+    for k in rrf_ks:
+        name = f"hybrid k={k}"
+        rankings[name], latencies[name] = [], []
+        for i in range(len(queries)):
+            started = time.perf_counter()
+            fused = [item_id for item_id, _ in reciprocal_rank_fusion([rankings["bm25"][i], rankings["vector"][i]], k=k)]
+            rankings[name].append(fused)
+            latencies[name].append(latencies["bm25"][i] + latencies["vector"][i] + time.perf_counter() - started)
+
+    print(f"{len(chunks)} chunks from {corpus_dir}, {len(queries)} questions, model {EMBEDDING_MODEL_NAME}, {candidates} candidates per ranking")
+    rows = []
+    for name, ranked in rankings.items():
+        recalls = [sum(1 for ids, hits in zip(ranked, relevant) if hits & set(ids[:cutoff])) / len(queries) for cutoff in CUTOFFS]
+        reciprocal_ranks = [next((1 / rank for rank, item_id in enumerate(ids, start=1) if item_id in hits), 0.0) for ids, hits in zip(ranked, relevant)]
+        rows.append([name, *recalls, sum(reciprocal_ranks) / len(queries),
+                     percentile(latencies[name], 50) * 1000, percentile(latencies[name], 99) * 1000])
+    print_table(["ranking", *(f"recall@{cutoff}" for cutoff in CUTOFFS), "mrr", "p50 ms", "p99 ms"], rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline retrieval quality and latency on a fixture corpus.")
+    parser.add_argument("--corpus", default=CORPUS_DIR, help="directory of .md documents")
+    parser.add_argument("--queries", default=QUERIES_PATH, help='JSON list of {"query", "answer"} objects')
+    parser.add_argument("--rrf-k", type=int, nargs="+", default=[RRF_K], help="reciprocal rank fusion constants to compare")
+    parser.add_argument("--candidates", type=int, default=RETRIEVAL_CANDIDATES, help="candidates taken from each ranking before fusion")
+    args = parser.parse_args()
+    evaluate(args.corpus, args.queries, args.rrf_k, args.candidates)
@@ -0,0 +1,73 @@
+"""Cold start: import time of backend.main, and time until /health and /ready answer 200.
+
+    python -m backend.benchmarks.startup_time [--runs 3] [--port 8765]
+
+Each run uses a fresh interpreter: one imports backend.main and reports the elapsed time, then uvicorn
+serves backend.main:app and the probes are polled until they succeed. Needs the same environment as the
+API itself (DATABASE_URL, Elasticsearch); run with RUN_MIGRATIONS=false to leave migrations out of the figure.
+"""
+import sys
+import time
+import argparse
+import subprocess
+import urllib.error
+import urllib.request
+from .common import percentile, print_table
+
+IMPORT_SNIPPET = "import time; started = time.perf_counter(); import backend.main; print(time.perf_counter() - started)"
+
+def import_seconds() -> float:
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], check=True, capture_output=True, text=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+def answers(url: str) -> bool:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status == 200
+    except (urllib.error.URLError, OSError):
+        return False
+
+def time_to_probes(port: int, timeout: float):
+    base_url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.main:app", "--port", str(port), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    healthy = ready = None
+    try:
+        while ready is None and time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise SystemExit(f"uvicorn exited with code {server.returncode}")
+            if healthy is None and answers(f"{base_url}/health"):
+                healthy = time.perf_counter() - started
+            if healthy is not None and answers(f"{base_url}/ready"):
+                ready = time.perf_counter() - started
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+    if ready is None:
+        raise SystemExit(f"/ready did not answer 200 within {timeout:.0f}s")
+    return healthy, ready
+
+def run(runs: int, port: int, timeout: float):
+    imports, healthy, ready = [], [], []
+    for _ in range(runs):
+        imports.append(import_seconds())
+        to_healthy, to_ready = time_to_probes(port, timeout)
+        healthy.append(to_healthy)
+        ready.append(to_ready)
+    print(f"{runs} cold starts")
+    print_table(["measure", "p50 s", "max s"], [
+        [name, percentile(values, 50), max(values)]
+        for name, values in (("import backend.main", imports), ("until /health 200", healthy), ("until /ready 200", ready))
+    ])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time and time-to-ready of the API.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--port", type=int, default=8765, help="free port for the temporary server")
+    parser.add_argument("--timeout", type=float, default=300, help="seconds to wait for /ready per run")
+    args = parser.parse_args()
+    run(args.runs, args.port, args.timeout)
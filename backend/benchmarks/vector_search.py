@@ -0,0 +1,159 @@
+"""Top-k vector query latency, hit count and recall per tenant as the chunk table grows (1k -> 100k by default).
+
+    python -m backend.benchmarks.vector_search [--sizes 1000 10000 100000 1000000] [--tenants 100] [--index-only]
+
+Needs a scratch PostgreSQL database with pgvector at DATABASE_URL, migrated to head (python -m backend.migrate).
+Throwaway users are created and the table is grown to each size with random unit vectors through the
+ingestion bulk insert path, spread over --tenants owners with Zipf-like shares, so the HNSW index holds
+mostly other owners' chunks. The largest, a median and the smallest tenant are queried through the API's
+async session; recall@k is measured against an exact ranking of that tenant's vectors. --index-only skips
+the iterative scan and the exact fallback, which shows how a post-filtered HNSW scan starves small tenants.
+Everything created is removed at the end.
+"""
+import time
+import uuid
+import asyncio
+import argparse
+from typing import Dict, List, Tuple
+import numpy as np
+from sqlalchemy import delete, text
+from ..db import models
+from ..db.bulk import bulk_insert_chunks
+from ..db.database import AsyncSessionLocal, SessionLocal, async_engine
+from ..db.models import EMBEDDING_DIMENSION
+from ..retrieval import HNSW_EF_SEARCH, RETRIEVAL_TOP_K, _nearest_chunks, retrieve_relevant_chunks
+from .common import percentile, print_table
+
+# Rows generated per transaction while growing the table
+INSERT_BATCH = 10000
+
+class Tenant:
+    def __init__(self, label: str, user_id: int, document_id: int):
+        self.label = label
+        self.user_id = user_id
+        self.document_id = document_id
+        self.chunk_ids: List[int] = []
+        self.vectors: List[np.ndarray] = []
+
+def random_unit_vectors(rng: np.random.Generator, count: int) -> np.ndarray:
+    vectors = rng.standard_normal((count, EMBEDDING_DIMENSION)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def create_owners(count: int) -> List[Tuple[int, int]]:
+    db = SessionLocal()
+    try:
+        owners = []
+        for _ in range(count):
+            suffix = uuid.uuid4().hex[:12]
+            user = models.User(username=f"benchmark-{suffix}", email=f"benchmark-{suffix}@example.invalid", hashed_password="!")
+            db.add(user)
+            db.flush()
+            document = models.Document(filename="benchmark.txt", storage_path="", status="indexed", owner_id=user.id)
+            db.add(document)
+            db.flush()
+            owners.append((user.id, document.id))
+        db.commit()
+        return owners
+    finally:
+        db.close()
+
+def grow(owners: List[Tuple[int, int]], shares: np.ndarray, probes: Dict[int, Tenant], start: int, stop: int, rng: np.random.Generator):
+    db = SessionLocal()
+    try:
+        for offset in range(start, stop, INSERT_BATCH):
+            count = min(INSERT_BATCH, stop - offset)
+            vectors = random_unit_vectors(rng, count)
+            assignment = rng.choice(len(owners), size=count, p=shares)
+            for owner_index in np.unique(assignment):
+                owner_vectors = vectors[assignment == owner_index]
+                rows = [(f"benchmark chunk {offset}-{i}", None, None, vector) for i, vector in enumerate(owner_vectors)]
+                ids = bulk_insert_chunks(db, owners[owner_index][1], rows)
+                if owner_index in probes:
+                    probes[owner_index].chunk_ids.extend(ids)
+                    probes[owner_index].vectors.extend(owner_vectors)
+            db.commit()
+        # Fresh statistics, as autovacuum would eventually provide, so the planner sees the real row counts
+        db.execute(text("ANALYZE document_chunks"))
+        db.commit()
+    finally:
+        db.close()
+
+def remove_owners(owners: List[Tuple[int, int]]):
+    user_ids = [user_id for user_id, _ in owners]
+    document_ids = [document_id for _, document_id in owners]
+    db = SessionLocal()
+    try:
+        db.execute(delete(models.DocumentChunk).where(models.DocumentChunk.document_id.in_(document_ids)))
+        db.execute(delete(models.Document).where(models.Document.id.in_(document_ids)))
+        db.execute(delete(models.User).where(models.User.id.in_(user_ids)))
+        db.commit()
+    finally:
+        db.close()
+
+async def search(owner_id: int, query: np.ndarray, top_k: int, index_only: bool) -> List[int]:
+    async with AsyncSessionLocal() as db:
+        if index_only:
+            # What retrieval did before iterative scans: filter the first ef_search neighbours of the whole table
+            await db.execute(text(f"SET LOCAL hnsw.ef_search = {int(max(HNSW_EF_SEARCH, top_k))}"))
+            hits = await _nearest_chunks(db, owner_id, query.tolist(), top_k, exact=False)
+        else:
+            hits = await retrieve_relevant_chunks(db, owner_id, query.tolist(), top_k=top_k)
+    return [chunk.id for chunk, _ in hits]
+
+async def measure(tenant: Tenant, queries: np.ndarray, top_k: int, index_only: bool):
+    """Per-query latencies, hit counts and recall@k of one tenant."""
+    vectors = np.stack(tenant.vectors) if tenant.vectors else np.empty((0, EMBEDDING_DIMENSION), dtype=np.float32)
+    latencies, hits, recalls = [], [], []
+    try:
+        # Warm the connection pool and the index pages before timing
+        for query in queries[:10]:
+            await search(tenant.user_id, query, top_k, index_only)
+        for query in queries:
+            started = time.perf_counter()
+            found = await search(tenant.user_id, query, top_k, index_only)
+            latencies.append(time.perf_counter() - started)
+            truth = {tenant.chunk_ids[i] for i in np.argsort(-(vectors @ query))[:top_k]}
+            hits.append(len(found))
+            recalls.append(len(truth & set(found)) / len(truth) if truth else 1.0)
+    finally:
+        await async_engine.dispose()
+    return latencies, hits, recalls
+
+def run(sizes: List[int], tenant_count: int, query_count: int, top_k: int, index_only: bool, seed: int):
+    rng = np.random.default_rng(seed)
+    queries = random_unit_vectors(rng, query_count)
+    # Zipf-like shares: tenant i owns a share proportional to 1 / (i + 1)
+    shares = 1.0 / np.arange(1, tenant_count + 1)
+    shares /= shares.sum()
+    owners = create_owners(tenant_count)
+    probes = {
+        index: Tenant(f"{label} ({shares[index]:.2%})", *owners[index])
+        for index, label in ((0, "largest"), (tenant_count // 2, "median"), (tenant_count - 1, "smallest"))
+    }
+    rows = []
+    try:
+        current = 0
+        for size in sorted(sizes):
+            started = time.perf_counter()
+            grow(owners, shares, probes, current, size, rng)
+            print(f"grew to {size} chunks over {tenant_count} tenants in {time.perf_counter() - started:.1f}s")
+            current = size
+            for tenant in probes.values():
+                latencies, hits, recalls = asyncio.run(measure(tenant, queries, top_k, index_only))
+                rows.append([size, tenant.label, len(tenant.chunk_ids), sum(hits) / len(hits), sum(recalls) / len(recalls),
+                             percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000])
+    finally:
+        remove_owners(owners)
+    print(f"top_k={top_k}, {query_count} queries per tenant and size, {'index scan only' if index_only else 'retrieve_relevant_chunks'}")
+    print_table(["chunks", "tenant", "tenant chunks", "avg hits", f"recall@{top_k}", "p50 ms", "p99 ms"], rows)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-tenant vector retrieval latency and recall against a growing chunk table.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000], help="total chunk counts to measure at")
+    parser.add_argument("--tenants", type=int, default=100, help="owners the chunks are spread over")
+    parser.add_argument("--queries", type=int, default=200, help="timed queries per tenant and size")
+    parser.add_argument("--top-k", type=int, default=RETRIEVAL_TOP_K)
+    parser.add_argument("--index-only", action="store_true", help="post-filtered HNSW scan only, without iterative scan or exact fallback")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    run(args.sizes, args.tenants, args.queries, args.top_k, args.index_only, args.seed)
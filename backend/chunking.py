@@ -0,0 +1,131 @@
+import os
+import logging
+from typing import List, Optional, Tuple
+from .context import estimate_tokens, CHARS_PER_TOKEN
+from .schemas import ChunkMetadata
+
+logger = logging.getLogger(__name__)
+
+# Target chunk size; consecutive elements are merged up to this many (estimated) tokens
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", 256))
+# Overlap between the pieces of a group that has to be split
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 50))
+# Start a new chunk when the page number changes, so every chunk maps to one page
+CHUNK_SPLIT_ON_PAGE = os.getenv("CHUNK_SPLIT_ON_PAGE", "true").lower() == "true"
+# Longest section title kept in chunk metadata
+MAX_SECTION_TITLE_CHARS = 120
+
+Element = Tuple[str, dict] # (element_text, element_metadata)
+
+# Splitter for oversized groups, built on first use so importing this module does not pull in langchain
+_text_splitter = None
+
+def get_text_splitter():
+    global _text_splitter
+    if _text_splitter is None:
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        _text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=int(CHUNK_TARGET_TOKENS * CHARS_PER_TOKEN),
+            chunk_overlap=int(CHUNK_OVERLAP_TOKENS * CHARS_PER_TOKEN),
+            length_function=len,
+        )
+    return _text_splitter
+
+# Separator between elements in a group, and in the document text that offsets refer to
+ELEMENT_SEPARATOR = "\n\n"
+
+class _Group:
+    def __init__(self, section: Optional[str], page: Optional[int], index: int, offset: int):
+        self.texts: List[str] = []
+        self.tokens = 0
+        self.section = section
+        self.page_first = page
+        self.page_last = page
+        self.element_first = index
+        self.element_last = index
+        self.offset = offset
+        self.element_type: Optional[str] = None
+        self.titles_only = True
+
+    def add(self, text: str, tokens: int, page: Optional[int], index: int, category: Optional[str]):
+        self.texts.append(text)
+        self.tokens += tokens
+        if page is not None:
+            self.page_first = page if self.page_first is None else self.page_first
+            self.page_last = page
+        self.element_last = index
+        is_title = category == "Title"
+        # The body's category describes the chunk better than the heading in front of it
+        if self.element_type is None or (self.titles_only and not is_title):
+            self.element_type = category
+        self.titles_only = self.titles_only and is_title
+
+    def metadata(self, start: int, end: int) -> dict:
+        # Compact provenance instead of the full per-element metadata; empty fields are omitted
+        return ChunkMetadata(
+            page=self.page_first,
+            page_end=self.page_last if self.page_last != self.page_first else None,
+            type=self.element_type,
+            section=self.section,
+            elements=[self.element_first, self.element_last],
+            offsets=[start, end],
+        ).dict(exclude_none=True)
+
+def group_elements(elements: List[Element], target_tokens: int = CHUNK_TARGET_TOKENS) -> List[_Group]:
+    """Merge consecutive elements into groups that stay within one section (and page) and near target_tokens.
+
+    A Title element starts a new section; a run of titles (heading hierarchy) stays together with
+    the text that follows it. Elements larger than the target end up alone in a group.
+    """
+    groups: List[_Group] = []
+    current: Optional[_Group] = None
+    section: Optional[str] = None
+    offset = 0
+    for index, (text, metadata) in enumerate(elements):
+        text = text.strip()
+        if not text:
+            continue
+        category = metadata.get("category")
+        is_title = category == "Title"
+        page = metadata.get("page_number")
+        tokens = estimate_tokens(text)
+        starts_group = (
+            current is None
+            or (is_title and not current.titles_only)
+            or (CHUNK_SPLIT_ON_PAGE and page is not None and current.page_last is not None and page != current.page_last)
+            or (current.tokens + tokens > target_tokens and not current.titles_only)
+        )
+        if is_title:
+            # Nested headings read as "Chapter / Subsection"
+            section = text if starts_group or not current.section else f"{current.section} / {text}"
+            # jsonb rejects \u0000, which PDF extraction occasionally produces
+            section = section.replace("\x00", "")[:MAX_SECTION_TITLE_CHARS]
+        if starts_group:
+            current = _Group(section, page, index, offset)
+            groups.append(current)
+        elif is_title:
+            current.section = section
+        current.add(text, tokens, page, index, category)
+        offset += len(text) + len(ELEMENT_SEPARATOR)
+    return groups
+
+def chunk_elements(elements: List[Element]) -> List[Element]:
+    """Turn parsed elements into (chunk_text, chunk_metadata) pairs; only groups over the target are split further."""
+    chunks: List[Element] = []
+    text_splitter = None
+    for group in group_elements(elements):
+        text = ELEMENT_SEPARATOR.join(group.texts)
+        if group.tokens <= CHUNK_TARGET_TOKENS:
+            chunks.append((text, group.metadata(group.offset, group.offset + len(text))))
+            continue
+        text_splitter = text_splitter or get_text_splitter()
+        cursor = 0
+        for piece in text_splitter.split_text(text):
+            # Pieces come back in order (possibly overlapping and whitespace-trimmed), so search forward
+            start = text.find(piece, cursor)
+            if start < 0:
+                start = cursor
+            cursor = start + 1
+            chunks.append((piece, group.metadata(group.offset + start, group.offset + start + len(piece))))
+    logger.debug(f"Chunked {len(elements)} elements into {len(chunks)} chunks.")
+    return chunks
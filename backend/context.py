@@ -0,0 +1,167 @@
+import os
+import logging
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+from pydantic import BaseModel
+from .db import models
+from .retrieval import RETRIEVAL_TOP_K
+
+logger = logging.getLogger(__name__)
+
+# Maximum estimated tokens of retrieved context placed in the prompt
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 2000))
+# Retrieved candidates the assembler chooses from
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", 20))
+# MMR trade-off: 1.0 ranks by relevance only, lower values favour diversity
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", 0.7))
+# Candidates at least this similar to an already selected chunk are dropped as redundant
+MMR_DUPLICATE_SIMILARITY = float(os.getenv("MMR_DUPLICATE_SIMILARITY", 0.95))
+# Rough characters per token used for the budget estimate (no tokenizer round trip)
+CHARS_PER_TOKEN = float(os.getenv("CHARS_PER_TOKEN", 4.0))
+# Shortest suffix/prefix match treated as splitter overlap between neighbouring chunks
+MIN_MERGE_OVERLAP = int(os.getenv("MIN_MERGE_OVERLAP", 20))
+
+class SourceReference(BaseModel):
+    document_db_id: int
+    filename: str
+
+class AssembledContext(BaseModel):
+    text: str
+    sources: List[SourceReference]
+    chunk_ids: List[int]
+    estimated_tokens: int
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text) / CHARS_PER_TOKEN) + 1
+
+def build_prompt(question: str, context_text: str) -> str:
+    return f"You are an assistant for question-answering tasks. Use the following numbered context passages to answer the question and cite them like [1]. If you don't know the answer, say so.\n\nContext:\n{context_text}\n\nQuestion: {question}\n\nAnswer:"
+
+def _normalized(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+def mmr_select(query_embedding: Sequence[float], embeddings: np.ndarray, costs: List[int],
+               budget: int, max_items: int, lambda_mult: float = MMR_LAMBDA) -> List[int]:
+    """Maximal marginal relevance over candidate embeddings within a token budget; returns candidate indices in selection order.
+
+    Candidates whose cost no longer fits are skipped rather than ending the selection,
+    so a long chunk does not crowd out shorter relevant ones.
+    """
+    if len(costs) == 0:
+        return []
+    candidates = _normalized(np.asarray(embeddings, dtype=np.float32))
+    query = _normalized(np.asarray(query_embedding, dtype=np.float32).reshape(1, -1))[0]
+    relevance = candidates @ query
+    pairwise = candidates @ candidates.T
+    selected: List[int] = []
+    remaining = set(range(len(costs)))
+    used = 0
+    while remaining and len(selected) < max_items:
+        best, best_score = None, -np.inf
+        for i in remaining:
+            redundancy = pairwise[i, selected].max() if selected else 0.0
+            if redundancy >= MMR_DUPLICATE_SIMILARITY:
+                continue
+            score = lambda_mult * relevance[i] - (1.0 - lambda_mult) * redundancy
+            if score > best_score and used + costs[i] <= budget:
+                best, best_score = i, score
+        if best is None:
+            break
+        selected.append(best)
+        remaining.discard(best)
+        used += costs[best]
+    return selected
+
+def _overlap(left: str, right: str) -> int:
+    # Length of the longest suffix of left that is also a prefix of right
+    for size in range(min(len(left), len(right)) - 1, MIN_MERGE_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+def reading_position(chunk: models.DocumentChunk) -> Tuple[float, int]:
+    """Sort key placing a document's chunks in document order.
+
+    Chunk ids are not: re-indexing keeps the ids of unchanged chunks and gives edited ones new, higher ids.
+    Chunks stored before metadata carried character offsets fall back to id order.
+    """
+    metadata = chunk.chunk_metadata if isinstance(chunk.chunk_metadata, dict) else {}
+    offsets = metadata.get("offsets")
+    return (offsets[0] if offsets else float("inf"), chunk.id)
+
+def merge_neighbours(texts: List[str]) -> List[str]:
+    """Join consecutive chunks of one document that share splitter overlap; others stay separate passages."""
+    passages: List[str] = []
+    for text in texts:
+        if passages:
+            if text in passages[-1]:
+                continue
+            overlap = _overlap(passages[-1], text)
+            if overlap:
+                passages[-1] += text[overlap:]
+                continue
+        passages.append(text)
+    return passages
+
+def assemble_context(query_embedding: Sequence[float], retrieved: List[Tuple[models.DocumentChunk, float]],
+                     filenames: Dict[int, str], token_budget: int = CONTEXT_TOKEN_BUDGET,
+                     max_chunks: int = RETRIEVAL_TOP_K) -> AssembledContext:
+    """Build the prompt context from retrieved chunks.
+
+    Exact duplicate texts are dropped, MMR picks a relevant but diverse subset that fits the token
+    budget, and the chosen chunks are regrouped per document in chunk order so overlapping
+    neighbours are merged into one passage. Passages are numbered and labelled with their source.
+    """
+    seen_hashes = set()
+    candidates: List[models.DocumentChunk] = []
+    for chunk, _score in retrieved:
+        key = chunk.text_hash or chunk.chunk_text
+        if key in seen_hashes or chunk.embedding is None:
+            continue
+        seen_hashes.add(key)
+        candidates.append(chunk)
+    if not candidates:
+        return AssembledContext(text="", sources=[], chunk_ids=[], estimated_tokens=0)
+
+    costs = [estimate_tokens(chunk.chunk_text) for chunk in candidates]
+    embeddings = np.stack([np.asarray(chunk.embedding, dtype=np.float32) for chunk in candidates])
+    selected = [candidates[i] for i in mmr_select(query_embedding, embeddings, costs, token_budget, max_chunks)]
+    if not selected:
+        # Even the single best chunk exceeds the budget: keep a truncated prefix of it
+        best = candidates[0]
+        truncated = best.chunk_text[:int(token_budget * CHARS_PER_TOKEN)]
+        selected_texts = {best.document_id: [truncated]}
+        document_order = [best.document_id]
+        selected = [best]
+    else:
+        # Documents keep the rank of their best chunk; chunks within a document follow reading order
+        document_order = []
+        by_document: Dict[int, List[models.DocumentChunk]] = {}
+        for chunk in selected:
+            if chunk.document_id not in by_document:
+                document_order.append(chunk.document_id)
+                by_document[chunk.document_id] = []
+            by_document[chunk.document_id].append(chunk)
+        selected_texts = {
+            document_id: [chunk.chunk_text for chunk in sorted(chunks, key=reading_position)]
+            for document_id, chunks in by_document.items()
+        }
+
+    blocks = []
+    sources = []
+    for document_id in document_order:
+        filename = filenames.get(document_id, f"document {document_id}")
+        sources.append(SourceReference(document_db_id=document_id, filename=filename))
+        for passage in merge_neighbours(selected_texts[document_id]):
+            blocks.append(f"[{len(sources)}] {filename}\n{passage}")
+    text = "\n\n".join(blocks)
+    assembled = AssembledContext(
+        text=text,
+        sources=sources,
+        chunk_ids=[chunk.id for chunk in selected],
+        estimated_tokens=estimate_tokens(text),
+    )
+    logger.info(f"Assembled context: {len(selected)} of {len(retrieved)} retrieved chunks, {len(blocks)} passages, ~{assembled.estimated_tokens} tokens (budget {token_budget}).")
+    return assembled
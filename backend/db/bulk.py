@@ -0,0 +1,74 @@
+import io
+import os
+import csv
+import json
+import logging
+from typing import List, Optional, Sequence, Tuple
+from sqlalchemy import insert, text
+from sqlalchemy.orm import Session
+from . import models
+
+logger = logging.getLogger(__name__)
+
+# Rows buffered per COPY / executemany batch; bounds the memory used for the text payload
+CHUNK_WRITE_BATCH_SIZE = int(os.getenv("CHUNK_WRITE_BATCH_SIZE", 5000))
+
+ChunkRow = Tuple[str, str, Optional[dict], Sequence[float]] # (chunk_text, text_hash, chunk_metadata, embedding)
+
+def _vector_literal(embedding: Sequence[float]) -> str:
+    # pgvector text input format: [1.0,2.0,...]
+    return "[" + ",".join(map(repr, [float(x) for x in embedding])) + "]"
+
+def _clean_text(value: str) -> str:
+    # PostgreSQL text columns cannot store NUL bytes
+    return value.replace("\x00", "")
+
+def bulk_insert_chunks(db: Session, document_id: int, rows: List[ChunkRow]) -> List[int]:
+    """Insert chunk rows for one document in the session's transaction; returns the new ids in input order.
+
+    On PostgreSQL ids are reserved from the sequence up front and rows are streamed with COPY FROM STDIN;
+    other dialects fall back to executemany INSERT batches.
+    """
+    if not rows:
+        return []
+    if db.get_bind().dialect.name == "postgresql":
+        return _copy_insert_chunks(db, document_id, rows)
+    return _executemany_insert_chunks(db, document_id, rows)
+
+def _copy_insert_chunks(db: Session, document_id: int, rows: List[ChunkRow]) -> List[int]:
+    ids = list(db.execute(
+        text("SELECT nextval(pg_get_serial_sequence('document_chunks', 'id')) FROM generate_series(1, :n)"),
+        {"n": len(rows)},
+    ).scalars())
+    # Raw DBAPI (psycopg2) connection bound to the session's current transaction
+    cursor = db.connection().connection.cursor()
+    try:
+        for start in range(0, len(rows), CHUNK_WRITE_BATCH_SIZE):
+            buffer = io.StringIO()
+            # QUOTE_ALL keeps empty strings distinct from NULL in CSV COPY
+            writer = csv.writer(buffer, quoting=csv.QUOTE_ALL)
+            for chunk_id, (chunk_text, chunk_hash, chunk_metadata, embedding) in zip(ids[start:start + CHUNK_WRITE_BATCH_SIZE], rows[start:start + CHUNK_WRITE_BATCH_SIZE]):
+                metadata_json = json.dumps(chunk_metadata, separators=(",", ":")) if chunk_metadata is not None else ""
+                writer.writerow((chunk_id, document_id, _clean_text(chunk_text), chunk_hash, metadata_json, _vector_literal(embedding)))
+            buffer.seek(0)
+            cursor.copy_expert(
+                # FORCE_NULL turns the quoted empty string back into NULL for rows without metadata
+                "COPY document_chunks (id, document_id, chunk_text, text_hash, chunk_metadata, embedding) FROM STDIN WITH (FORMAT csv, FORCE_NULL (chunk_metadata))",
+                buffer,
+            )
+    finally:
+        cursor.close()
+    logger.debug(f"COPY inserted {len(rows)} chunks for document {document_id}.")
+    return ids
+
+def _executemany_insert_chunks(db: Session, document_id: int, rows: List[ChunkRow]) -> List[int]:
+    ids = []
+    for start in range(0, len(rows), CHUNK_WRITE_BATCH_SIZE):
+        params = [
+            {"document_id": document_id, "chunk_text": chunk_text, "text_hash": chunk_hash, "chunk_metadata": chunk_metadata, "embedding": embedding}
+            for chunk_text, chunk_hash, chunk_metadata, embedding in rows[start:start + CHUNK_WRITE_BATCH_SIZE]
+        ]
+        result = db.execute(insert(models.DocumentChunk).returning(models.DocumentChunk.id, sort_by_parameter_order=True), params)
+        ids.extend(result.scalars())
+    logger.debug(f"Batch inserted {len(rows)} chunks for document {document_id}.")
+    return ids
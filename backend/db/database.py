@@ -1,5 +1,7 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -10,16 +12,67 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 
 print("DATABASE_URL:", DATABASE_URL)
 
-engine = create_engine(DATABASE_URL)
+# Async driver URL used by the API routes; derived from DATABASE_URL unless set explicitly
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+
+def _async_url(url: str) -> str:
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    return parsed.set(drivername=ASYNC_DRIVERS.get(backend, parsed.drivername)).render_as_string(hide_password=False)
+
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _async_url(DATABASE_URL)
+
+# Connection pool tuning (ignored for SQLite, which does not use a QueuePool)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 20))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", 30))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+# Server-side statement timeout in milliseconds for the API's (async) engine (0 disables)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", 30000))
+# The same for the synchronous engine, whose COPY inserts, purges and backfills on large documents
+# legitimately run for minutes; disabled by default
+DB_WORKER_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_WORKER_STATEMENT_TIMEOUT_MS", 0))
+
+def _engine_kwargs(url: str, is_async: bool) -> dict:
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite":
+        return {}
+    kwargs = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    statement_timeout = DB_STATEMENT_TIMEOUT_MS if is_async else DB_WORKER_STATEMENT_TIMEOUT_MS
+    if statement_timeout and parsed.get_backend_name() == "postgresql":
+        if is_async:
+            kwargs["connect_args"] = {"server_settings": {"statement_timeout": str(statement_timeout)}}
+        else:
+            kwargs["connect_args"] = {"options": f"-c statement_timeout={statement_timeout}"}
+    return kwargs
+
+# Synchronous engine: schema creation and the ingestion workers (which need psycopg2 COPY)
+engine = create_engine(DATABASE_URL, **_engine_kwargs(DATABASE_URL, is_async=False))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Asynchronous engine: API routes
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **_engine_kwargs(ASYNC_DATABASE_URL, is_async=True))
+
+if async_engine.dialect.name == "postgresql":
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _register_vector_codec(dbapi_connection, connection_record):
+        # asyncpg needs an explicit codec for the pgvector type
+        from pgvector.asyncpg import register_vector
+        dbapi_connection.run_async(register_vector)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
 class Base(DeclarativeBase):
     pass
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close() 
\ No newline at end of file
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
\ No newline at end of file
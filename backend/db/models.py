@@ -1,9 +1,14 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+import os
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Index, JSON
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from pgvector.sqlalchemy import Vector
 from .database import Base
 
+# Must match the output dimension of EMBEDDING_MODEL (all-MiniLM-L6-v2 -> 384)
+EMBEDDING_DIMENSION = int(os.getenv("EMBEDDING_DIMENSION", 384))
+
 class User(Base):
     __tablename__ = "users"
 
@@ -22,19 +27,49 @@ class Document(Base):
     filename = Column(String, nullable=False)
     storage_path = Column(String, nullable=False)
     upload_timestamp = Column(DateTime(timezone=True), server_default=func.now())
-    status = Column(String, default="uploaded") # e.g., uploaded, parsing, processed, indexed, failed
+    content_type = Column(String)
+    content_hash = Column(String(64), index=True) # SHA-256 of the uploaded file
+    size_bytes = Column(Integer)
+    status = Column(String, default="uploaded") # uploaded -> parsing -> embedding -> indexed, or failed
+    error_message = Column(String) # Set when ingestion fails
     owner_id = Column(Integer, ForeignKey("users.id"))
 
     owner = relationship("User", back_populates="documents")
     chunks = relationship("DocumentChunk", back_populates="document")
 
+    __table_args__ = (
+        # Backs the keyset-paginated document list (owner_id filter, upload_timestamp order)
+        Index("ix_documents_owner_upload", "owner_id", "upload_timestamp"),
+    )
+
 class DocumentChunk(Base):
     __tablename__ = "document_chunks"
 
     id = Column(Integer, primary_key=True, index=True)
-    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
     chunk_text = Column(String, nullable=False)
-    chunk_metadata = Column(String) # Store metadata as JSON string or use JSONB type if preferred
-    # embedding = Column(Vector(384))  # COMMENTED OUT: Remove vector column for now
+    text_hash = Column(String(64)) # SHA-256 of chunk_text, used to diff re-uploads
+    chunk_metadata = Column(JSON().with_variant(JSONB(), "postgresql")) # Compact provenance, see schemas.ChunkMetadata
+    embedding = Column(Vector(EMBEDDING_DIMENSION))
+
+    document = relationship("Document", back_populates="chunks")
+
+    __table_args__ = (
+        # HNSW index for approximate nearest neighbour search on cosine distance (pgvector >= 0.5.0)
+        Index(
+            "ix_document_chunks_embedding_hnsw",
+            "embedding",
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+        ),
+    ) 
+
+class EmbeddingCacheEntry(Base):
+    """Content-addressed embedding store: one vector per (model, chunk text hash)."""
+    __tablename__ = "embedding_cache"
 
-    document = relationship("Document", back_populates="chunks") 
\ No newline at end of file
+    model_name = Column(String, primary_key=True)
+    text_hash = Column(String(64), primary_key=True) # SHA-256 of the chunk text
+    embedding = Column(Vector(EMBEDDING_DIMENSION), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
\ No newline at end of file
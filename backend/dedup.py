@@ -0,0 +1,147 @@
+import os
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import select, delete, exists, or_, and_, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from .db import models
+from .storage import LOCAL_STORAGE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Parsed element lists keyed by the uploaded file's SHA-256
+PARSE_CACHE_DIR = os.path.join(LOCAL_STORAGE_DIR, 'parsed')
+os.makedirs(PARSE_CACHE_DIR, exist_ok=True)
+# Bump when the parser output format changes so stale entries are ignored
+PARSE_CACHE_VERSION = "1"
+# Maximum number of hashes per lookup/insert statement against the embedding cache
+EMBEDDING_CACHE_LOOKUP_BATCH = int(os.getenv("EMBEDDING_CACHE_LOOKUP_BATCH", 1000))
+# Embedding cache entries older than this are pruned unless a stored chunk still has the same text
+EMBEDDING_CACHE_MAX_AGE_DAYS = int(os.getenv("EMBEDDING_CACHE_MAX_AGE_DAYS", 30))
+# Unreferenced parse cache files younger than this are kept: their document may still be uploading
+PARSE_CACHE_MIN_AGE_SECONDS = 3600
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def _parse_cache_path(content_hash: str) -> str:
+    return os.path.join(PARSE_CACHE_DIR, f"{content_hash}.v{PARSE_CACHE_VERSION}.json")
+
+def load_parsed_elements(content_hash: Optional[str]) -> Optional[List[Tuple[str, dict]]]:
+    """Return cached (text, metadata) elements for a file hash, or None on a miss."""
+    if not content_hash:
+        return None
+    path = _parse_cache_path(content_hash)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return [tuple(element) for element in json.load(f)]
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable parse cache entry {path}: {e}")
+        return None
+
+def store_parsed_elements(content_hash: Optional[str], elements: List[Tuple[str, dict]]):
+    if not content_hash:
+        return
+    path = _parse_cache_path(content_hash)
+    temp_path = f"{path}.part"
+    try:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(elements, f, default=str)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"Failed to write parse cache entry {path}: {e}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def remove_parsed_elements(content_hashes: Iterable[str]) -> int:
+    removed = 0
+    for content_hash in content_hashes:
+        try:
+            os.remove(_parse_cache_path(content_hash))
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove parse cache entry for {content_hash}: {e}")
+    return removed
+
+def prune_parse_cache(db: Session, content_hashes: Iterable[str]) -> int:
+    """Remove the cached parse output of content hashes no remaining document has; returns the number of files removed."""
+    hashes = {content_hash for content_hash in content_hashes if content_hash}
+    if not hashes:
+        return 0
+    referenced = set(db.scalars(select(models.Document.content_hash).where(models.Document.content_hash.in_(hashes))))
+    return remove_parsed_elements(hashes - referenced)
+
+def sweep_parse_cache(db: Session) -> int:
+    """Remove parse cache files of an older PARSE_CACHE_VERSION or of content no document has any more."""
+    suffix = f".v{PARSE_CACHE_VERSION}.json"
+    cutoff = time.time() - PARSE_CACHE_MIN_AGE_SECONDS
+    removed = 0
+    candidates = []
+    for entry in os.scandir(PARSE_CACHE_DIR):
+        if not entry.is_file() or entry.stat().st_mtime > cutoff:
+            continue
+        if entry.name.endswith(suffix):
+            candidates.append(entry.name[:-len(suffix)])
+        elif entry.name.endswith(".json"):
+            os.remove(entry.path)
+            removed += 1
+    for i in range(0, len(candidates), EMBEDDING_CACHE_LOOKUP_BATCH):
+        removed += prune_parse_cache(db, candidates[i:i + EMBEDDING_CACHE_LOOKUP_BATCH])
+    return removed
+
+def prune_embedding_cache(db: Session, model_name: str, max_age_days: int = EMBEDDING_CACHE_MAX_AGE_DAYS) -> int:
+    """Delete cache entries of other models, and entries older than max_age_days whose text no stored chunk has.
+
+    Deletes in batches of EMBEDDING_CACHE_LOOKUP_BATCH, committing each; returns the number of entries removed.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=max_age_days)
+    entry = models.EmbeddingCacheEntry
+    stale = select(entry.model_name, entry.text_hash).where(or_(
+        entry.model_name != model_name,
+        and_(entry.created_at < cutoff, ~exists().where(models.DocumentChunk.text_hash == entry.text_hash)),
+    )).limit(EMBEDDING_CACHE_LOOKUP_BATCH)
+    removed = 0
+    while True:
+        batch = db.execute(stale).all()
+        if not batch:
+            break
+        db.execute(delete(entry).where(tuple_(entry.model_name, entry.text_hash).in_([tuple(row) for row in batch])))
+        db.commit()
+        removed += len(batch)
+    return removed
+
+def lookup_cached_embeddings(db: Session, model_name: str, hashes: List[str]) -> Dict[str, list]:
+    """Return {text_hash: embedding} for hashes already embedded under model_name."""
+    found = {}
+    unique_hashes = list(set(hashes))
+    for i in range(0, len(unique_hashes), EMBEDDING_CACHE_LOOKUP_BATCH):
+        batch = unique_hashes[i:i + EMBEDDING_CACHE_LOOKUP_BATCH]
+        stmt = select(models.EmbeddingCacheEntry.text_hash, models.EmbeddingCacheEntry.embedding).where(
+            models.EmbeddingCacheEntry.model_name == model_name,
+            models.EmbeddingCacheEntry.text_hash.in_(batch),
+        )
+        for row in db.execute(stmt):
+            found[row.text_hash] = row.embedding
+    return found
+
+def store_embeddings(db: Session, model_name: str, embeddings: Dict[str, list]):
+    """Insert new cache entries, ignoring hashes another worker stored concurrently."""
+    if not embeddings:
+        return
+    rows = [
+        {"model_name": model_name, "text_hash": hash_, "embedding": embedding}
+        for hash_, embedding in embeddings.items()
+    ]
+    for i in range(0, len(rows), EMBEDDING_CACHE_LOOKUP_BATCH):
+        stmt = insert(models.EmbeddingCacheEntry).values(rows[i:i + EMBEDDING_CACHE_LOOKUP_BATCH]).on_conflict_do_nothing(
+            index_elements=["model_name", "text_hash"]
+        )
+        db.execute(stmt)
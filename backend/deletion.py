@@ -0,0 +1,130 @@
+import os
+import time
+import logging
+from typing import List
+from sqlalchemy import select, delete
+from sqlalchemy.exc import SQLAlchemyError
+from elasticsearch import ElasticsearchException
+from .db.database import SessionLocal
+from .db import models
+from .elasticsearch_client import es_client, index_for_owner
+from .embeddings import EMBEDDING_MODEL_NAME
+from .dedup import prune_parse_cache, sweep_parse_cache, prune_embedding_cache
+
+logger = logging.getLogger(__name__)
+
+# Documents marked for deletion are hidden from retrieval and purged in the background
+STATUS_DELETING = "deleting"
+
+# Chunk rows removed per DELETE statement/transaction, so a large purge never holds long locks
+DELETE_BATCH_SIZE = int(os.getenv("DELETE_BATCH_SIZE", 5000))
+# Maximum number of document ids accepted by one bulk delete request
+MAX_BULK_DELETE = int(os.getenv("MAX_BULK_DELETE", 1000))
+# Hours between sweeps of the parse and embedding caches
+CACHE_PRUNE_INTERVAL_HOURS = float(os.getenv("CACHE_PRUNE_INTERVAL_HOURS", 24))
+
+def delete_from_index(owner_id: int, document_ids: List[int]):
+    """Start one asynchronous delete-by-query for all the documents' chunks; no forced refresh."""
+    response = es_client.delete_by_query(
+        index=index_for_owner(owner_id),
+        routing=str(owner_id),
+        body={"query": {"terms": {"document_db_id": [str(document_id) for document_id in document_ids]}}},
+        conflicts="proceed",
+        wait_for_completion=False,
+    )
+    logger.info(f"Started Elasticsearch delete task {response.get('task')} for {len(document_ids)} documents.")
+
+def purge_documents(owner_id: int, document_ids: List[int]):
+    """Remove one owner's documents already marked as deleting: Elasticsearch chunks, PostgreSQL chunks in batches, files, then rows."""
+    if not document_ids:
+        return
+    try:
+        delete_from_index(owner_id, document_ids)
+    except ElasticsearchException as e:
+        # Orphaned index entries are harmless: retrieval resolves hits against PostgreSQL rows
+        logger.error(f"Error starting Elasticsearch delete for documents {document_ids}: {e}", exc_info=True)
+
+    db = SessionLocal()
+    try:
+        deleted_chunks = 0
+        while True:
+            batch = db.scalars(
+                select(models.DocumentChunk.id)
+                .where(models.DocumentChunk.document_id.in_(document_ids))
+                .limit(DELETE_BATCH_SIZE)
+            ).all()
+            if not batch:
+                break
+            db.execute(delete(models.DocumentChunk).where(models.DocumentChunk.id.in_(batch)))
+            db.commit()
+            deleted_chunks += len(batch)
+        logger.info(f"Deleted {deleted_chunks} chunks from PostgreSQL for {len(document_ids)} documents.")
+
+        documents = db.scalars(select(models.Document).where(
+            models.Document.id.in_(document_ids),
+            models.Document.status == STATUS_DELETING
+        )).all()
+        content_hashes = [document.content_hash for document in documents]
+        # Uploads stored before paths were unique may share a file with a document that is kept
+        shared_paths = set(db.scalars(select(models.Document.storage_path).where(
+            models.Document.storage_path.in_([document.storage_path for document in documents]),
+            models.Document.id.notin_(document_ids)
+        )))
+        for document in documents:
+            try:
+                if document.storage_path not in shared_paths and os.path.exists(document.storage_path):
+                    os.remove(document.storage_path)
+            except OSError as e:
+                logger.error(f"Error deleting local file {document.storage_path}: {e}", exc_info=True)
+            db.delete(document)
+        db.commit()
+        logger.info(f"Deleted {len(documents)} document records from PostgreSQL.")
+        # The parse cache holds the full extracted text; keep it only while another document has the same content
+        removed = prune_parse_cache(db, content_hashes)
+        if removed:
+            logger.info(f"Removed {removed} parse cache entries of deleted documents.")
+    except SQLAlchemyError as e:
+        db.rollback()
+        # Documents stay in the deleting state and are retried by resume_pending_deletions on the next start
+        logger.error(f"Database error purging documents {document_ids}: {e}", exc_info=True)
+    finally:
+        db.close()
+
+def resume_pending_deletions():
+    """Finish purges interrupted by a restart."""
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(models.Document.owner_id, models.Document.id).where(models.Document.status == STATUS_DELETING)).all()
+    except SQLAlchemyError as e:
+        logger.error(f"Could not look up pending deletions: {e}", exc_info=True)
+        return
+    finally:
+        db.close()
+    if rows:
+        logger.info(f"Resuming deletion of {len(rows)} documents.")
+    # Purges are per owner so each delete-by-query is routed to a single shard
+    by_owner = {}
+    for owner_id, document_id in rows:
+        by_owner.setdefault(owner_id, []).append(document_id)
+    for owner_id, document_ids in by_owner.items():
+        for start in range(0, len(document_ids), MAX_BULK_DELETE):
+            purge_documents(owner_id, document_ids[start:start + MAX_BULK_DELETE])
+
+def prune_caches():
+    """Drop parse cache files and embedding cache entries nothing refers to any more."""
+    db = SessionLocal()
+    try:
+        parse_entries = sweep_parse_cache(db)
+        embedding_entries = prune_embedding_cache(db, EMBEDDING_MODEL_NAME)
+        logger.info(f"Cache pruning removed {parse_entries} parse cache files and {embedding_entries} embedding cache entries.")
+    except (SQLAlchemyError, OSError) as e:
+        db.rollback()
+        logger.error(f"Cache pruning failed: {e}", exc_info=True)
+    finally:
+        db.close()
+
+def run_cache_pruning():
+    """Prune the caches now and then every CACHE_PRUNE_INTERVAL_HOURS (runs in a daemon thread)."""
+    while True:
+        prune_caches()
+        time.sleep(CACHE_PRUNE_INTERVAL_HOURS * 3600)
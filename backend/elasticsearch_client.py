@@ -1,6 +1,13 @@
 import os
+import logging
+import time
+import threading
+from contextlib import contextmanager
 from elasticsearch import Elasticsearch
-from typing import List
+from elasticsearch.helpers import streaming_bulk, parallel_bulk, BulkIndexError
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
 
 ELASTICSEARCH_HOST = os.getenv("ELASTICSEARCH_HOST", "localhost")
 ELASTICSEARCH_PORT = int(os.getenv("ELASTICSEARCH_PORT", 9200))
@@ -9,33 +16,232 @@ ELASTICSEARCH_URL = f"http://{ELASTICSEARCH_HOST}:{ELASTICSEARCH_PORT}"
 
 es_client = Elasticsearch(ELASTICSEARCH_URL)
 
+# INDEX_NAME is an alias; the physical index is versioned so mapping changes can be migrated by reindex + alias swap.
+# Chunks are routed by owner_id, so one user's chunks live on a single shard of whichever index holds them.
 INDEX_NAME = "document_chunks"
+INDEX_MAPPING_VERSION = 3
+# Tenants moved to a tier index (see es_tenants.py) get a filtered, routed alias of this form
+OWNER_ALIAS_PREFIX = f"{INDEX_NAME}_owner_"
+# Seconds a process caches where an owner's chunks live; es_tenants waits this long before its catch-up pass
+ES_TENANT_ALIAS_TTL = float(os.getenv("ES_TENANT_ALIAS_TTL", 60))
+
+# Bulk indexing tuning
+ES_BULK_CHUNK_SIZE = int(os.getenv("ES_BULK_CHUNK_SIZE", 500))
+ES_BULK_MAX_CHUNK_BYTES = int(os.getenv("ES_BULK_MAX_CHUNK_BYTES", 10 * 1024 * 1024))
+# More than one thread switches from streaming_bulk to parallel_bulk
+ES_BULK_THREADS = int(os.getenv("ES_BULK_THREADS", 1))
+# Refresh interval in normal operation and while ingestion is running
+ES_REFRESH_INTERVAL = os.getenv("ES_REFRESH_INTERVAL", "1s")
+ES_INGEST_REFRESH_INTERVAL = os.getenv("ES_INGEST_REFRESH_INTERVAL", "30s")
+ES_INDEX_SHARDS = int(os.getenv("ES_INDEX_SHARDS", 1))
+ES_INDEX_REPLICAS = int(os.getenv("ES_INDEX_REPLICAS", 1))
+
+INDEX_SETTINGS = {
+    "number_of_shards": ES_INDEX_SHARDS,
+    "number_of_replicas": ES_INDEX_REPLICAS,
+    "refresh_interval": ES_REFRESH_INTERVAL,
+}
+
+INDEX_MAPPINGS = {
+    # Unknown top-level fields are kept in _source but never mapped
+    "dynamic": False,
+    # Every write must carry the owner routing key; an unrouted write would land on the wrong shard
+    "_routing": {"required": True},
+    "properties": {
+        # Only what BM25 search and its filters need; the chunk id is the document _id, and
+        # embeddings and chunk metadata live in PostgreSQL
+        "owner_id": {"type": "keyword"},
+        "document_db_id": {"type": "keyword"},
+        "chunk_text": {"type": "text"},
+    },
+}
+
+# Copies the filter fields out of metadata for indices created before version 1,
+# routes every chunk by owner (introduced in version 2) and drops the fields PostgreSQL already holds (version 3)
+LEGACY_REINDEX_SCRIPT = """
+if (ctx._source.metadata != null) {
+    if (ctx._source.owner_id == null) { ctx._source.owner_id = ctx._source.metadata.owner_id; }
+    if (ctx._source.document_db_id == null) { ctx._source.document_db_id = ctx._source.metadata.document_db_id; }
+}
+ctx._routing = String.valueOf(ctx._source.owner_id);
+ctx._source.remove('metadata');
+ctx._source.remove('embedding');
+ctx._source.remove('document_id');
+ctx._source.remove('chunk_id');
+"""
+
+def versioned_index_name(version: int = INDEX_MAPPING_VERSION) -> str:
+    return f"{INDEX_NAME}_v{version}"
+
+def tier_index_name(tier: str, version: int = INDEX_MAPPING_VERSION) -> str:
+    return f"{INDEX_NAME}_tier_{tier}_v{version}"
+
+def owner_alias_name(owner_id: int) -> str:
+    return f"{OWNER_ALIAS_PREFIX}{owner_id}"
+
+def create_index(index: str):
+    es_client.indices.create(index=index, body={"settings": INDEX_SETTINGS, "mappings": INDEX_MAPPINGS}, ignore=400)
+    logger.info(f"Elasticsearch index '{index}' created.")
+
+def _reindex(source: str, target: str, script: str = None):
+    body = {"source": {"index": source}, "dest": {"index": target}}
+    if script:
+        body["script"] = {"source": script, "lang": "painless"}
+    result = es_client.reindex(body=body, refresh=True, request_timeout=3600)
+    logger.info(f"Reindexed {result.get('total', 0)} documents from '{source}' into '{target}'.")
+
+def _set_write_block(index: str, blocked: bool):
+    es_client.indices.put_settings(index=index, body={"index.blocks.write": blocked})
+
+def _migrate(source: str, target: str):
+    """Copy source into target with writes to source blocked, so nothing indexed or deleted mid-copy is lost.
+
+    Writers see a cluster block error until the alias moves; the source stays read-only afterwards.
+    """
+    _set_write_block(source, True)
+    try:
+        _reindex(source, target, LEGACY_REINDEX_SCRIPT)
+    except Exception:
+        _set_write_block(source, False)
+        raise
 
 def create_index_if_not_exists():
-    if not es_client.indices.exists(index=INDEX_NAME):
-        es_client.indices.create(index=INDEX_NAME, ignore=400) 
-        print(f"Elasticsearch index '{INDEX_NAME}' created.")
+    """Create the current versioned index and point the INDEX_NAME alias at it, migrating older indices."""
+    target = versioned_index_name()
+    if not es_client.indices.exists(index=target):
+        create_index(target)
+
+    if es_client.indices.exists_alias(name=INDEX_NAME):
+        # Tier indices share the read alias but are managed (and migrated) by es_tenants.py
+        current = [index for index in es_client.indices.get_alias(name=INDEX_NAME).keys() if not index.startswith(f"{INDEX_NAME}_tier_")]
+        if current == [target]:
+            logger.info(f"Elasticsearch alias '{INDEX_NAME}' already points to '{target}'.")
+            return
+        for source in current:
+            _migrate(source, target)
+        actions = [{"remove": {"index": source, "alias": INDEX_NAME}} for source in current]
+        # The shared index takes writes for every owner without a tier alias
+        actions.append({"add": {"index": target, "alias": INDEX_NAME, "is_write_index": True}})
+        es_client.indices.update_aliases(body={"actions": actions})
+        logger.info(f"Elasticsearch alias '{INDEX_NAME}' moved from {current} to '{target}'.")
+    elif es_client.indices.exists(index=INDEX_NAME):
+        # Pre-versioning deployments have a concrete index with dynamic mapping under the alias name
+        _migrate(INDEX_NAME, target)
+        # Dropping the index and adding the alias in one call leaves no gap in which a write auto-creates an index
+        es_client.indices.update_aliases(body={"actions": [
+            {"remove_index": {"index": INDEX_NAME}},
+            {"add": {"index": target, "alias": INDEX_NAME, "is_write_index": True}},
+        ]})
+        logger.info(f"Migrated legacy index '{INDEX_NAME}' to '{target}' behind alias '{INDEX_NAME}'.")
     else:
-        print(f"Elasticsearch index '{INDEX_NAME}' already exists.")
+        es_client.indices.put_alias(index=target, name=INDEX_NAME, body={"is_write_index": True})
+        logger.info(f"Elasticsearch alias '{INDEX_NAME}' created for '{target}'.")
+
+_owner_targets = {}
+_owner_targets_lock = threading.Lock()
+
+def index_for_owner(owner_id: int) -> str:
+    """The alias to read and write an owner's chunks through: their tier alias if they have one, else INDEX_NAME."""
+    now = time.monotonic()
+    with _owner_targets_lock:
+        cached = _owner_targets.get(owner_id)
+        if cached and cached[1] > now:
+            return cached[0]
+    alias = owner_alias_name(owner_id)
+    target = alias if es_client.indices.exists_alias(name=alias) else INDEX_NAME
+    with _owner_targets_lock:
+        _owner_targets[owner_id] = (target, now + ES_TENANT_ALIAS_TTL)
+    return target
+
+_ingest_lock = threading.Lock()
+_active_ingests = 0
 
-def index_document_chunks(document_id: int, chunks: List[dict]):
-    actions = [
+@contextmanager
+def relaxed_refresh():
+    """Relax the index refresh interval while at least one bulk ingest is running in this process."""
+    global _active_ingests
+    with _ingest_lock:
+        _active_ingests += 1
+        if _active_ingests == 1:
+            es_client.indices.put_settings(index=INDEX_NAME, body={"index": {"refresh_interval": ES_INGEST_REFRESH_INTERVAL}})
+    try:
+        yield
+    finally:
+        with _ingest_lock:
+            _active_ingests -= 1
+            if _active_ingests == 0:
+                try:
+                    es_client.indices.put_settings(index=INDEX_NAME, body={"index": {"refresh_interval": ES_REFRESH_INTERVAL}})
+                except Exception as e:
+                    logger.error(f"Failed to restore refresh interval on '{INDEX_NAME}': {e}", exc_info=True)
+
+def index_document_chunks(document_id: int, owner_id: int, chunks: List[dict]):
+    index = index_for_owner(owner_id)
+    actions = (
         {
-            "_index": INDEX_NAME,
+            "_index": index,
+            "_id": chunk["chunk_id"],
+            "_routing": str(owner_id),
             "_source": {
-                "document_id": document_id,
-                "chunk_text": chunk["chunk_text"],
-                "metadata": chunk["metadata"]
+                "owner_id": owner_id,
+                "document_db_id": document_id,
+                "chunk_text": chunk["chunk_text"]
             }
         }
         for chunk in chunks
-    ]
-    # Use the bulk helper for efficient indexing
-    from elasticsearch.helpers import bulk
-    try:
-        success_count, errors = bulk(es_client, actions)
-        print(f"Indexed {success_count} document chunks for document ID {document_id}.")
-        if errors:
-            print(f"Errors during indexing: {errors}")
-    except Exception as e:
-        print(f"Error during bulk indexing: {e}") 
\ No newline at end of file
+    )
+    if ES_BULK_THREADS > 1:
+        results = parallel_bulk(es_client, actions, thread_count=ES_BULK_THREADS, chunk_size=ES_BULK_CHUNK_SIZE,
+                                max_chunk_bytes=ES_BULK_MAX_CHUNK_BYTES, raise_on_error=False)
+    else:
+        results = streaming_bulk(es_client, actions, chunk_size=ES_BULK_CHUNK_SIZE,
+                                 max_chunk_bytes=ES_BULK_MAX_CHUNK_BYTES, raise_on_error=False)
+    success_count = 0
+    errors = []
+    with relaxed_refresh():
+        for ok, item in results:
+            if ok:
+                success_count += 1
+            else:
+                errors.append(item)
+    logger.info(f"Indexed {success_count} document chunks for document ID {document_id}.")
+    if errors:
+        logger.error(f"{len(errors)} errors during indexing for document ID {document_id}: {errors[:5]}")
+        raise BulkIndexError(f"{len(errors)} document chunk(s) failed to index.", errors)
+
+def delete_chunks_by_id(owner_id: int, chunk_ids: List[int]):
+    """Bulk delete individual chunks of one owner; missing ids are ignored."""
+    index = index_for_owner(owner_id)
+    actions = ({"_op_type": "delete", "_index": index, "_id": chunk_id, "_routing": str(owner_id)} for chunk_id in chunk_ids)
+    failures = 0
+    for ok, item in streaming_bulk(es_client, actions, chunk_size=ES_BULK_CHUNK_SIZE, raise_on_error=False):
+        if not ok and item.get("delete", {}).get("status") != 404:
+            failures += 1
+    if failures:
+        logger.error(f"Failed to delete {failures} of {len(chunk_ids)} chunks from Elasticsearch.")
+    else:
+        logger.info(f"Deleted {len(chunk_ids)} chunks from Elasticsearch.")
+
+def search_chunks_bm25(owner_id: int, query_text: str, size: int) -> List[Tuple[int, float]]:
+    """BM25 match on chunk_text restricted to one owner; returns (chunk_id, score) pairs best first."""
+    response = es_client.search(
+        index=index_for_owner(owner_id),
+        # Routing limits the search to the single shard holding this owner's chunks
+        routing=str(owner_id),
+        body={
+            "size": size,
+            "_source": False,
+            "query": {
+                "bool": {
+                    "must": {"match": {"chunk_text": query_text}},
+                    "filter": {"term": {"owner_id": owner_id}}
+                }
+            }
+        }
+    )
+    results = []
+    for hit in response["hits"]["hits"]:
+        # Chunks indexed before chunk ids were used as _id cannot be mapped back to PostgreSQL
+        if hit["_id"].isdigit():
+            results.append((int(hit["_id"]), hit["_score"]))
+    return results
\ No newline at end of file
@@ -0,0 +1,88 @@
+import os
+import time
+import queue
+import asyncio
+import logging
+import threading
+from concurrent.futures import Future
+from typing import List, Optional, Tuple
+import numpy as np
+from .embeddings import encode_batched
+from .metrics import QUERY_EMBED_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Largest batch a single forward pass may take
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", 32))
+# How long the first request of a batch waits for others to join, in milliseconds
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", 5))
+
+class MicroBatchEmbedder:
+    """Coalesces concurrent encode requests into batched forward passes on one worker thread.
+
+    The first request starts a batch; further requests join it until max_batch_size texts are
+    collected or max_wait has passed since the first one, then the batch is encoded and every
+    caller's future is resolved with its own row. One thread owns the model, so concurrent
+    queries no longer compete for it (and the GIL) one text at a time.
+    """
+
+    def __init__(self, model, max_batch_size: int = EMBEDDING_MAX_BATCH, max_wait_ms: float = EMBEDDING_MAX_WAIT_MS):
+        self.model = model
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait = max_wait_ms / 1000.0
+        self._requests: "queue.Queue[Optional[Tuple[str, Future]]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, text: str) -> Future:
+        future = Future()
+        self._requests.put((text, future))
+        return future
+
+    async def encode(self, text: str) -> np.ndarray:
+        return await asyncio.wrap_future(self.submit(text))
+
+    def stop(self):
+        self._requests.put(None)
+        self._thread.join(timeout=5)
+
+    def _collect(self) -> Optional[List[Tuple[str, Future]]]:
+        first = self._requests.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + self._max_wait
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Finish this batch, then stop
+                self._requests.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            # Callers that gave up (e.g. a cancelled request) are dropped before encoding
+            batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                embeddings = encode_batched(self.model, [text for text, _ in batch], batch_size=self._max_batch_size)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(batch)} failed: {e}", exc_info=True)
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            QUERY_EMBED_BATCH_SIZE.observe(len(batch))
+            for (_, future), embedding in zip(batch, embeddings):
+                future.set_result(embedding)
@@ -0,0 +1,104 @@
+import os
+import logging
+from typing import List
+import numpy as np
+from .storage import LOCAL_STORAGE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Embedding Model (using a default model for now). Prefix with "onnx:" or "onnx-int8:" to run the
+# same model through ONNX Runtime (fp32 or dynamically int8-quantized) instead of PyTorch
+EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+ONNX_BACKENDS = ("onnx", "onnx-int8")
+# Where ONNX exports (and their quantized variants) are cached between runs
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", os.path.join(LOCAL_STORAGE_DIR, "onnx"))
+# Number of chunks sent through the embedding model per forward pass
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", 64))
+
+def encode_batched(model, texts: List[str], batch_size: int = EMBEDDING_BATCH_SIZE) -> np.ndarray:
+    """Encode texts in batches of batch_size and return a (len(texts), dim) float32 array."""
+    if not texts:
+        return np.empty((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    embeddings = model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    )
+    logger.debug(f"Encoded {len(texts)} texts in batches of {batch_size}.")
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def parse_model_name(model_name: str):
+    """Split "onnx-int8:org/model" into ("onnx-int8", "org/model"); plain names use the "torch" backend."""
+    backend, separator, model_id = model_name.partition(":")
+    if separator and backend in ONNX_BACKENDS:
+        return backend, model_id
+    return "torch", model_name
+
+class OnnxSentenceEncoder:
+    """Mean-pooled, L2-normalised sentence embeddings from an ONNX Runtime export of a sentence-transformers model.
+
+    Implements the subset of the SentenceTransformer interface used here (encode, get_sentence_embedding_dimension).
+    """
+
+    def __init__(self, model_id: str, quantize: bool = False):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction
+        from transformers import AutoTokenizer
+        export_dir = os.path.join(ONNX_CACHE_DIR, model_id.replace("/", "__"))
+        if not os.path.exists(os.path.join(export_dir, "model.onnx")):
+            logger.info(f"Exporting {model_id} to ONNX in {export_dir}.")
+            ORTModelForFeatureExtraction.from_pretrained(model_id, export=True).save_pretrained(export_dir)
+            AutoTokenizer.from_pretrained(model_id).save_pretrained(export_dir)
+        model_dir, file_name = export_dir, "model.onnx"
+        if quantize:
+            model_dir, file_name = export_dir + "-int8", "model_quantized.onnx"
+            if not os.path.exists(os.path.join(model_dir, file_name)):
+                from optimum.onnxruntime import ORTQuantizer
+                from optimum.onnxruntime.configuration import AutoQuantizationConfig
+                logger.info(f"Quantizing {model_id} to int8 in {model_dir}.")
+                quantizer = ORTQuantizer.from_pretrained(export_dir)
+                quantizer.quantize(save_dir=model_dir, quantization_config=AutoQuantizationConfig.avx2(is_static=False, per_channel=False))
+                AutoTokenizer.from_pretrained(export_dir).save_pretrained(model_dir)
+        self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self._model = ORTModelForFeatureExtraction.from_pretrained(model_dir, file_name=file_name)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self._model.config.hidden_size
+
+    def encode(self, sentences, batch_size: int = 32, convert_to_numpy: bool = True, show_progress_bar: bool = False):
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        batches = []
+        for start in range(0, len(texts), batch_size):
+            inputs = self._tokenizer(texts[start:start + batch_size], padding=True, truncation=True, return_tensors="np")
+            token_embeddings = self._model(**inputs).last_hidden_state
+            mask = inputs["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        embeddings = np.concatenate(batches).astype(np.float32) if batches else np.empty((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+# Models loaded in a pre-fork parent (see gunicorn.conf.py); forked workers reuse them copy-on-write
+_preloaded_models = {}
+
+def preload_embedding_model(model_name: str = EMBEDDING_MODEL_NAME):
+    """Load a model in the current process so that workers forked afterwards share its weights instead of loading their own."""
+    if model_name not in _preloaded_models:
+        _preloaded_models[model_name] = load_embedding_model(model_name)
+        logger.info(f"Preloaded embedding model '{model_name}' for shared use by forked workers.")
+    return _preloaded_models[model_name]
+
+def is_preloaded(model_name: str = EMBEDDING_MODEL_NAME) -> bool:
+    return model_name in _preloaded_models
+
+def load_embedding_model(model_name: str = EMBEDDING_MODEL_NAME):
+    """Load the configured embedding model: sentence-transformers on PyTorch, or ONNX Runtime for onnx[-int8]: names."""
+    if model_name in _preloaded_models:
+        return _preloaded_models[model_name]
+    backend, model_id = parse_model_name(model_name)
+    if backend == "torch":
+        # Imported here: sentence_transformers pulls in torch, which dominates import time
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_id)
+    return OnnxSentenceEncoder(model_id, quantize=backend == "onnx-int8")
\ No newline at end of file
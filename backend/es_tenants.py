@@ -0,0 +1,100 @@
+"""Move tenants between the shared chunk index and dedicated tier indices.
+
+    python -m backend.es_tenants list
+    python -m backend.es_tenants move <owner_id> <tier>      # e.g. "large"
+    python -m backend.es_tenants move <owner_id> default     # back to the shared index
+
+A tier index joins the INDEX_NAME read alias and each moved tenant gets a filtered alias routed by
+owner_id (document_chunks_owner_<id>), which index_for_owner() resolves for all reads and writes.
+"""
+import sys
+import time
+import logging
+from typing import Optional
+from .elasticsearch_client import (
+    es_client, INDEX_NAME, ES_TENANT_ALIAS_TTL, OWNER_ALIAS_PREFIX,
+    create_index, versioned_index_name, tier_index_name, owner_alias_name,
+)
+
+logger = logging.getLogger(__name__)
+
+def current_index(owner_id: int) -> str:
+    """Concrete index holding the owner's chunks."""
+    alias = owner_alias_name(owner_id)
+    if es_client.indices.exists_alias(name=alias):
+        return next(iter(es_client.indices.get_alias(name=alias)))
+    return versioned_index_name()
+
+def ensure_tier_index(tier: str) -> str:
+    index = tier_index_name(tier)
+    if not es_client.indices.exists(index=index):
+        create_index(index)
+        # Readable through the shared alias; writes keep going to the shared index unless routed by an owner alias
+        es_client.indices.put_alias(index=index, name=INDEX_NAME, body={"is_write_index": False})
+    return index
+
+def _copy_owner(owner_id: int, source: str, target: str, op_type: Optional[str] = None) -> int:
+    body = {
+        "source": {"index": source, "query": {"term": {"owner_id": str(owner_id)}}},
+        "dest": {"index": target},
+    }
+    if op_type:
+        body["dest"]["op_type"] = op_type
+    result = es_client.reindex(body=body, refresh=True, request_timeout=3600, conflicts="proceed")
+    return result.get("created", 0) + result.get("updated", 0)
+
+def move_owner(owner_id: int, tier: str):
+    """Copy the owner's chunks to the tier's index, switch their alias, catch up late writes, then delete the old copies."""
+    source = current_index(owner_id)
+    target = versioned_index_name() if tier == "default" else ensure_tier_index(tier)
+    if source == target:
+        logger.info(f"Owner {owner_id} already lives in '{target}'.")
+        return
+    copied = _copy_owner(owner_id, source, target)
+    logger.info(f"Copied {copied} chunks of owner {owner_id} from '{source}' to '{target}'.")
+
+    alias = owner_alias_name(owner_id)
+    actions = []
+    if es_client.indices.exists_alias(name=alias):
+        actions.append({"remove": {"index": source, "alias": alias}})
+    if tier != "default":
+        actions.append({"add": {
+            "index": target,
+            "alias": alias,
+            "routing": str(owner_id),
+            "filter": {"term": {"owner_id": str(owner_id)}},
+        }})
+    if actions:
+        es_client.indices.update_aliases(body={"actions": actions})
+    logger.info(f"Owner {owner_id} now reads and writes through '{alias if tier != 'default' else INDEX_NAME}'.")
+
+    # Processes may keep writing to the old index until their cached target expires
+    time.sleep(ES_TENANT_ALIAS_TTL)
+    caught_up = _copy_owner(owner_id, source, target, op_type="create")
+    deleted = es_client.delete_by_query(
+        index=source,
+        routing=str(owner_id),
+        body={"query": {"term": {"owner_id": str(owner_id)}}},
+        conflicts="proceed",
+        refresh=True,
+        request_timeout=3600,
+    ).get("deleted", 0)
+    logger.info(f"Owner {owner_id} moved to '{target}': {caught_up} late chunks caught up, {deleted} removed from '{source}'.")
+
+def list_owners():
+    aliases = es_client.indices.get_alias(name=f"{OWNER_ALIAS_PREFIX}*", ignore=404)
+    for index, entry in sorted(aliases.items()):
+        if not isinstance(entry, dict):
+            continue
+        for alias in sorted(entry.get("aliases", {})):
+            print(f"{alias[len(OWNER_ALIAS_PREFIX):]}\t{index}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) == 2 and sys.argv[1] == "list":
+        list_owners()
+    elif len(sys.argv) == 4 and sys.argv[1] == "move" and sys.argv[2].isdigit():
+        move_owner(int(sys.argv[2]), sys.argv[3])
+    else:
+        print(__doc__, file=sys.stderr)
+        sys.exit(2)
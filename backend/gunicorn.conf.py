@@ -0,0 +1,46 @@
+# Multi-worker launch that loads the embedding model once and shares it across workers.
+# Run from the repository root:
+#   gunicorn -c backend/gunicorn.conf.py backend.main:app
+# and compare per-worker memory with: python -m backend.memory <master pid>
+import gc
+import os
+import glob
+
+bind = os.getenv("BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", 4))
+worker_class = "uvicorn.workers.UvicornWorker"
+# Import the app in the master; with the model preloaded below, workers inherit its pages copy-on-write
+preload_app = True
+# Set SHARED_MODEL_PRELOAD=false to fall back to one model copy per worker (plus one per embedding process,
+# see INGESTION_PROCESS_WORKERS); when true, ingestion embeds with the shared copy on its threads
+SHARED_MODEL_PRELOAD = os.getenv("SHARED_MODEL_PRELOAD", "true").lower() == "true"
+
+# Prometheus multiprocess mode, so a /metrics scrape aggregates every worker rather than the one that answered.
+# Must be set before the app (and prometheus_client) is imported; files left by a previous run are discarded
+PROMETHEUS_MULTIPROC_DIR = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "storage", "prometheus")
+)
+os.makedirs(PROMETHEUS_MULTIPROC_DIR, exist_ok=True)
+for stale_file in glob.glob(os.path.join(PROMETHEUS_MULTIPROC_DIR, "*.db")):
+    os.remove(stale_file)
+
+def on_starting(server):
+    if not SHARED_MODEL_PRELOAD:
+        return
+    from backend.embeddings import preload_embedding_model
+    from backend.memory import log_process_memory
+    preload_embedding_model()
+    # Move everything allocated so far out of the GC's reach: collections in the workers would
+    # otherwise write to the shared objects' headers and copy their pages
+    gc.collect()
+    gc.freeze()
+    log_process_memory("Master after model preload")
+
+def post_worker_init(worker):
+    from backend.memory import log_process_memory
+    log_process_memory(f"Worker {worker.age} started")
+
+def child_exit(server, worker):
+    # Drop the exited worker's live gauges (requests in flight); its counters stay in the aggregate
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
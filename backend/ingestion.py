@@ -0,0 +1,405 @@
+import os
+import json
+import queue
+import logging
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+from sqlalchemy import select, delete, update, text
+from sqlalchemy.exc import SQLAlchemyError
+from .db.database import SessionLocal, engine
+from .db import models
+from .db.bulk import bulk_insert_chunks
+from .elasticsearch_client import index_document_chunks, delete_chunks_by_id
+from .embeddings import encode_batched, load_embedding_model, is_preloaded, EMBEDDING_MODEL_NAME, EMBEDDING_BATCH_SIZE
+from .dedup import text_hash, load_parsed_elements, store_parsed_elements, lookup_cached_embeddings, store_embeddings
+from .metrics import DEDUP_FILE_LOOKUPS, DEDUP_CHUNK_LOOKUPS, REINDEX_CHUNKS, record_lookups, time_stage
+from .profiling import sample_profile, PROFILING_ENABLED, PROFILE_INGESTION
+from .parsers import DocumentParser
+from .chunking import chunk_elements
+from .deletion import STATUS_DELETING
+
+logger = logging.getLogger(__name__)
+
+# Document.status lifecycle: uploaded -> parsing -> embedding -> indexed, or failed at any step
+STATUS_UPLOADED = "uploaded"
+STATUS_PARSING = "parsing"
+STATUS_EMBEDDING = "embedding"
+STATUS_INDEXED = "indexed"
+STATUS_FAILED = "failed"
+# Documents in these states still need a worker; they are re-queued on startup
+PENDING_STATUSES = (STATUS_UPLOADED, STATUS_PARSING, STATUS_EMBEDDING)
+
+# Queue backend: "redis" (shared across API workers) or "memory" (in-process, used for tests/local runs)
+REDIS_URL = os.getenv("REDIS_URL")
+INGESTION_QUEUE_BACKEND = os.getenv("INGESTION_QUEUE_BACKEND", "redis" if REDIS_URL else "memory")
+INGESTION_QUEUE_KEY = os.getenv("INGESTION_QUEUE_KEY", "askmydocs:ingestion")
+# Maximum number of pending jobs before uploads are rejected
+INGESTION_QUEUE_SIZE = int(os.getenv("INGESTION_QUEUE_SIZE", 100))
+# Threads pulling jobs off the queue (= documents ingested concurrently per API process)
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+# Processes used for embedding; 0 runs it inline in the worker thread (parsing has its own pool, see parsers.py)
+INGESTION_PROCESS_WORKERS = int(os.getenv("INGESTION_PROCESS_WORKERS", 2))
+# Seconds a single embed step may take before the job is failed
+INGESTION_STEP_TIMEOUT = float(os.getenv("INGESTION_STEP_TIMEOUT", 600))
+# First key of the PostgreSQL advisory lock held while a document is ingested (second key: document id)
+INGESTION_LOCK_CLASS = 7301
+
+class IngestionQueueFull(Exception):
+    """Raised when the ingestion queue cannot accept another job."""
+
+class DocumentDeleted(Exception):
+    """Raised when a document is marked for deletion while it is being ingested."""
+
+def set_document_status(db, document_id: int, status: str, **values):
+    """Move a document to status unless it has been marked for deletion; the delete always wins."""
+    result = db.execute(
+        update(models.Document)
+        .where(models.Document.id == document_id, models.Document.status != STATUS_DELETING)
+        .values(status=status, **values)
+    )
+    if result.rowcount == 0:
+        raise DocumentDeleted(f"Document {document_id} was marked for deletion during ingestion")
+
+class InMemoryJobQueue:
+    def __init__(self, maxsize: int):
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, document_id: int):
+        try:
+            self._queue.put_nowait(document_id)
+        except queue.Full:
+            raise IngestionQueueFull(f"Ingestion queue is full ({self._queue.maxsize} pending jobs)")
+
+    def get(self, timeout: float) -> Optional[int]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+class RedisJobQueue:
+    def __init__(self, url: str, key: str, maxsize: int):
+        import redis
+        self._client = redis.Redis.from_url(url)
+        self._key = key
+        self._maxsize = maxsize
+
+    def put(self, document_id: int):
+        if self._client.llen(self._key) >= self._maxsize:
+            raise IngestionQueueFull(f"Ingestion queue is full ({self._maxsize} pending jobs)")
+        self._client.rpush(self._key, document_id)
+
+    def get(self, timeout: float) -> Optional[int]:
+        item = self._client.blpop(self._key, timeout=max(1, int(timeout)))
+        return int(item[1]) if item else None
+
+def _create_job_queue():
+    if INGESTION_QUEUE_BACKEND == "redis":
+        logger.info(f"Using Redis ingestion queue '{INGESTION_QUEUE_KEY}'.")
+        return RedisJobQueue(REDIS_URL, INGESTION_QUEUE_KEY, INGESTION_QUEUE_SIZE)
+    logger.info("Using in-process ingestion queue.")
+    return InMemoryJobQueue(INGESTION_QUEUE_SIZE)
+
+def metadata_key(metadata) -> str:
+    """Canonical JSON of chunk metadata, so stored (JSONB) and freshly built metadata compare equal."""
+    if isinstance(metadata, str):
+        # Rows written before chunk_metadata became JSONB
+        metadata = json.loads(metadata) if metadata else None
+    return json.dumps(metadata, sort_keys=True, separators=(",", ":"))
+
+@contextmanager
+def document_lock(document_id: int):
+    """Hold a session-level advisory lock on the document for the duration of its ingestion; yields False if another worker holds it.
+
+    Recovery may queue a document that is also queued (or running) elsewhere; the lock makes the
+    duplicate a no-op, and it is released by PostgreSQL if the worker holding it dies.
+    """
+    if engine.dialect.name != "postgresql":
+        yield True
+        return
+    connection = engine.connect()
+    acquired = False
+    try:
+        acquired = connection.execute(text("SELECT pg_try_advisory_lock(:lock_class, :document_id)"),
+                                      {"lock_class": INGESTION_LOCK_CLASS, "document_id": document_id}).scalar()
+        connection.commit()
+        yield acquired
+    finally:
+        try:
+            if acquired:
+                connection.execute(text("SELECT pg_advisory_unlock(:lock_class, :document_id)"),
+                                   {"lock_class": INGESTION_LOCK_CLASS, "document_id": document_id})
+                connection.commit()
+            connection.close()
+        except SQLAlchemyError as e:
+            # Never hand a connection that may still hold the lock back to the pool
+            logger.error(f"Failed to release ingestion lock for document {document_id}: {e}", exc_info=True)
+            connection.invalidate()
+
+# --- Process pool steps (must be top-level functions so they can be pickled) ---
+
+_worker_embedding_model = None
+
+def embed_texts(texts: List[str]):
+    """Embed texts with a model loaded once per worker process."""
+    global _worker_embedding_model
+    if _worker_embedding_model is None:
+        _worker_embedding_model = load_embedding_model(EMBEDDING_MODEL_NAME)
+    return encode_batched(_worker_embedding_model, texts, batch_size=EMBEDDING_BATCH_SIZE)
+
+def embed_with_cache(db, texts: List[str], embed) -> list:
+    """Embed texts with embed(texts), reusing vectors already stored under EMBEDDING_MODEL_NAME for identical chunk text."""
+    hashes = [text_hash(chunk_text) for chunk_text in texts]
+    cached = lookup_cached_embeddings(db, EMBEDDING_MODEL_NAME, hashes)
+    missing = {}
+    for hash_, chunk_text in zip(hashes, texts):
+        if hash_ not in cached:
+            missing.setdefault(hash_, chunk_text)
+    if missing:
+        new_embeddings = embed(list(missing.values()))
+        computed = dict(zip(missing.keys(), new_embeddings))
+        store_embeddings(db, EMBEDDING_MODEL_NAME, computed)
+        cached.update(computed)
+    hits = sum(1 for hash_ in hashes if hash_ not in missing)
+    record_lookups(DEDUP_CHUNK_LOOKUPS, hits=hits, misses=len(hashes) - hits)
+    logger.info(f"Embedding cache: reused {hits} of {len(hashes)} chunk embeddings, computed {len(missing)}.")
+    return [cached[hash_] for hash_ in hashes]
+
+# --- Worker pool ---
+
+class IngestionWorkerPool:
+    def __init__(self, job_queue, num_workers: int, num_processes: int):
+        self._queue = job_queue
+        self._num_workers = num_workers
+        self._num_processes = num_processes
+        self._process_pool = None
+        self._parser = DocumentParser()
+        self._threads: List[threading.Thread] = []
+        self._stop_event = threading.Event()
+
+    def start(self):
+        if self._num_processes > 0 and is_preloaded(EMBEDDING_MODEL_NAME):
+            # Spawned processes would each load a private model copy next to the one shared across
+            # gunicorn workers; the ingestion threads use the shared copy instead
+            logger.info("Embedding with the preloaded shared model on the ingestion threads; no embedding processes started.")
+        elif self._num_processes > 0:
+            # spawn avoids forking a process that already holds torch/thread state
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self._num_processes,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        self._parser.start()
+        self._stop_event.clear()
+        for i in range(self._num_workers):
+            thread = threading.Thread(target=self._run, name=f"ingestion-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Started {self._num_workers} ingestion workers ({self._num_processes if self._process_pool is not None else 0} embedding processes).")
+
+    def stop(self):
+        self._stop_event.set()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        self._threads = []
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+            self._process_pool = None
+        self._parser.stop()
+        logger.info("Ingestion workers stopped.")
+
+    def enqueue(self, document_id: int):
+        self._queue.put(document_id)
+        logger.info(f"Queued document {document_id} for ingestion.")
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                document_id = self._queue.get(timeout=1)
+            except Exception as e:
+                logger.error(f"Error reading from ingestion queue: {e}", exc_info=True)
+                self._stop_event.wait(1)
+                continue
+            if document_id is None:
+                continue
+            try:
+                with document_lock(document_id) as acquired:
+                    if not acquired:
+                        logger.info(f"Ingestion skipped: document {document_id} is being ingested by another worker.")
+                        continue
+                    if PROFILING_ENABLED and PROFILE_INGESTION:
+                        with sample_profile(f"ingest-document-{document_id}"):
+                            self.process_document(document_id)
+                    else:
+                        self.process_document(document_id)
+            except SQLAlchemyError as e:
+                logger.error(f"Could not lock document {document_id} for ingestion: {e}", exc_info=True)
+
+    def resume_pending(self):
+        """Re-queue documents left uploaded/parsing/embedding by a restart or a worker that died mid-job.
+
+        Jobs in the in-memory queue are lost with the process, and a Redis job popped by a worker that
+        died is gone as well; the document rows are the source of truth for what still needs work.
+        """
+        db = SessionLocal()
+        try:
+            document_ids = db.scalars(
+                select(models.Document.id).where(models.Document.status.in_(PENDING_STATUSES)).order_by(models.Document.id)
+            ).all()
+        except SQLAlchemyError as e:
+            logger.error(f"Could not look up pending ingestion jobs: {e}", exc_info=True)
+            return
+        finally:
+            db.close()
+        if document_ids:
+            logger.info(f"Re-queueing {len(document_ids)} documents with unfinished ingestion.")
+        for document_id in document_ids:
+            while not self._stop_event.is_set():
+                try:
+                    self.enqueue(document_id)
+                    break
+                except IngestionQueueFull:
+                    # Wait for the workers to drain the queue rather than leave the document stuck
+                    self._stop_event.wait(5)
+                except Exception as e:
+                    logger.error(f"Could not re-queue document {document_id}: {e}", exc_info=True)
+                    break
+
+    def _call(self, fn, *args):
+        if self._process_pool is None:
+            return fn(*args)
+        return self._process_pool.submit(fn, *args).result(timeout=INGESTION_STEP_TIMEOUT)
+
+    def _embed_with_cache(self, db, texts: List[str]) -> list:
+        return embed_with_cache(db, texts, lambda missing_texts: self._call(embed_texts, missing_texts))
+
+    def process_document(self, document_id: int):
+        db = SessionLocal()
+        document = None
+        owner_id = None
+        indexed_chunk_ids: List[int] = []
+        try:
+            document = db.get(models.Document, document_id)
+            if document is None:
+                logger.warning(f"Ingestion skipped: document {document_id} no longer exists.")
+                return
+            if document.status == STATUS_DELETING:
+                logger.info(f"Ingestion skipped: document {document_id} is being deleted.")
+                return
+            if document.status not in PENDING_STATUSES:
+                # A duplicate job (e.g. from resume_pending) for a document another worker already finished
+                logger.info(f"Ingestion skipped: document {document_id} is already {document.status}.")
+                return
+            owner_id = document.owner_id
+
+            set_document_status(db, document_id, STATUS_PARSING)
+            db.commit()
+            with time_stage("parse"):
+                elements = load_parsed_elements(document.content_hash)
+                if elements is None:
+                    record_lookups(DEDUP_FILE_LOOKUPS, hits=0, misses=1)
+                    elements = self._parser.parse(document.storage_path, document.content_type)
+                    store_parsed_elements(document.content_hash, elements)
+                else:
+                    record_lookups(DEDUP_FILE_LOOKUPS, hits=1, misses=0)
+                    logger.info(f"Reusing cached parse output for document {document_id} (sha256 {document.content_hash}).")
+            with time_stage("split"):
+                split_chunks = chunk_elements(elements)
+            logger.info(f"Parsed document {document_id} into {len(elements)} elements, merged and split into {len(split_chunks)} chunks.")
+
+            # Document-level fields (filename, path, owner) stay on Document; chunks carry only compact provenance
+            new_chunks = [
+                (chunk_text, text_hash(chunk_text), metadata_key(metadata), metadata)
+                for chunk_text, metadata in split_chunks
+            ]
+            if new_chunks:
+                metadata_bytes = sum(len(chunk[2]) for chunk in new_chunks)
+                logger.info(f"Chunk metadata for document {document_id}: {metadata_bytes / len(new_chunks):.0f} bytes per chunk on average.")
+
+            # Diff against the chunks already stored for this document (none on first ingestion).
+            # Rows are matched on text alone: metadata carries positions (offsets, element indexes) that
+            # shift for every chunk after an edit, so it is rewritten in place on the reused rows instead
+            kept_rows = {}
+            for chunk_id, chunk_hash, chunk_metadata in db.execute(
+                select(models.DocumentChunk.id, models.DocumentChunk.text_hash, models.DocumentChunk.chunk_metadata)
+                .where(models.DocumentChunk.document_id == document.id)
+            ):
+                kept_rows.setdefault(chunk_hash, []).append((chunk_id, metadata_key(chunk_metadata)))
+            chunks_to_insert = []
+            metadata_updates = []
+            reused_count = 0
+            for chunk in new_chunks:
+                existing_rows = kept_rows.get(chunk[1])
+                if existing_rows:
+                    chunk_id, stored_key = existing_rows.pop(0)
+                    reused_count += 1
+                    if stored_key != chunk[2]:
+                        metadata_updates.append({"id": chunk_id, "chunk_metadata": chunk[3]})
+                else:
+                    chunks_to_insert.append(chunk)
+            stale_ids = [chunk_id for rows in kept_rows.values() for chunk_id, _ in rows]
+
+            set_document_status(db, document_id, STATUS_EMBEDDING)
+            db.commit()
+            with time_stage("embed"):
+                chunk_embeddings = self._embed_with_cache(db, [chunk[0] for chunk in chunks_to_insert])
+
+            with time_stage("pg_write"):
+                if stale_ids:
+                    db.execute(delete(models.DocumentChunk).where(models.DocumentChunk.id.in_(stale_ids)))
+                if metadata_updates:
+                    # One executemany UPDATE keyed by primary key
+                    db.execute(update(models.DocumentChunk), metadata_updates)
+                chunk_rows = [
+                    (chunk_text, chunk_hash, metadata, chunk_embedding)
+                    for (chunk_text, chunk_hash, _, metadata), chunk_embedding in zip(chunks_to_insert, chunk_embeddings)
+                ]
+                chunk_ids = bulk_insert_chunks(db, document.id, chunk_rows)
+            REINDEX_CHUNKS.labels(result="reused").inc(reused_count)
+            REINDEX_CHUNKS.labels(result="inserted").inc(len(chunk_ids))
+            REINDEX_CHUNKS.labels(result="deleted").inc(len(stale_ids))
+            logger.info(f"Chunk diff for document {document_id}: {reused_count} reused ({len(metadata_updates)} with updated metadata), {len(chunk_ids)} inserted, {len(stale_ids)} deleted.")
+            # Index under the PostgreSQL chunk id so BM25 hits can be fused with vector hits;
+            # vectors and metadata stay in PostgreSQL, Elasticsearch only needs the text
+            chunks_to_index = [
+                {"chunk_id": chunk_id, "chunk_text": chunk_text}
+                for chunk_id, (chunk_text, _, _, _) in zip(chunk_ids, chunks_to_insert)
+            ]
+            if chunks_to_index:
+                with time_stage("es_bulk"):
+                    indexed_chunk_ids = chunk_ids
+                    index_document_chunks(document.id, owner_id, chunks_to_index)
+
+            # Same transaction as the chunk writes: if a delete got in first, none of them are committed
+            set_document_status(db, document_id, STATUS_INDEXED, error_message=None)
+            db.commit()
+            # Removed chunks are filtered out at retrieval by the PostgreSQL join, so ES cleanup can follow the commit
+            if stale_ids:
+                delete_chunks_by_id(owner_id, stale_ids)
+            logger.info(f"Document {document_id} ingested successfully.")
+        except DocumentDeleted:
+            db.rollback()
+            logger.info(f"Ingestion of document {document_id} abandoned: it was deleted while being processed.")
+            if indexed_chunk_ids:
+                # The purge's delete-by-query may have run before these entries were written
+                try:
+                    delete_chunks_by_id(owner_id, indexed_chunk_ids)
+                except Exception as e:
+                    logger.error(f"Failed to remove index entries of deleted document {document_id}: {e}", exc_info=True)
+        except Exception as e:
+            logger.error(f"Ingestion failed for document {document_id}: {e}", exc_info=True)
+            db.rollback()
+            if document is not None:
+                try:
+                    set_document_status(db, document_id, STATUS_FAILED, error_message=str(e)[:1000])
+                    db.commit()
+                except DocumentDeleted:
+                    db.rollback()
+                except SQLAlchemyError as db_update_e:
+                    db.rollback()
+                    logger.error(f"Failed to mark document {document_id} as failed: {db_update_e}", exc_info=True)
+        finally:
+            db.close()
+
+ingestion_pool = IngestionWorkerPool(_create_job_queue(), INGESTION_WORKERS, INGESTION_PROCESS_WORKERS)
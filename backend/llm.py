@@ -0,0 +1,68 @@
+import os
+import time
+import logging
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# "gemini" for the real API, "fake" for a local stub that needs no network or API key
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+# Gemini API key from environment
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL", "models/gemini-2.5-flash")
+# Seconds the fake LLM sleeps between tokens, to simulate generation latency
+FAKE_LLM_TOKEN_DELAY = float(os.getenv("FAKE_LLM_TOKEN_DELAY", 0.0))
+# Seconds the fake LLM sleeps per prompt word before its first token, to simulate prompt processing
+FAKE_LLM_PROMPT_WORD_DELAY = float(os.getenv("FAKE_LLM_PROMPT_WORD_DELAY", 0.0))
+
+class GeminiLLM:
+    def __init__(self, api_key: str, model_name: str = GEMINI_MODEL_NAME):
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model_name = model_name
+        self._model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt: str) -> str:
+        response = self._model.generate_content(prompt)
+        return response.text if hasattr(response, 'text') else str(response)
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        for chunk in self._model.generate_content(prompt, stream=True):
+            text = chunk.text if hasattr(chunk, 'text') else str(chunk)
+            if text:
+                yield text
+
+class FakeLLM:
+    """Deterministic local stand-in for Gemini, used in tests and offline development."""
+    model_name = "fake"
+
+    def __init__(self, token_delay: float = FAKE_LLM_TOKEN_DELAY, prompt_word_delay: float = FAKE_LLM_PROMPT_WORD_DELAY):
+        self.token_delay = token_delay
+        self.prompt_word_delay = prompt_word_delay
+
+    def _answer(self, prompt: str) -> str:
+        question = prompt.rsplit("Question:", 1)[-1].split("Answer:", 1)[0].strip()
+        return f"This is a fake answer to: {question}"
+
+    def generate(self, prompt: str) -> str:
+        return "".join(self.stream(prompt))
+
+    def stream(self, prompt: str) -> Iterator[str]:
+        if self.prompt_word_delay:
+            time.sleep(self.prompt_word_delay * len(prompt.split()))
+        for i, word in enumerate(self._answer(prompt).split(" ")):
+            if self.token_delay:
+                time.sleep(self.token_delay)
+            yield word if i == 0 else f" {word}"
+
+def create_llm() -> Optional[object]:
+    """Build the configured LLM client, or return None if it cannot be initialized."""
+    if LLM_BACKEND == "fake":
+        logger.info("Using fake LLM backend.")
+        return FakeLLM()
+    if not GEMINI_API_KEY:
+        logger.error("GEMINI_API_KEY environment variable is not set. Gemini will not be initialized.")
+        return None
+    llm = GeminiLLM(GEMINI_API_KEY)
+    logger.info(f"Gemini model '{llm.model_name}' initialized.")
+    return llm
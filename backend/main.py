@@ -1,39 +1,42 @@
 import os
-import boto3
 import json
 import logging # Import logging
 import sys # Import sys
-from fastapi import FastAPI, Depends, UploadFile, File, HTTPException, status, APIRouter, Request # Import Request
+import time
+import base64
+import hashlib
+import threading
+from fastapi import FastAPI, Depends, UploadFile, File, HTTPException, status, APIRouter, Request, BackgroundTasks, Query # Import Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse # Import JSONResponse
-from sqlalchemy.orm import Session
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, Response, StreamingResponse # Import JSONResponse
+from starlette.concurrency import run_in_threadpool, iterate_in_threadpool
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError, SQLAlchemyError # Import SQLAlchemyError
-from sqlalchemy import delete # Import delete
-from .db.database import engine, SessionLocal, Base, get_db
+from sqlalchemy import text, select, func, update, tuple_
+from .db.database import async_engine, get_db
+from .migrate import upgrade_database, upgrade_search_index, RUN_MIGRATIONS
 from .db import models
-from unstructured.partition.auto import partition
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from .elasticsearch_client import es_client, create_index_if_not_exists, index_document_chunks, INDEX_NAME # Import INDEX_NAME
-from sentence_transformers import SentenceTransformer
+from .elasticsearch_client import es_client
 from typing import List, Optional # Import Optional
-from .auth import get_password_hash, verify_password, create_access_token, get_current_user, UserCreate, UserLogin, Token, UserPublic # Import auth components
-from datetime import timedelta
+from .auth import hash_password_async, verify_and_update_password_async, create_access_token, get_current_user, start_invalidation_listener, UserCreate, UserLogin, Token, UserPublic, UserPrincipal # Import auth components
+from datetime import datetime, timedelta
 from elasticsearch import ElasticsearchException # Import ElasticsearchException
-from botocore.exceptions import BotoCoreError, ClientError # Import S3 exceptions
 from pydantic import BaseModel # Import BaseModel
 from pythonjsonlogger.jsonlogger import JsonFormatter # Import JsonFormatter
-from .schemas import DocumentBase
-
-# LangChain Imports for RAG
-# from langchain_openai import ChatOpenAI # REMOVE
-from langchain_community.vectorstores import PGVector # For PostgreSQL vector store
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.runnables import RunnablePassthrough
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableParallel
-
-# Add Gemini API import
-import google.generativeai as genai
+from .schemas import DocumentListItem, DocumentStatusResponse, BulkDeleteRequest
+from .retrieval import hybrid_retrieve, RETRIEVAL_TOP_K
+from .context import assemble_context, build_prompt, CONTEXT_CANDIDATES
+from .embeddings import EMBEDDING_MODEL_NAME, load_embedding_model
+from .embedding_service import MicroBatchEmbedder
+from .storage import save_upload, upload_path, UploadTooLarge
+from .metrics import render_metrics, time_stage, STAGE_SECONDS, HTTP_REQUEST_SECONDS, HTTP_REQUESTS_IN_FLIGHT, HTTP_REQUEST_BYTES, HTTP_RESPONSE_BYTES
+from .profiling import profiling_requested, sample_profile
+from .memory import update_memory_metrics, log_process_memory
+from .llm import create_llm
+from .answer_cache import answer_cache
+from .deletion import purge_documents, resume_pending_deletions, run_cache_pruning, STATUS_DELETING, MAX_BULK_DELETE
+from .ingestion import ingestion_pool, IngestionQueueFull, STATUS_UPLOADED, STATUS_INDEXED, STATUS_FAILED
 
 # Configure logging with JSON format
 logger = logging.getLogger()
@@ -48,8 +51,6 @@ logger.addHandler(handler)
 # Suppress default uvicorn access logs if preferred, or configure them separately if needed
 logging.getLogger("uvicorn.access").propagate = False
 
-models.Base.metadata.create_all(bind=engine)
-
 app = FastAPI(title="AskMyDocs API")
 
 # Create API routers
@@ -63,63 +64,135 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
-# Ensure local storage directory exists
-LOCAL_STORAGE_DIR = os.path.join(os.path.dirname(__file__), 'storage')
-os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
+# Document list page size: default and upper bound for ?limit=
+DOCUMENT_PAGE_SIZE = int(os.getenv("DOCUMENT_PAGE_SIZE", 50))
+MAX_DOCUMENT_PAGE_SIZE = int(os.getenv("MAX_DOCUMENT_PAGE_SIZE", 200))
 
-# Embedding Model (using a default model for now)
-# Consider using environment variables to configure the model
-EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+# Embedding model used at query time; ingestion workers load their own copy
 embedding_model = None
-
-# Text Splitter
-text_splitter = RecursiveCharacterTextSplitter(
-    chunk_size=1000,
-    chunk_overlap=200,
-    length_function=len,
-)
-
-# Gemini API key from environment
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-gemini_model = None
-
-def initialize_gemini():
-    global gemini_model
-    if not GEMINI_API_KEY:
-        logger.error("GEMINI_API_KEY environment variable is not set. Gemini will not be initialized.")
-        gemini_model = None
-    else:
-        genai.configure(api_key=GEMINI_API_KEY)
-        gemini_model = genai.GenerativeModel('models/gemini-2.5-flash')
-        logger.info("Gemini model 'models/gemini-2.5-flash' initialized.")
-
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Application startup initiated.")
-    # Create Elasticsearch index on startup
+# Micro-batching front end for embedding_model; all query-time encodes go through it
+embedding_service = None
+
+# LLM client (Gemini, or a local fake when LLM_BACKEND=fake)
+llm = None
+
+# Set once the schema exists and the query models are loaded; /ready reports it, /health does not wait for it
+app_ready = threading.Event()
+# Set when initialize_services has finished, whether or not everything came up
+startup_finished = threading.Event()
+# Wall-clock reference for the time-to-ready log line
+process_started = time.perf_counter()
+# Startup retries for the database and Elasticsearch: first delay and cap in seconds (doubling in between)
+STARTUP_RETRY_INITIAL_DELAY = float(os.getenv("STARTUP_RETRY_INITIAL_DELAY", 1))
+STARTUP_RETRY_MAX_DELAY = float(os.getenv("STARTUP_RETRY_MAX_DELAY", 60))
+
+def initialize_llm():
+    global llm
+    llm = create_llm()
+
+def load_query_embedder():
+    global embedding_model, embedding_service
+    model = load_embedding_model(EMBEDDING_MODEL_NAME)
+    embedding_service = MicroBatchEmbedder(model)
+    embedding_model = model
+
+def initialize_services():
+    """Schema, search index, ingestion workers and query models, run off the event loop so the server starts serving immediately."""
     try:
-        create_index_if_not_exists()
+        _initialize_services()
+    finally:
+        startup_finished.set()
+
+def retry_with_backoff(step, description: str):
+    """Run step until it succeeds, waiting STARTUP_RETRY_INITIAL_DELAY, doubling up to STARTUP_RETRY_MAX_DELAY, between attempts."""
+    delay = STARTUP_RETRY_INITIAL_DELAY
+    attempt = 1
+    while True:
+        try:
+            return step()
+        except (SQLAlchemyError, ElasticsearchException) as e:
+            logger.error(f"{description} failed (attempt {attempt}); retrying in {delay:.0f}s: {e}")
+            time.sleep(delay)
+            delay = min(delay * 2, STARTUP_RETRY_MAX_DELAY)
+            attempt += 1
+
+def start_background_work():
+    """Search index migration, then the ingestion workers and recovery jobs that write to it."""
+    if RUN_MIGRATIONS:
+        retry_with_backoff(upgrade_search_index, "Elasticsearch index check/creation")
         logger.info("Elasticsearch index check/creation complete.")
-    except ElasticsearchException as e:
-        logger.error(f"Failed to connect to Elasticsearch on startup: {e}")
-    # Load embedding model on startup
-    global embedding_model
+    # Start background ingestion workers
+    ingestion_pool.start()
+    # Finish deletions interrupted by the previous shutdown
+    resume_pending_deletions()
+    # Re-queue documents whose ingestion job was lost with a previous process
+    ingestion_pool.resume_pending()
+    # Keep the parse and embedding caches from growing without bound
+    threading.Thread(target=run_cache_pruning, name="cache-pruning", daemon=True).start()
+
+def _initialize_services():
+    # The database may still be starting (or another process may hold the migration lock): keep retrying
+    if RUN_MIGRATIONS:
+        retry_with_backoff(upgrade_database, "Database schema migration")
+        logger.info("Database schema check/creation complete.")
+    # Elasticsearch only backs BM25 and indexing; its outage must not keep the API from becoming ready
+    threading.Thread(target=start_background_work, name="start-background-work", daemon=True).start()
     try:
-        embedding_model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+        load_query_embedder()
         logger.info(f"Embedding model '{EMBEDDING_MODEL_NAME}' loaded.")
+        log_process_memory("Worker after embedding model load")
     except Exception as e:
         logger.error(f"Failed to load embedding model {EMBEDDING_MODEL_NAME}: {e}")
-    # Initialize Gemini
-    initialize_gemini()
-    logger.info("Application startup complete.")
+    # Initialize LLM
+    initialize_llm()
+    if embedding_model is not None and llm is not None:
+        app_ready.set()
+        logger.info(f"Application ready {time.perf_counter() - process_started:.2f}s after import.")
+
+@app.on_event("startup")
+async def startup_event():
+    logger.info("Application startup initiated.")
+    # Startup runs in each worker after fork, so every process gets its own subscriber
+    start_invalidation_listener()
+    threading.Thread(target=initialize_services, name="initialize-services", daemon=True).start()
+    logger.info(f"Application startup complete in {time.perf_counter() - process_started:.2f}s; models loading in the background.")
 
 @app.on_event("shutdown")
 async def shutdown_event():
     logger.info("Application shutting down.")
+    ingestion_pool.stop()
+    if embedding_service is not None:
+        embedding_service.stop()
+    await async_engine.dispose()
     # TODO: Clean up resources like database sessions, Elasticsearch connections if necessary
 
+@app.middleware("http")
+async def instrument_requests(request: Request, call_next):
+    """Record latency, in-flight count and payload sizes per route; profile the request if asked via X-Profile."""
+    HTTP_REQUESTS_IN_FLIGHT.labels(method=request.method).inc()
+    started = time.perf_counter()
+    response = None
+    try:
+        if profiling_requested(request.headers):
+            with sample_profile(f"{request.method} {request.url.path}"):
+                response = await call_next(request)
+        else:
+            response = await call_next(request)
+        return response
+    finally:
+        # The matched route template (e.g. /documents/{document_id}) is only known after routing
+        route_path = getattr(request.scope.get("route"), "path", "unmatched")
+        status_code = str(response.status_code) if response is not None else "500"
+        HTTP_REQUEST_SECONDS.labels(method=request.method, route=route_path, status=status_code).observe(time.perf_counter() - started)
+        if request.headers.get("content-length", "").isdigit():
+            HTTP_REQUEST_BYTES.labels(method=request.method, route=route_path).observe(int(request.headers["content-length"]))
+        if response is not None and response.headers.get("content-length", "").isdigit():
+            HTTP_RESPONSE_BYTES.labels(method=request.method, route=route_path).observe(int(response.headers["content-length"]))
+        HTTP_REQUESTS_IN_FLIGHT.labels(method=request.method).dec()
+
 # Global Exception Handler
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
@@ -136,11 +209,11 @@ async def root():
     return {"message": "Welcome to AskMyDocs API"}
 
 @app.get("/health")
-async def health_check(db: Session = Depends(get_db)):
+async def health_check(db: AsyncSession = Depends(get_db)):
     logger.info("Health check endpoint accessed.")
     status_report = {"status": "healthy"}
     try:
-        db.connection()
+        await db.execute(text("SELECT 1"))
         status_report["database"] = "connected"
         logger.debug("Database connection successful.")
     except SQLAlchemyError as e:
@@ -157,31 +230,43 @@ async def health_check(db: Session = Depends(get_db)):
         status_report["status"] = "unhealthy"
         status_report.setdefault("error", []).append(f"Elasticsearch connection failed: {e}")
         logger.error(f"Elasticsearch connection failed: {e}")
-    if embedding_model is None:
-        status_report["embedding_model"] = "not loaded"
-        status_report["status"] = "unhealthy"
-        status_report.setdefault("error", []).append("Embedding model not loaded")
-        logger.error("Embedding model not loaded.")
-    else:
-        status_report["embedding_model"] = "loaded"
-        logger.debug("Embedding model is loaded.")
+    # Model loading is reported but does not make the process unhealthy; /ready gates traffic on it
+    status_report["embedding_model"] = "loaded" if embedding_model is not None else "loading"
     return status_report
 
+@app.get("/ready")
+async def readiness_check():
+    """Readiness probe: 200 once the schema exists and the query models are loaded, 503 until then."""
+    if not app_ready.is_set():
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={
+            "status": "starting",
+            "embedding_model": "loaded" if embedding_model is not None else "loading",
+            "llm": "initialized" if llm is not None else "not initialized"
+        })
+    return {"status": "ready"}
+
+@app.get("/metrics")
+async def metrics():
+    update_memory_metrics()
+    payload, content_type = render_metrics()
+    return Response(content=payload, media_type=content_type)
+
 # --- Authentication Endpoints ---
 
 @auth_router.post("/register", response_model=UserPublic, status_code=status.HTTP_201_CREATED)
-async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register_user(user_data: UserCreate, db: AsyncSession = Depends(get_db)):
     logger.info(f"Attempting to register user with email: {user_data.email}")
     # Check if user with this email or username already exists
-    db_user = db.query(models.User).filter(
+    result = await db.execute(select(models.User).where(
         (models.User.email == user_data.email) | (models.User.username == user_data.username)
-    ).first()
+    ))
+    db_user = result.scalars().first()
     if db_user:
         logger.warning(f"Registration failed: Email or username already exists for {user_data.email}")
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email or username already registered")
 
     # Hash the password
-    hashed_password = get_password_hash(user_data.password)
+    hashed_password = await hash_password_async(user_data.password)
 
     # Create new user
     new_user = models.User(
@@ -191,35 +276,48 @@ async def register_user(user_data: UserCreate, db: Session = Depends(get_db)):
     )
     try:
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
         logger.info(f"User registered successfully with ID: {new_user.id}")
         return new_user
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Database integrity error during registration for {user_data.email}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email or username already registered (Integrity Error)") # More specific error
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Database error during registration for {user_data.email}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Database error during registration")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Unexpected error during user registration for {user_data.email}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to register user")
 
 @auth_router.post("/login", response_model=Token)
-async def login_for_access_token(form_data: UserLogin, db: Session = Depends(get_db)):
+async def login_for_access_token(form_data: UserLogin, db: AsyncSession = Depends(get_db)):
     logger.info(f"Attempting to log in user with email: {form_data.email}")
     # Authenticate user by email and password
-    user = db.query(models.User).filter(models.User.email == form_data.email).first()
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    result = await db.execute(select(models.User).where(models.User.email == form_data.email))
+    user = result.scalars().first()
+    password_valid, new_hash = (False, None)
+    if user:
+        password_valid, new_hash = await verify_and_update_password_async(form_data.password, user.hashed_password)
+    if not password_valid:
         logger.warning(f"Login failed: Incorrect credentials for {form_data.email}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    if new_hash:
+        # Stored hash used an outdated cost factor; upgrade it while we have the plaintext
+        try:
+            user.hashed_password = new_hash
+            await db.commit()
+            logger.info(f"Rehashed password for user {user.id} with current settings.")
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"Failed to store rehashed password for user {user.id}: {e}", exc_info=True)
 
     # Create JWT access token
     access_token_expires = timedelta(minutes=30) # Match ACCESS_TOKEN_EXPIRE_MINUTES in auth.py
@@ -232,91 +330,235 @@ async def login_for_access_token(form_data: UserLogin, db: Session = Depends(get
 
 # --- Document Endpoints (Secured) ---
 
-@documents_router.get("/", response_model=List[DocumentBase])
-async def list_documents(current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+def encode_cursor(upload_timestamp: Optional[datetime], document_id: int) -> str:
+    raw = f"{upload_timestamp.isoformat() if upload_timestamp else ''}|{document_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        raw_timestamp, raw_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return (datetime.fromisoformat(raw_timestamp) if raw_timestamp else None), int(raw_id)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid pagination cursor")
+
+@documents_router.get("/", response_model=List[DocumentListItem])
+async def list_documents(
+    request: Request,
+    limit: int = Query(DOCUMENT_PAGE_SIZE, ge=1, le=MAX_DOCUMENT_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    current_user: UserPrincipal = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    """Newest-first page of the user's documents.
+
+    Keyset-paginated on (upload_timestamp, id): the cursor for the next page is returned in the
+    X-Next-Cursor header. Responses carry an ETag, and an unchanged page returns 304.
+    """
     logger.info(f"User {current_user.id} requesting list of documents.")
     try:
-        # Retrieve all documents for the current user
-        documents = db.query(models.Document).filter(models.Document.owner_id == current_user.id).all()
-        logger.info(f"Retrieved {len(documents)} documents for user {current_user.id}.")
-        return documents
+        # Only the columns the list view needs, backed by ix_documents_owner_upload
+        stmt = (
+            select(models.Document.id, models.Document.filename, models.Document.upload_timestamp, models.Document.status)
+            .where(models.Document.owner_id == current_user.id)
+            .order_by(models.Document.upload_timestamp.desc(), models.Document.id.desc())
+            .limit(limit + 1)
+        )
+        if status_filter:
+            stmt = stmt.where(models.Document.status == status_filter)
+        if cursor:
+            cursor_timestamp, cursor_id = decode_cursor(cursor)
+            stmt = stmt.where(tuple_(models.Document.upload_timestamp, models.Document.id) < tuple_(cursor_timestamp, cursor_id))
+        rows = (await db.execute(stmt)).all()
     except SQLAlchemyError as e:
         logger.error(f"Database error retrieving documents for user {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve documents")
-    except Exception as e:
-        logger.error(f"Unexpected error retrieving documents for user {current_user.id}: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to retrieve documents")
-
-@documents_router.delete("/{document_id}")
-async def delete_document(document_id: int, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
-    logger.info(f"User {current_user.id} attempting to delete document ID {document_id}.")
-    # Find the document and ensure it belongs to the current user
-    document = db.query(models.Document).filter(
+    # no-cache makes browsers revalidate with If-None-Match on every poll instead of reusing a stale copy
+    headers = {"Cache-Control": "private, no-cache"}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].upload_timestamp, rows[-1].id)
+    documents = [DocumentListItem(id=row.id, filename=row.filename, upload_timestamp=row.upload_timestamp, status=row.status).dict() for row in rows]
+    body = json.dumps(jsonable_encoder(documents), separators=(",", ":")).encode()
+    headers["ETag"] = f'W/"{hashlib.sha1(body + headers.get("X-Next-Cursor", "").encode()).hexdigest()}"'
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        logger.info(f"Document list unchanged for user {current_user.id}; returning 304.")
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    logger.info(f"Retrieved {len(documents)} documents for user {current_user.id}.")
+    return Response(content=body, media_type="application/json", headers=headers)
+
+@documents_router.get("/{document_id}/status", response_model=DocumentStatusResponse)
+async def get_document_status(document_id: int, current_user: UserPrincipal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    logger.debug(f"User {current_user.id} polling status of document ID {document_id}.")
+    result = await db.execute(select(models.Document).where(
         models.Document.id == document_id,
         models.Document.owner_id == current_user.id
-    ).first()
-
+    ))
+    document = result.scalars().first()
     if not document:
-        logger.warning(f"Delete failed: Document ID {document_id} not found or unauthorized for user {current_user.id}.")
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found or you don't have permission to delete it")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found or you don't have permission to view it")
+    chunk_count = await db.scalar(
+        select(func.count()).select_from(models.DocumentChunk).where(models.DocumentChunk.document_id == document_id)
+    )
+    return DocumentStatusResponse(
+        id=document.id,
+        filename=document.filename,
+        status=document.status,
+        error_message=document.error_message,
+        chunk_count=chunk_count
+    )
 
-    try:
-        # 1. Delete associated chunks from PostgreSQL
-        try:
-            delete_chunks_q = delete(models.DocumentChunk).where(models.DocumentChunk.document_id == document_id)
-            result = db.execute(delete_chunks_q)
-            # db.commit() # Defer commit until main document is deleted
-            logger.info(f"Deleted {result.rowcount} chunks from PostgreSQL for document ID {document_id}.")
-        except SQLAlchemyError as e:
-            logger.error(f"Database error deleting chunks for document ID {document_id}: {e}", exc_info=True)
-            # Continue with other deletions, but log the error
+async def remove_unreferenced_file(db: AsyncSession, path: str):
+    """Delete a stored file unless a document still points at it (uploads stored before paths were unique can share one)."""
+    still_used = await db.scalar(select(models.Document.id).where(models.Document.storage_path == path).limit(1))
+    if still_used is None and os.path.exists(path):
+        os.remove(path)
+
+@documents_router.put("/{document_id}", status_code=status.HTTP_202_ACCEPTED)
+async def replace_document(document_id: int, file: UploadFile = File(...), current_user: UserPrincipal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """Replace a document's content; ingestion only re-embeds and re-indexes chunks that changed."""
+    logger.info(f"User {current_user.id} replacing document ID {document_id} with file: {file.filename}")
+    result = await db.execute(select(models.Document.status, models.Document.storage_path).where(
+        models.Document.id == document_id,
+        models.Document.owner_id == current_user.id
+    ))
+    existing = result.first()
+    if existing is None or existing.status == STATUS_DELETING:
+        logger.warning(f"Replace failed: Document ID {document_id} not found or unauthorized for user {current_user.id}.")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found or you don't have permission to modify it")
+    previous_status, previous_path = existing.status, existing.storage_path
+    # Claim the document with one conditional UPDATE before touching the file, so a concurrent
+    # replace (or delete) that read the same status cannot proceed as well
+    result = await db.execute(
+        update(models.Document)
+        .where(
+            models.Document.id == document_id,
+            models.Document.status == previous_status,
+            models.Document.status.in_((STATUS_INDEXED, STATUS_FAILED))
+        )
+        .values(status=STATUS_UPLOADED)
+        .returning(models.Document.id)
+    )
+    claimed = result.scalar() is not None
+    await db.commit()
+    if not claimed:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Document is still being processed. Please retry once it is indexed.")
 
-        # 2. Delete associated documents/chunks from Elasticsearch
-        try:
-            # Delete by document_db_id field
-            es_client.delete_by_query(
-                index=INDEX_NAME,
-                body={
-                    "query": {
-                        "term": {
-                            "metadata.document_db_id": document_id
-                        }
-                    }
-                },
-                refresh=True # Make deletions visible immediately
+    local_file_path = upload_path(current_user.id, file.filename, document_id)
+    try:
+        file_size, content_hash = await save_upload(file, local_file_path)
+    except Exception as e:
+        # Release the claim; the stored content is unchanged
+        await db.execute(
+            update(models.Document)
+            .where(models.Document.id == document_id, models.Document.status == STATUS_UPLOADED)
+            .values(status=previous_status)
+        )
+        await db.commit()
+        if isinstance(e, UploadTooLarge):
+            logger.warning(f"Replace rejected for user {current_user.id}: {e}")
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+        raise
+    try:
+        # Still conditional: the document may have been marked for deletion while the file streamed in
+        result = await db.execute(
+            update(models.Document)
+            .where(models.Document.id == document_id, models.Document.status != STATUS_DELETING)
+            .values(
+                filename=file.filename,
+                storage_path=local_file_path,
+                content_type=file.content_type,
+                content_hash=content_hash,
+                size_bytes=file_size,
+                status=STATUS_UPLOADED,
+                error_message=None
             )
-            logger.info(f"Deleted Elasticsearch documents for document ID {document_id}.")
-        except ElasticsearchException as e:
-            logger.error(f"Error deleting from Elasticsearch for document ID {document_id}: {e}", exc_info=True)
-            # Continue with other deletions, but log the error
-
-        # 3. Delete the original file from local storage
-        try:
-            local_file_path = document.storage_path
-            if os.path.exists(local_file_path):
-                os.remove(local_file_path)
-            logger.info(f"Deleted local file: {local_file_path}")
-        except Exception as e:
-            logger.error(f"Error deleting local file {local_file_path}: {e}", exc_info=True)
-            # Continue with other deletions, but log the error
-
-        # 4. Delete the document record from PostgreSQL
-        db.delete(document)
-        db.commit() # Commit the transaction including chunk deletions
-        logger.info(f"Document record with ID {document_id} deleted from PostgreSQL.")
-
-        logger.info(f"Document ID {document_id} deleted successfully for user {current_user.id}.")
-        return {"message": f"Document with ID {document_id} deleted successfully"}
-
+            .returning(models.Document.id)
+        )
+        replaced = result.scalar() is not None
+        await db.commit()
     except SQLAlchemyError as e:
-        db.rollback() # Rollback DB changes if deleting the main document fails
-        logger.error(f"Database error deleting document record {document_id}: {e}", exc_info=True)
+        await db.rollback()
+        logger.error(f"Database error replacing document {document_id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to update document record in database")
+    if not replaced:
+        # The new path is unique to this request, so no other document can be using it
+        if os.path.exists(local_file_path):
+            os.remove(local_file_path)
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found or you don't have permission to modify it")
+    await remove_unreferenced_file(db, previous_path)
+    answer_cache.invalidate_document(current_user.id, document_id)
+    try:
+        ingestion_pool.enqueue(document_id)
+    except IngestionQueueFull as e:
+        logger.warning(f"Ingestion queue full, rejecting replacement of document {document_id}: {e}")
+        await db.execute(
+            update(models.Document)
+            .where(models.Document.id == document_id, models.Document.status == STATUS_UPLOADED)
+            .values(status=STATUS_FAILED, error_message=str(e))
+        )
+        await db.commit()
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Ingestion queue is full. Please retry later.")
+    return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={
+        "message": "Document replaced and queued for incremental re-indexing",
+        "document_id": document_id,
+        "filename": file.filename,
+        "status": STATUS_UPLOADED
+    })
+
+async def mark_documents_deleting(db: AsyncSession, owner_id: int, document_ids: List[int]) -> List[int]:
+    """Flag the user's documents as deleting in one statement; returns the ids that were flagged."""
+    result = await db.execute(
+        update(models.Document)
+        .where(models.Document.id.in_(document_ids), models.Document.owner_id == owner_id, models.Document.status != STATUS_DELETING)
+        .values(status=STATUS_DELETING)
+        .returning(models.Document.id)
+    )
+    marked_ids = list(result.scalars())
+    await db.commit()
+    # Drop cached answers that used these documents as context
+    for document_id in marked_ids:
+        answer_cache.invalidate_document(owner_id, document_id)
+    return marked_ids
+
+@documents_router.delete("/{document_id}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_document(document_id: int, background_tasks: BackgroundTasks, current_user: UserPrincipal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    logger.info(f"User {current_user.id} attempting to delete document ID {document_id}.")
+    try:
+        marked_ids = await mark_documents_deleting(db, current_user.id, [document_id])
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"Database error marking document {document_id} for deletion: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to delete document record: {e}")
-    except Exception as e:
-        # Note: ES errors are logged but don't necessarily roll back the DB transaction
-        # The document record deletion is attempted last.
-        logger.error(f"Unexpected error during document deletion for ID {document_id}: {e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Failed to delete document: {e}")
+    if not marked_ids:
+        logger.warning(f"Delete failed: Document ID {document_id} not found or unauthorized for user {current_user.id}.")
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Document not found or you don't have permission to delete it")
+    # Chunks, index entries, the stored file and the record are removed after the response is sent
+    background_tasks.add_task(purge_documents, current_user.id, marked_ids)
+    logger.info(f"Document ID {document_id} marked for deletion for user {current_user.id}.")
+    return {"message": f"Document with ID {document_id} is being deleted", "document_id": document_id, "status": STATUS_DELETING}
+
+@documents_router.post("/bulk-delete", status_code=status.HTTP_202_ACCEPTED)
+async def bulk_delete_documents(delete_request: BulkDeleteRequest, background_tasks: BackgroundTasks, current_user: UserPrincipal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    document_ids = list(dict.fromkeys(delete_request.document_ids))
+    if len(document_ids) > MAX_BULK_DELETE:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"At most {MAX_BULK_DELETE} documents can be deleted per request")
+    logger.info(f"User {current_user.id} attempting to bulk delete {len(document_ids)} documents.")
+    try:
+        marked_ids = await mark_documents_deleting(db, current_user.id, document_ids) if document_ids else []
+    except SQLAlchemyError as e:
+        await db.rollback()
+        logger.error(f"Database error marking documents for bulk deletion (user {current_user.id}): {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to mark documents for deletion")
+    if marked_ids:
+        background_tasks.add_task(purge_documents, current_user.id, marked_ids)
+    logger.info(f"Marked {len(marked_ids)} of {len(document_ids)} documents for deletion for user {current_user.id}.")
+    return {
+        "message": f"{len(marked_ids)} documents are being deleted",
+        "deleting": marked_ids,
+        # Unknown, foreign or already-deleting ids
+        "skipped": [document_id for document_id in document_ids if document_id not in set(marked_ids)]
+    }
 
 # --- Main App Endpoints (Secured) ---
 
@@ -324,184 +566,180 @@ async def delete_document(document_id: int, current_user: models.User = Depends(
 class QueryRequest(BaseModel):
     query: str
 
-@app.post("/upload/")
-async def upload_document(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+@app.post("/upload/", status_code=status.HTTP_202_ACCEPTED)
+async def upload_document(file: UploadFile = File(...), db: AsyncSession = Depends(get_db), current_user: UserPrincipal = Depends(get_current_user)):
     logger.info(f"User {current_user.id} attempting to upload file: {file.filename}")
-    if embedding_model is None:
-        logger.error("Embedding model is not loaded.")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Server configuration error: Embedding model not loaded.")
-    logger.info(f"Starting processing for file: {file.filename}")
     try:
-        # Save file to local storage
-        user_dir = os.path.join(LOCAL_STORAGE_DIR, str(current_user.id))
-        os.makedirs(user_dir, exist_ok=True)
-        local_file_path = os.path.join(user_dir, file.filename)
-        with open(local_file_path, "wb") as f:
-            f.write(await file.read())
-        logger.info(f"Successfully saved file {file.filename} to local path {local_file_path}.")
+        # Save file to local storage, under a path of its own so other documents with this filename are untouched
+        local_file_path = upload_path(current_user.id, file.filename)
+        try:
+            file_size, content_hash = await save_upload(file, local_file_path)
+        except UploadTooLarge as e:
+            logger.warning(f"Upload rejected for user {current_user.id}: {e}")
+            raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+        logger.info(f"Successfully saved file {file.filename} ({file_size} bytes, sha256 {content_hash}) to local path {local_file_path}.")
         # Create a database record
         db_document = models.Document(
             filename=file.filename,
             storage_path=local_file_path,
+            content_type=file.content_type,
+            content_hash=content_hash,
+            size_bytes=file_size,
             owner_id=current_user.id,
-            status="uploaded"
+            status=STATUS_UPLOADED
         )
         try:
             db.add(db_document)
-            db.commit()
-            db.refresh(db_document)
+            await db.commit()
+            await db.refresh(db_document)
             logger.info(f"Created DB record for document {db_document.id} (user {current_user.id}).")
         except SQLAlchemyError as e:
-            db.rollback()
+            await db.rollback()
             logger.error(f"Database error creating document record for {file.filename} (user {current_user.id}): {e}", exc_info=True)
             # Clean up local file if DB commit fails
             if os.path.exists(local_file_path):
                 os.remove(local_file_path)
             raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create document record in database")
-        except Exception as e:
-            db.rollback()
-            logger.error(f"Unexpected error creating document record for {file.filename} (user {current_user.id}): {e}", exc_info=True)
-            if os.path.exists(local_file_path):
-                os.remove(local_file_path)
-            raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create document record in database")
-        # --- Parsing, Chunking, Embedding, and Indexing ---
-        parsed_elements = []
+        # --- Hand parsing, chunking, embedding and indexing to the ingestion workers ---
         try:
-            with open(local_file_path, "rb") as f:
-                content_type = file.content_type
-                logger.debug(f"Attempting to parse file {file.filename} with content type {content_type}.")
-                parsed_elements = partition(filename=local_file_path, content_type=content_type)
-            logger.info(f"Successfully parsed file {file.filename}. Found {len(parsed_elements)} elements.")
-        except Exception as parsing_error:
-            logger.error(f"Error parsing document {file.filename}: {parsing_error}", exc_info=True)
-            db_document.status = "parsing_failed"
-            db.commit()
-            parsed_elements = []
-        chunks_to_index = []
-        db_chunks_to_save = []
-        if parsed_elements:
-            logger.debug(f"Processing {len(parsed_elements)} parsed elements for chunking and embedding.")
-            for element in parsed_elements:
-                text = str(element)
-                metadata = element.metadata.to_dict() if hasattr(element, 'metadata') and element.metadata else {}
-                metadata["filename"] = file.filename
-                metadata["local_path"] = local_file_path
-                metadata["document_db_id"] = db_document.id
-                metadata["owner_id"] = current_user.id
-                metadata_json = json.dumps(metadata)
-                chunks = text_splitter.create_documents([text], metadatas=[metadata])
-                logger.debug(f"Split element into {len(chunks)} chunks.")
-                for chunk in chunks:
-                    try:
-                        if embedding_model is None:
-                            raise Exception("Embedding model not loaded.")
-                        chunk_embedding = embedding_model.encode(chunk.page_content).tolist()
-                        logger.debug("Generated embedding for a chunk.")
-                        chunks_to_index.append({
-                            "chunk_text": chunk.page_content,
-                            "metadata": chunk.metadata
-                        })
-                        db_chunks_to_save.append(
-                            models.DocumentChunk(
-                                document_id=db_document.id,
-                                chunk_text=chunk.page_content,
-                                metadata=metadata_json
-                            )
-                        )
-                    except Exception as chunk_processing_error:
-                        logger.error(f"Error processing chunk for document ID {db_document.id}: {chunk_processing_error}", exc_info=True)
-                        continue
-            if db_chunks_to_save:
-                try:
-                    db.add_all(db_chunks_to_save)
-                    logger.info(f"Prepared {len(db_chunks_to_save)} chunks for saving to PostgreSQL for document ID {db_document.id}.")
-                except SQLAlchemyError as e:
-                    logger.error(f"Database error saving chunks for document ID {db_document.id}: {e}", exc_info=True)
-                    db.rollback()
-                    db_document.status = "db_save_failed"
-                    db.add(db_document)
-                    db.commit()
-                    raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save document chunks to database")
-                except Exception as e:
-                    logger.error(f"Unexpected error saving chunks for document ID {db_document.id}: {e}", exc_info=True)
-                    db.rollback()
-                    db_document.status = "db_save_failed"
-                    db.add(db_document)
-                    db.commit()
-                    raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to save document chunks to database")
-            if chunks_to_index:
-                try:
-                    index_document_chunks(db_document.id, chunks_to_index)
-                    logger.info(f"Indexed {len(chunks_to_index)} chunks in Elasticsearch for document ID {db_document.id}.")
-                except ElasticsearchException as e:
-                    logger.error(f"Elasticsearch indexing failed for document ID {db_document.id}: {e}", exc_info=True)
-                    db.rollback()
-                    db_document.status = "es_indexing_failed"
-                    db.add(db_document)
-                    db.commit()
-                    # Clean up local file if indexing fails
-                    if os.path.exists(local_file_path):
-                        os.remove(local_file_path)
-                    raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to index document in search engine")
-                except Exception as e:
-                    logger.error(f"Unexpected error during Elasticsearch indexing for document ID {db_document.id}: {e}", exc_info=True)
-                    db.rollback()
-                    db_document.status = "es_indexing_failed"
-                    db.add(db_document)
-                    db.commit()
-                    if os.path.exists(local_file_path):
-                        os.remove(local_file_path)
-                    raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to index document in search engine")
-            db_document.status = "processed"
-            db.commit()
-            logger.info(f"Document {db_document.id} processed successfully.")
-            return JSONResponse(status_code=status.HTTP_201_CREATED, content={
-                "message": "Document uploaded and processed successfully",
-                "document_id": db_document.id,
-                "filename": db_document.filename,
-                "status": db_document.status
-            })
+            ingestion_pool.enqueue(db_document.id)
+        except IngestionQueueFull as e:
+            logger.warning(f"Ingestion queue full, rejecting document {db_document.id}: {e}")
+            db_document.status = STATUS_FAILED
+            db_document.error_message = str(e)
+            await db.commit()
+            raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Ingestion queue is full. Please retry later.")
+        return JSONResponse(status_code=status.HTTP_202_ACCEPTED, content={
+            "message": "Document uploaded and queued for processing",
+            "document_id": db_document.id,
+            "filename": db_document.filename,
+            "status": db_document.status
+        })
     except HTTPException as e:
         raise e
     except Exception as e:
         logger.error(f"Unhandled error during document upload for {file.filename}: {e}", exc_info=True)
-        # Clean up local file if a general error occurred before final commit
+        # Clean up local file if a general error occurred before the job was queued
         if 'local_file_path' in locals() and os.path.exists(local_file_path):
             os.remove(local_file_path)
-        db.rollback()
-        if 'db_document' in locals() and db_document.status != "processed":
-            db_document.status = "failed_unhandled_error"
+        await db.rollback()
+        if 'db_document' in locals() and db_document.id is not None:
+            db_document.status = STATUS_FAILED
+            db_document.error_message = str(e)[:1000]
             db.add(db_document)
             try:
-                db.commit()
-                logger.warning(f"Document {db_document.id} status updated to failed_unhandled_error.")
+                await db.commit()
+                logger.warning(f"Document {db_document.id} status updated to failed.")
             except Exception as db_update_e:
-                logger.error(f"Failed to update document status to failed_unhandled_error for {db_document.id}: {db_update_e}", exc_info=True)
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred during document processing: {e}")
+                logger.error(f"Failed to update document status to failed for {db_document.id}: {db_update_e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"An unexpected error occurred during document upload: {e}")
+
+class PreparedQuery(BaseModel):
+    prompt: str
+    query_embedding: List[float]
+    document_versions: dict # document id -> content hash of every document that contributed context
+    sources: List[dict] # {"document_db_id", "filename"} per document cited in the context, in citation order
+
+async def prepare_query(db: AsyncSession, owner_id: int, question: str) -> PreparedQuery:
+    # Embed the question and retrieve the top-k chunks owned by the user (BM25 + vector, fused)
+    with time_stage("query_embed"):
+        query_embedding = (await embedding_service.encode(question)).tolist()
+    # Over-fetch candidates; the context assembler picks a diverse subset that fits the token budget
+    with time_stage("retrieval"):
+        retrieved = await hybrid_retrieve(db, owner_id, question, query_embedding, top_k=max(RETRIEVAL_TOP_K, CONTEXT_CANDIDATES))
+    logger.info(f"Retrieved {len(retrieved)} chunks for query from user {owner_id}.")
+    document_ids = {chunk.document_id for chunk, _score in retrieved}
+    document_rows = (await db.execute(
+        select(models.Document.id, models.Document.filename, models.Document.content_hash).where(models.Document.id.in_(document_ids))
+    )).all() if document_ids else []
+    filenames = {row.id: row.filename for row in document_rows}
+    with time_stage("context"):
+        context = assemble_context(query_embedding, retrieved, filenames)
+    cited_ids = {source.document_db_id for source in context.sources}
+    document_versions = {row.id: row.content_hash for row in document_rows if row.id in cited_ids}
+    prompt = build_prompt(question, context.text)
+    return PreparedQuery(prompt=prompt, query_embedding=query_embedding, document_versions=document_versions,
+                         sources=[source.dict() for source in context.sources])
+
+def ensure_query_models_loaded():
+    if not startup_finished.is_set():
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Service is starting up. Please retry shortly.", headers={"Retry-After": "5"})
+    if llm is None:
+        logger.error("LLM not initialized for query.")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Gemini model not initialized.")
+    if embedding_model is None:
+        logger.error("Embedding model not loaded for query.")
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Server configuration error: Embedding model not loaded.")
 
 @app.post("/query/")
-async def query_documents(query_request: QueryRequest, current_user: models.User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def query_documents(query_request: QueryRequest, current_user: UserPrincipal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     logger.info(f"User {current_user.id} submitting query: {query_request.query[:100]}...")
-    global gemini_model
-    if gemini_model is None:
-        logger.error("Gemini model not initialized for query.")
-        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Gemini model not initialized.")
+    ensure_query_models_loaded()
     try:
-        # Retrieve relevant chunks for the user from the database (simple RAG)
-        # For now, fetch all chunks for the user's documents (can be improved with vector search)
-        user_documents = db.query(models.Document).filter(models.Document.owner_id == current_user.id).all()
-        document_ids = [doc.id for doc in user_documents]
-        chunks = db.query(models.DocumentChunk).filter(models.DocumentChunk.document_id.in_(document_ids)).all()
-        context = "\n".join([chunk.chunk_text for chunk in chunks])
-        prompt = f"You are an assistant for question-answering tasks. Use the following context to answer the question. If you don't know the answer, say so.\n\nContext:\n{context}\n\nQuestion: {query_request.query}\n\nAnswer:"
-        response = gemini_model.generate_content(prompt)
-        answer_text = response.text if hasattr(response, 'text') else str(response)
+        prepared = await prepare_query(db, current_user.id, query_request.query)
+        # End the transaction (opened by SET LOCAL) and return the connection before the multi-second LLM call
+        await db.close()
+        cached_answer = answer_cache.get(current_user.id, prepared.document_versions, prepared.query_embedding)
+        if cached_answer is not None:
+            logger.info(f"Query for user {current_user.id} served from answer cache.")
+            return {"answer": cached_answer, "cached": True, "sources": prepared.sources}
+        with time_stage("llm"):
+            answer_text = await run_in_threadpool(llm.generate, prepared.prompt)
+        answer_cache.set(current_user.id, prepared.document_versions, prepared.query_embedding, answer_text)
         logger.info(f"Query processed for user {current_user.id}. Answer generated.")
-        return {"answer": answer_text}
+        return {"answer": answer_text, "cached": False, "sources": prepared.sources}
     except Exception as e:
         logger.error(f"Error during query processing for user {current_user.id}: {e}", exc_info=True)
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred during query processing.")
 
+def format_sse(data: dict, event: Optional[str] = None) -> str:
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
+
+@app.post("/query/stream")
+async def query_documents_stream(query_request: QueryRequest, current_user: UserPrincipal = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    """Same as /query/, but streams the answer as Server-Sent Events while it is generated."""
+    request_start = time.perf_counter()
+    logger.info(f"User {current_user.id} submitting streaming query: {query_request.query[:100]}...")
+    ensure_query_models_loaded()
+    try:
+        prepared = await prepare_query(db, current_user.id, query_request.query)
+        # The stream can run for many seconds; it must not hold a pooled connection idle in transaction
+        await db.close()
+        cached_answer = answer_cache.get(current_user.id, prepared.document_versions, prepared.query_embedding)
+    except Exception as e:
+        logger.error(f"Error preparing streaming query for user {current_user.id}: {e}", exc_info=True)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="An error occurred during query processing.")
+
+    async def event_stream():
+        first_token_at = None
+        token_count = 0
+        tokens = []
+        try:
+            if cached_answer is not None:
+                logger.info(f"Streaming query for user {current_user.id} served from answer cache.")
+                yield format_sse({"token": cached_answer, "cached": True})
+                yield format_sse({"tokens": 1, "cached": True, "sources": prepared.sources}, event="done")
+                return
+            # The LLM client's iterator blocks, so each next() runs in the threadpool
+            llm_started = time.perf_counter()
+            async for token in iterate_in_threadpool(llm.stream(prepared.prompt)):
+                if first_token_at is None:
+                    first_token_at = time.perf_counter()
+                    logger.info(f"Streaming query for user {current_user.id}: time to first token {(first_token_at - request_start) * 1000:.1f} ms.")
+                token_count += 1
+                tokens.append(token)
+                yield format_sse({"token": token})
+            STAGE_SECONDS.labels(stage="llm").observe(time.perf_counter() - llm_started)
+            answer_cache.set(current_user.id, prepared.document_versions, prepared.query_embedding, "".join(tokens))
+            yield format_sse({"tokens": token_count, "sources": prepared.sources}, event="done")
+            logger.info(f"Streaming query completed for user {current_user.id}: {token_count} tokens in {(time.perf_counter() - request_start) * 1000:.1f} ms.")
+        except Exception as e:
+            logger.error(f"Error during streaming query for user {current_user.id}: {e}", exc_info=True)
+            yield format_sse({"detail": "An error occurred during query processing."}, event="error")
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 # Include routers
 app.include_router(auth_router)
 app.include_router(documents_router) 
\ No newline at end of file
@@ -0,0 +1,86 @@
+import os
+import sys
+import logging
+from typing import Dict, List, Union
+from .metrics import WORKER_MEMORY_BYTES
+
+logger = logging.getLogger(__name__)
+
+# smaps_rollup fields (kB) summed into each reported figure
+_MEMORY_FIELDS = {
+    "rss": ("Rss",),
+    "pss": ("Pss",),
+    "shared": ("Shared_Clean", "Shared_Dirty"),
+    "private": ("Private_Clean", "Private_Dirty"),
+}
+
+def process_memory(pid: Union[int, str] = "self") -> Dict[str, int]:
+    """RSS, PSS, shared and private bytes of a process from /proc/<pid>/smaps_rollup (Linux only; {} elsewhere).
+
+    PSS splits each shared page between the processes mapping it, so summing PSS over the
+    workers gives their real combined footprint while summing RSS counts shared weights N times.
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            values = {}
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                    values[parts[0][:-1]] = int(parts[1]) * 1024
+    except OSError:
+        return {}
+    return {kind: sum(values.get(field, 0) for field in fields) for kind, fields in _MEMORY_FIELDS.items()}
+
+def _descendant_pids(pid: int) -> List[int]:
+    """Children, grandchildren, ... of pid (e.g. a worker's parse and embedding pool processes)."""
+    pids = []
+    for child in _child_pids(pid):
+        pids.append(child)
+        pids.extend(_descendant_pids(child))
+    return pids
+
+def update_memory_metrics():
+    for kind, value in process_memory().items():
+        WORKER_MEMORY_BYTES.labels(kind=kind).set(value)
+    # Pool processes started by this worker count towards its footprint
+    children = [process_memory(pid) for pid in _descendant_pids(os.getpid())]
+    for kind in ("rss", "pss"):
+        WORKER_MEMORY_BYTES.labels(kind=f"children_{kind}").set(sum(memory.get(kind, 0) for memory in children))
+
+def log_process_memory(label: str):
+    memory = process_memory()
+    if memory:
+        logger.info(f"{label} (pid {os.getpid()}): RSS {memory['rss'] / 1024 ** 2:.1f} MiB, PSS {memory['pss'] / 1024 ** 2:.1f} MiB, shared {memory['shared'] / 1024 ** 2:.1f} MiB.")
+
+def _child_pids(pid: int) -> List[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(child) for child in f.read().split()]
+    except OSError:
+        return []
+
+def report(master_pid: int):
+    """Print per-process and total memory for a gunicorn master, its workers and their pool processes."""
+    workers = _child_pids(master_pid)
+    roles = {master_pid: "master"}
+    for worker in workers:
+        roles[worker] = "worker"
+        for pid in _descendant_pids(worker):
+            roles[pid] = "pool"
+    totals = {kind: 0 for kind in _MEMORY_FIELDS}
+    print(f"{'pid':>8} {'role':>8} {'rss MiB':>10} {'pss MiB':>10} {'shared MiB':>11} {'private MiB':>12}")
+    for pid, role in roles.items():
+        memory = process_memory(pid)
+        if not memory:
+            continue
+        for kind in totals:
+            totals[kind] += memory[kind]
+        print(f"{pid:>8} {role:>8} {memory['rss'] / 1024 ** 2:>10.1f} {memory['pss'] / 1024 ** 2:>10.1f} {memory['shared'] / 1024 ** 2:>11.1f} {memory['private'] / 1024 ** 2:>12.1f}")
+    print(f"{'total':>17} {totals['rss'] / 1024 ** 2:>10.1f} {totals['pss'] / 1024 ** 2:>10.1f} {totals['shared'] / 1024 ** 2:>11.1f} {totals['private'] / 1024 ** 2:>12.1f}")
+
+if __name__ == "__main__":
+    # python -m backend.memory <gunicorn master pid>
+    if len(sys.argv) != 2 or not sys.argv[1].isdigit():
+        print("usage: python -m backend.memory <master_pid>", file=sys.stderr)
+        sys.exit(2)
+    report(int(sys.argv[1]))
@@ -0,0 +1,118 @@
+import os
+import time
+from contextlib import contextmanager
+from prometheus_client import CollectorRegistry, Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST, multiprocess
+
+# Set (by gunicorn.conf.py) when several worker processes serve /metrics: every process then writes its
+# samples to files in this directory and a scrape aggregates all of them instead of seeing one worker
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+# Content-addressed deduplication (hit rate = hits / (hits + misses))
+DEDUP_FILE_LOOKUPS = Counter(
+    "askmydocs_dedup_file_lookups_total",
+    "Parse-cache lookups by uploaded file hash",
+    ["result"],
+)
+DEDUP_CHUNK_LOOKUPS = Counter(
+    "askmydocs_dedup_chunk_lookups_total",
+    "Embedding-cache lookups by chunk text hash",
+    ["result"],
+)
+
+# Semantic answer cache
+ANSWER_CACHE_LOOKUPS = Counter(
+    "askmydocs_answer_cache_lookups_total",
+    "Answer-cache lookups for /query/",
+    ["result"],
+)
+
+# Incremental re-indexing: chunks kept, newly inserted or removed per ingestion
+REINDEX_CHUNKS = Counter(
+    "askmydocs_reindex_chunks_total",
+    "Chunks reused, inserted or deleted when (re)ingesting a document",
+    ["result"],
+)
+
+# Parsing throughput per format (pages/sec = rate(pages) / rate(seconds))
+PARSED_PAGES = Counter(
+    "askmydocs_parsed_pages_total",
+    "Pages parsed, by file format (non-paginated formats count as one page)",
+    ["format"],
+)
+PARSE_SECONDS = Counter(
+    "askmydocs_parse_seconds_total",
+    "Wall-clock seconds spent parsing, by file format",
+    ["format"],
+)
+
+# Per-stage timings of the ingestion pipeline (parse, split, embed, pg_write, es_bulk)
+# and of queries (query_embed, retrieval, context, llm)
+STAGE_SECONDS = Histogram(
+    "askmydocs_stage_seconds",
+    "Wall-clock seconds spent in each pipeline stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+# Query-time embedding micro-batches (how many concurrent questions share a forward pass)
+QUERY_EMBED_BATCH_SIZE = Histogram(
+    "askmydocs_query_embed_batch_size",
+    "Questions encoded per micro-batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128),
+)
+
+# Memory of the process serving the scrape; in multiprocess mode one series per pid, as of that worker's last scrape
+WORKER_MEMORY_BYTES = Gauge(
+    "askmydocs_worker_memory_bytes",
+    "Process memory from /proc/self/smaps_rollup: rss, pss, shared and private bytes; children_rss/children_pss sum the process's pool processes",
+    ["kind"],
+    multiprocess_mode="liveall",
+)
+
+# HTTP requests, labelled by route template so path parameters do not explode cardinality
+HTTP_REQUEST_SECONDS = Histogram(
+    "askmydocs_http_request_seconds",
+    "Request latency until the response headers are sent",
+    ["method", "route", "status"],
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "askmydocs_http_requests_in_flight",
+    "Requests currently being handled",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+HTTP_REQUEST_BYTES = Histogram(
+    "askmydocs_http_request_bytes",
+    "Request body size from Content-Length",
+    ["method", "route"],
+    buckets=(256, 1024, 16 * 1024, 256 * 1024, 1024 ** 2, 10 * 1024 ** 2, 50 * 1024 ** 2, 200 * 1024 ** 2),
+)
+HTTP_RESPONSE_BYTES = Histogram(
+    "askmydocs_http_response_bytes",
+    "Response body size from Content-Length (streamed responses are not counted)",
+    ["method", "route"],
+    buckets=(256, 1024, 16 * 1024, 256 * 1024, 1024 ** 2, 10 * 1024 ** 2),
+)
+
+@contextmanager
+def time_stage(stage: str):
+    """Observe the wall-clock duration of the enclosed block in STAGE_SECONDS, including on error."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(stage=stage).observe(time.perf_counter() - started)
+
+def record_lookups(counter: Counter, hits: int, misses: int):
+    if hits:
+        counter.labels(result="hit").inc(hits)
+    if misses:
+        counter.labels(result="miss").inc(misses)
+
+def render_metrics():
+    """Return the Prometheus exposition payload and its content type, aggregated over all workers in multiprocess mode."""
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,71 @@
+"""Bring the database schema and the Elasticsearch index up to date.
+
+    python -m backend.migrate
+
+PostgreSQL schemas are managed by the Alembic revisions in backend/migrations; other databases
+(local experiments) get a plain create_all. Every API process runs these steps on startup, but a
+PostgreSQL advisory lock lets only one process at a time do so, and later ones find nothing to do.
+Set RUN_MIGRATIONS=false to skip them at startup and run this module as a pre-start step instead.
+"""
+import os
+import logging
+from contextlib import contextmanager
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from .db.database import engine
+from .db import models
+from .elasticsearch_client import create_index_if_not_exists
+
+logger = logging.getLogger(__name__)
+
+ALEMBIC_CONFIG = os.path.join(os.path.dirname(__file__), "alembic.ini")
+# Run schema and index migrations when an API process starts
+RUN_MIGRATIONS = os.getenv("RUN_MIGRATIONS", "true").lower() == "true"
+# Key of the PostgreSQL advisory lock serializing migrations across processes
+MIGRATION_LOCK_KEY = 7300
+
+@contextmanager
+def migration_lock():
+    """Yield a connection holding the migration lock (waiting for it without a statement timeout)."""
+    with engine.connect() as connection:
+        if engine.dialect.name == "postgresql":
+            connection.execute(text("SET statement_timeout = 0"))
+            connection.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            connection.commit()
+        try:
+            yield connection
+        finally:
+            if engine.dialect.name == "postgresql":
+                try:
+                    connection.rollback()
+                    connection.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+                    # Back to the engine's statement_timeout before the connection returns to the pool
+                    connection.execute(text("RESET statement_timeout"))
+                    connection.commit()
+                except SQLAlchemyError as e:
+                    # Discarding the connection ends its session, which releases the lock
+                    logger.warning(f"Could not release the migration lock cleanly: {e}")
+                    connection.invalidate()
+
+def upgrade_database():
+    with migration_lock() as connection:
+        if engine.dialect.name != "postgresql":
+            models.Base.metadata.create_all(bind=connection)
+            connection.commit()
+            return
+        from alembic import command
+        from alembic.config import Config
+        config = Config(ALEMBIC_CONFIG)
+        config.attributes["connection"] = connection
+        command.upgrade(config, "head")
+    logger.info("Database schema is at the latest migration.")
+
+def upgrade_search_index():
+    # Held so that only one process reindexes into a new mapping version
+    with migration_lock():
+        create_index_if_not_exists()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade_database()
+    upgrade_search_index()
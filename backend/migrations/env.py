@@ -0,0 +1,34 @@
+from alembic import context
+from sqlalchemy import text
+from backend.db.database import engine, Base
+from backend.db import models  # noqa: F401 -- registers the tables on Base.metadata
+
+config = context.config
+target_metadata = Base.metadata
+
+def _run_migrations(connection):
+    # Migrations may rewrite large tables and build indexes: lift the API's statement timeout for this session
+    connection.execute(text("SET statement_timeout = 0"))
+    connection.commit()
+    context.configure(connection=connection, target_metadata=target_metadata)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_offline():
+    context.configure(url=engine.url.render_as_string(hide_password=False), target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online():
+    # backend.migrate passes in a connection that already holds the migration lock
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        _run_migrations(connection)
+        return
+    with engine.connect() as connection:
+        _run_migrations(connection)
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,55 @@
+"""Baseline schema (users, documents, document_chunks) as created by create_all before migrations existed.
+
+Every statement is IF NOT EXISTS, so the revision applies cleanly to databases that already have these tables.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id SERIAL PRIMARY KEY,
+            username VARCHAR NOT NULL,
+            email VARCHAR NOT NULL,
+            hashed_password VARCHAR NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_users_id ON users (id)")
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_username ON users (username)")
+    op.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS documents (
+            id SERIAL PRIMARY KEY,
+            filename VARCHAR NOT NULL,
+            storage_path VARCHAR NOT NULL,
+            upload_timestamp TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            status VARCHAR,
+            owner_id INTEGER REFERENCES users (id)
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_documents_id ON documents (id)")
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS document_chunks (
+            id SERIAL PRIMARY KEY,
+            document_id INTEGER NOT NULL REFERENCES documents (id),
+            chunk_text VARCHAR NOT NULL,
+            chunk_metadata VARCHAR
+        )
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_document_chunks_id ON document_chunks (id)")
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS document_chunks")
+    op.execute("DROP TABLE IF EXISTS documents")
+    op.execute("DROP TABLE IF EXISTS users")
@@ -0,0 +1,67 @@
+"""Columns, indexes and tables added since the baseline: chunk embeddings (HNSW), text/content hashes,
+upload metadata, ingestion errors, the document list index and the embedding cache.
+
+create_all only creates missing tables, so deployments that predate these columns never got them.
+Existing chunks keep embedding = NULL (and are skipped by vector search) until they are backfilled
+with `python -m backend.backfill`.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+from backend.db.models import EMBEDDING_DIMENSION
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS vector")
+    op.execute("""
+        ALTER TABLE documents
+            ADD COLUMN IF NOT EXISTS content_type VARCHAR,
+            ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64),
+            ADD COLUMN IF NOT EXISTS size_bytes INTEGER,
+            ADD COLUMN IF NOT EXISTS error_message VARCHAR
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_documents_content_hash ON documents (content_hash)")
+    op.execute("CREATE INDEX IF NOT EXISTS ix_documents_owner_upload ON documents (owner_id, upload_timestamp)")
+    op.execute(f"""
+        ALTER TABLE document_chunks
+            ADD COLUMN IF NOT EXISTS text_hash VARCHAR(64),
+            ADD COLUMN IF NOT EXISTS embedding vector({int(EMBEDDING_DIMENSION)})
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_document_chunks_document_id ON document_chunks (document_id)")
+    # Existing rows have no embedding yet, so building the index here is cheap
+    op.execute("""
+        CREATE INDEX IF NOT EXISTS ix_document_chunks_embedding_hnsw ON document_chunks
+        USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64)
+    """)
+    op.execute(f"""
+        CREATE TABLE IF NOT EXISTS embedding_cache (
+            model_name VARCHAR NOT NULL,
+            text_hash VARCHAR(64) NOT NULL,
+            embedding vector({int(EMBEDDING_DIMENSION)}) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            PRIMARY KEY (model_name, text_hash)
+        )
+    """)
+
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS embedding_cache")
+    op.execute("DROP INDEX IF EXISTS ix_document_chunks_embedding_hnsw")
+    op.execute("DROP INDEX IF EXISTS ix_document_chunks_document_id")
+    op.execute("ALTER TABLE document_chunks DROP COLUMN IF EXISTS embedding, DROP COLUMN IF EXISTS text_hash")
+    op.execute("DROP INDEX IF EXISTS ix_documents_owner_upload")
+    op.execute("DROP INDEX IF EXISTS ix_documents_content_hash")
+    op.execute("""
+        ALTER TABLE documents
+            DROP COLUMN IF EXISTS error_message,
+            DROP COLUMN IF EXISTS size_bytes,
+            DROP COLUMN IF EXISTS content_hash,
+            DROP COLUMN IF EXISTS content_type
+    """)
@@ -0,0 +1,58 @@
+"""Store chunk metadata as compact jsonb without the document-level fields repeated on every chunk.
+
+Rewrites document_chunks (and rebuilds its indexes, including HNSW) under an ACCESS EXCLUSIVE lock,
+so run it in a maintenance window on large tables. Legacy values that jsonb rejects (NaN/Infinity
+written by json.dumps, \\u0000) are repaired where possible and set to NULL otherwise.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+from sqlalchemy import text
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+COMPACT_METADATA_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION askmydocs_compact_chunk_metadata(raw text) RETURNS jsonb LANGUAGE plpgsql IMMUTABLE AS $$
+DECLARE
+    parsed jsonb;
+BEGIN
+    IF raw IS NULL OR raw = '' THEN
+        RETURN NULL;
+    END IF;
+    BEGIN
+        parsed := raw::jsonb;
+    EXCEPTION WHEN others THEN
+        BEGIN
+            parsed := regexp_replace(replace(raw, '\u0000', ''), '-?\mInfinity\M|\mNaN\M', 'null', 'g')::jsonb;
+        EXCEPTION WHEN others THEN
+            RETURN NULL;
+        END;
+    END;
+    IF jsonb_typeof(parsed) <> 'object' THEN
+        RETURN parsed;
+    END IF;
+    RETURN parsed - 'filename' - 'local_path' - 'document_db_id' - 'owner_id';
+END;
+$$
+"""
+
+
+def upgrade():
+    column_type = op.get_bind().execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_name = 'document_chunks' AND column_name = 'chunk_metadata'"
+    )).scalar()
+    if column_type == "jsonb":
+        return
+    op.execute(COMPACT_METADATA_FUNCTION)
+    op.execute("ALTER TABLE document_chunks ALTER COLUMN chunk_metadata TYPE jsonb USING askmydocs_compact_chunk_metadata(chunk_metadata)")
+    op.execute("DROP FUNCTION askmydocs_compact_chunk_metadata(text)")
+
+
+def downgrade():
+    op.execute("ALTER TABLE document_chunks ALTER COLUMN chunk_metadata TYPE varchar USING chunk_metadata::text")
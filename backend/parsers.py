@@ -0,0 +1,295 @@
+import os
+import csv
+import time
+import signal
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional, Tuple
+from .metrics import PARSED_PAGES, PARSE_SECONDS
+from .memory import process_memory
+
+logger = logging.getLogger(__name__)
+
+# Processes used for unstructured partitioning; 0 runs it inline in the calling thread, where neither
+# PARSE_TIMEOUT nor PARSE_MEMORY_LIMIT_MB can be enforced
+PARSE_PROCESS_WORKERS = int(os.getenv("PARSE_PROCESS_WORKERS", 2))
+# Wall-clock limit for parsing one document in the process pool
+PARSE_TIMEOUT = float(os.getenv("PARSE_TIMEOUT", 300))
+# Resident memory (RSS) limit per parse process in MB; a process over it is killed and its document fails (0 disables)
+PARSE_MEMORY_LIMIT_MB = int(os.getenv("PARSE_MEMORY_LIMIT_MB", 2048))
+# How often parse process memory is checked against PARSE_MEMORY_LIMIT_MB, in seconds
+PARSE_MEMORY_POLL_INTERVAL = 1.0
+# PDFs longer than this are split into page ranges of this size and partitioned in parallel
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", 10))
+# CSV rows grouped into one element by the fast CSV parser
+CSV_ROWS_PER_ELEMENT = int(os.getenv("CSV_ROWS_PER_ELEMENT", 50))
+
+Element = Tuple[str, dict] # (element_text, element_metadata)
+
+class ParseTimeout(Exception):
+    """Raised when a document takes longer than PARSE_TIMEOUT to parse."""
+
+# --- Lightweight parsers for simple formats, keyed by file extension ---
+
+_fast_parsers: Dict[str, Callable[[str], List[Element]]] = {}
+
+def register_parser(*extensions: str):
+    """Register a streaming parser for the given extensions, bypassing unstructured."""
+    def decorator(fn):
+        for extension in extensions:
+            _fast_parsers[extension.lower()] = fn
+        return fn
+    return decorator
+
+def _paragraphs(path: str):
+    # Yields blank-line separated paragraphs without reading the whole file into memory
+    lines = []
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if line.strip():
+                lines.append(line.rstrip("\n"))
+            elif lines:
+                yield "\n".join(lines)
+                lines = []
+    if lines:
+        yield "\n".join(lines)
+
+@register_parser(".txt", ".text", ".log")
+def parse_plain_text(path: str) -> List[Element]:
+    return [(paragraph, {"category": "NarrativeText", "filetype": "text/plain"}) for paragraph in _paragraphs(path)]
+
+@register_parser(".md", ".markdown")
+def parse_markdown(path: str) -> List[Element]:
+    elements = []
+    for paragraph in _paragraphs(path):
+        # A heading line starts its own Title element; the rest of the paragraph follows as text
+        first_line, _, rest = paragraph.partition("\n")
+        if first_line.lstrip().startswith("#"):
+            elements.append((first_line.lstrip("# ").strip(), {"category": "Title", "filetype": "text/markdown"}))
+            if rest.strip():
+                elements.append((rest, {"category": "NarrativeText", "filetype": "text/markdown"}))
+        else:
+            elements.append((paragraph, {"category": "NarrativeText", "filetype": "text/markdown"}))
+    return elements
+
+@register_parser(".csv")
+def parse_csv(path: str) -> List[Element]:
+    elements = []
+    with open(path, "r", encoding="utf-8", errors="replace", newline="") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return elements
+        rows = []
+        for row in reader:
+            rows.append(row)
+            if len(rows) >= CSV_ROWS_PER_ELEMENT:
+                elements.append(_csv_element(header, rows))
+                rows = []
+        if rows or not elements:
+            elements.append(_csv_element(header, rows))
+    return elements
+
+def _csv_element(header: List[str], rows: List[List[str]]) -> Element:
+    # Repeat the header in every block so each chunk stays self-describing
+    text = "\n".join([", ".join(header)] + [", ".join(row) for row in rows])
+    return text, {"category": "Table", "filetype": "text/csv"}
+
+# --- unstructured partitioning (process pool) ---
+
+def _raise_timeout(signum, frame):
+    raise ParseTimeout("Parsing exceeded its time limit")
+
+def parse_with_unstructured(file_path: str, content_type: Optional[str], timeout: float = PARSE_TIMEOUT, page_offset: int = 0) -> List[Element]:
+    """Partition a file with unstructured; returns (element_text, element_metadata) pairs.
+
+    Runs inside a parse worker process, where SIGALRM enforces the deadline on the worker itself.
+    """
+    use_alarm = hasattr(signal, "SIGALRM") and threading.current_thread() is threading.main_thread()
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, max(timeout, 0.001))
+    try:
+        from unstructured.partition.auto import partition
+        parsed_elements = partition(filename=file_path, content_type=content_type)
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    elements = []
+    for element in parsed_elements:
+        metadata = element.metadata.to_dict() if hasattr(element, 'metadata') and element.metadata else {}
+        # Path-specific fields are re-added per document so parse output can be shared by content hash
+        metadata.pop("filename", None)
+        metadata.pop("file_directory", None)
+        if page_offset and metadata.get("page_number"):
+            metadata["page_number"] += page_offset
+        elements.append((str(element), metadata))
+    return elements
+
+def split_pdf(file_path: str, pages_per_part: int, output_dir: str) -> List[Tuple[str, int]]:
+    """Write page ranges of a PDF to output_dir; returns (part_path, page_offset) pairs, or [] if no split is needed."""
+    from pypdf import PdfReader, PdfWriter
+    reader = PdfReader(file_path)
+    page_count = len(reader.pages)
+    if page_count <= pages_per_part:
+        return []
+    parts = []
+    for start in range(0, page_count, pages_per_part):
+        writer = PdfWriter()
+        for page in reader.pages[start:start + pages_per_part]:
+            writer.add_page(page)
+        part_path = os.path.join(output_dir, f"part_{start:06d}.pdf")
+        with open(part_path, "wb") as f:
+            writer.write(f)
+        parts.append((part_path, start))
+    return parts
+
+def _count_pages(elements: List[Element]) -> int:
+    page_numbers = [metadata.get("page_number") for _, metadata in elements if metadata.get("page_number")]
+    return max(page_numbers) if page_numbers else 1
+
+class DocumentParser:
+    """Routes documents to a fast parser or to unstructured running in a memory-limited process pool.
+
+    Deadlines and memory limits only apply in the pool. The fast parsers stream simple formats in
+    linear time (bounded by MAX_UPLOAD_SIZE) and run unguarded in the calling thread, as does
+    unstructured when num_processes is 0: a thread cannot be interrupted, so there a pathological
+    document keeps its ingestion worker busy until it finishes.
+    """
+
+    def __init__(self, num_processes: int = PARSE_PROCESS_WORKERS):
+        self._num_processes = num_processes
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        if self._num_processes > 0:
+            with self._lock:
+                self._pool = self._create_pool()
+        else:
+            logger.warning("PARSE_PROCESS_WORKERS=0: documents are parsed inline, without PARSE_TIMEOUT or PARSE_MEMORY_LIMIT_MB.")
+
+    def stop(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+
+    def _create_pool(self) -> ProcessPoolExecutor:
+        # spawn avoids forking a process that already holds torch/thread state
+        return ProcessPoolExecutor(
+            max_workers=self._num_processes,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+    def parse(self, file_path: str, content_type: Optional[str]) -> List[Element]:
+        extension = os.path.splitext(file_path)[1].lower()
+        started = time.perf_counter()
+        fast_parser = _fast_parsers.get(extension)
+        if fast_parser is not None:
+            parser_format = extension.lstrip(".")
+            elements = fast_parser(file_path)
+        else:
+            parser_format = extension.lstrip(".") or "unknown"
+            elements = self._parse_unstructured(file_path, content_type, extension)
+        elapsed = time.perf_counter() - started
+        pages = _count_pages(elements)
+        PARSED_PAGES.labels(format=parser_format).inc(pages)
+        PARSE_SECONDS.labels(format=parser_format).inc(elapsed)
+        logger.info(f"Parsed {os.path.basename(file_path)} ({parser_format}): {len(elements)} elements, {pages} pages in {elapsed:.2f}s ({pages / elapsed if elapsed else 0:.1f} pages/sec).")
+        return elements
+
+    def _parse_unstructured(self, file_path: str, content_type: Optional[str], extension: str) -> List[Element]:
+        if self._pool is None:
+            # SIGALRM only works on the main thread, so ingestion threads parse here without a deadline
+            return parse_with_unstructured(file_path, content_type)
+        deadline = time.monotonic() + PARSE_TIMEOUT
+        with tempfile.TemporaryDirectory(prefix="askmydocs-parse-") as temp_dir:
+            parts = []
+            if extension == ".pdf":
+                try:
+                    parts = split_pdf(file_path, PDF_PAGES_PER_TASK, temp_dir)
+                except Exception as e:
+                    logger.warning(f"Could not split {file_path} into page ranges, parsing as one task: {e}")
+            if not parts:
+                parts = [(file_path, 0)]
+            while True:
+                pool = self._pool
+                try:
+                    return self._run_parts(pool, file_path, content_type, parts, deadline)
+                except BrokenProcessPool:
+                    if self._pool is not None and self._pool is not pool and time.monotonic() < deadline:
+                        # Another document's timeout replaced the pool under us; this document did nothing wrong
+                        logger.info(f"Parse pool was restarted while parsing {file_path}; retrying on the new pool.")
+                        continue
+                    raise
+
+    def _run_parts(self, pool: ProcessPoolExecutor, file_path: str, content_type: Optional[str],
+                   parts: List[Tuple[str, int]], deadline: float) -> List[Element]:
+        remaining = max(deadline - time.monotonic(), 0.001)
+        try:
+            futures = [
+                pool.submit(parse_with_unstructured, part_path, content_type, remaining, page_offset)
+                for part_path, page_offset in parts
+            ]
+            # Workers enforce the deadline themselves; the grace period covers process start-up
+            done, not_done = self._wait(pool, futures, remaining + 30)
+        except BrokenProcessPool:
+            self._restart_pool(pool)
+            raise
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                for pending in not_done:
+                    pending.cancel()
+                if isinstance(error, BrokenProcessPool):
+                    # A worker died: killed for exceeding PARSE_MEMORY_LIMIT_MB, OOM-killed or crashed
+                    self._restart_pool(pool)
+                raise error
+        if not_done:
+            # cancel() cannot stop running futures, and SIGALRM is deferred while a worker is stuck in C code:
+            # kill the workers so the stuck parse does not keep its slot and time out the documents behind it
+            self._restart_pool(pool, terminate=True)
+            raise ParseTimeout(f"Parsing {file_path} exceeded {PARSE_TIMEOUT}s")
+        elements = []
+        for future in futures:
+            elements.extend(future.result())
+        return elements
+
+    def _wait(self, pool: ProcessPoolExecutor, futures, timeout: float):
+        """wait(FIRST_EXCEPTION) that also kills pool processes whose RSS exceeds PARSE_MEMORY_LIMIT_MB.
+
+        The kill breaks the pool, so the document fails with BrokenProcessPool and the pool is restarted.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            interval = PARSE_MEMORY_POLL_INTERVAL if PARSE_MEMORY_LIMIT_MB > 0 else timeout
+            done, not_done = wait(futures, timeout=max(min(interval, deadline - time.monotonic()), 0), return_when=FIRST_EXCEPTION)
+            if not not_done or time.monotonic() >= deadline or any(future.exception() is not None for future in done):
+                return done, not_done
+            self._kill_oversized_workers(pool)
+
+    def _kill_oversized_workers(self, pool: ProcessPoolExecutor):
+        limit = PARSE_MEMORY_LIMIT_MB * 1024 * 1024
+        for process in list((pool._processes or {}).values()):
+            rss = process_memory(process.pid).get("rss", 0)
+            if rss > limit:
+                logger.warning(f"Parse process {process.pid} uses {rss / 1024 ** 2:.0f} MB, over PARSE_MEMORY_LIMIT_MB={PARSE_MEMORY_LIMIT_MB}; killing it.")
+                process.kill()
+
+    def _restart_pool(self, broken_pool: ProcessPoolExecutor, terminate: bool = False):
+        with self._lock:
+            if self._pool is not broken_pool:
+                # Already replaced by another thread
+                return
+            logger.warning(f"Parse process pool {'stuck' if terminate else 'broken'}; restarting it.")
+            if terminate:
+                # ProcessPoolExecutor has no public way to kill busy workers
+                for process in list((broken_pool._processes or {}).values()):
+                    process.terminate()
+            broken_pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = self._create_pool()
@@ -0,0 +1,50 @@
+import os
+import re
+import time
+import logging
+from contextlib import contextmanager
+from .storage import LOCAL_STORAGE_DIR
+
+logger = logging.getLogger(__name__)
+
+# Master switch for the sampling profiler; when off, X-Profile headers are ignored
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+# Also profile every background ingestion job (parse -> index) when profiling is enabled
+PROFILE_INGESTION = os.getenv("PROFILE_INGESTION", "false").lower() == "true"
+# Request header that opts a single request into profiling
+PROFILE_HEADER = os.getenv("PROFILE_HEADER", "X-Profile")
+# Directory the HTML profile reports are written to
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(LOCAL_STORAGE_DIR, "profiles"))
+# Sampling interval in seconds
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.001))
+
+def profiling_requested(headers) -> bool:
+    return PROFILING_ENABLED and headers.get(PROFILE_HEADER, "").lower() in ("1", "true", "yes")
+
+@contextmanager
+def sample_profile(name: str):
+    """Run the enclosed block under pyinstrument and write an HTML report to PROFILE_DIR.
+
+    pyinstrument is optional: without it the block runs unprofiled and a warning is logged.
+    """
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        logger.warning("Profiling requested but pyinstrument is not installed.")
+        yield
+        return
+    profiler = Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        try:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "_", name).strip("_")
+            report_path = os.path.join(PROFILE_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_name}.html")
+            with open(report_path, "w", encoding="utf-8") as f:
+                f.write(profiler.output_html())
+            logger.info(f"Profile for {name} written to {report_path}.")
+        except OSError as e:
+            logger.error(f"Could not write profile for {name}: {e}", exc_info=True)
@@ -0,0 +1,103 @@
+import os
+import logging
+from typing import Dict, List, Tuple
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from .db import models
+from .elasticsearch_client import search_chunks_bm25
+from .deletion import STATUS_DELETING
+
+logger = logging.getLogger(__name__)
+
+# Number of chunks handed to the LLM per question
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 5))
+# HNSW search breadth; higher values trade latency for recall
+HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", 64))
+# pgvector >= 0.8 iterative index scans: keep scanning the HNSW graph until top_k rows pass the owner filter,
+# instead of filtering only the first ef_search neighbours of the whole table. "off" for older pgvector
+HNSW_ITERATIVE_SCAN = os.getenv("HNSW_ITERATIVE_SCAN", "relaxed_order")
+# "hybrid" fuses BM25 (Elasticsearch) and vector (pgvector) rankings; "vector" uses pgvector only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+# Candidates taken from each ranking before fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 50))
+# Reciprocal rank fusion constant; larger values flatten the weight of top ranks
+RRF_K = int(os.getenv("RRF_K", 60))
+
+async def _nearest_chunks(db: AsyncSession, owner_id: int, query_embedding: List[float], top_k: int, exact: bool) -> List[Tuple[models.DocumentChunk, float]]:
+    distance = models.DocumentChunk.embedding.cosine_distance(query_embedding).label("distance")
+    # "+ 0" hides the ordering from the HNSW index, so the owner's chunks are found through the
+    # owner and document_id indexes and ranked exhaustively
+    order = models.DocumentChunk.embedding.cosine_distance(query_embedding) + 0 if exact else distance
+    stmt = (
+        select(models.DocumentChunk, distance)
+        .join(models.Document, models.Document.id == models.DocumentChunk.document_id)
+        .where(models.Document.owner_id == owner_id)
+        .where(models.Document.status != STATUS_DELETING)
+        .where(models.DocumentChunk.embedding.isnot(None))
+        .order_by(order)
+        .limit(top_k)
+    )
+    return [(row[0], float(row[1])) for row in (await db.execute(stmt)).all()]
+
+async def retrieve_relevant_chunks(db: AsyncSession, owner_id: int, query_embedding: List[float], top_k: int = RETRIEVAL_TOP_K) -> List[Tuple[models.DocumentChunk, float]]:
+    """Return the top_k chunks owned by owner_id closest to query_embedding, with their cosine distance.
+
+    The HNSW index covers every owner's chunks and the owner filter is applied to what it returns. When
+    that yields fewer than top_k rows (an owner with few chunks in a large table, or older pgvector
+    without iterative scans), the owner's chunks are ranked exactly instead.
+    """
+    # ef_search must be at least top_k for the HNSW scan to return top_k rows
+    ef_search = max(HNSW_EF_SEARCH, top_k)
+    await db.execute(text(f"SET LOCAL hnsw.ef_search = {int(ef_search)}"))
+    if HNSW_ITERATIVE_SCAN != "off":
+        await db.execute(text("SELECT set_config('hnsw.iterative_scan', :mode, true)"), {"mode": HNSW_ITERATIVE_SCAN})
+    results = await _nearest_chunks(db, owner_id, query_embedding, top_k, exact=False)
+    if len(results) < top_k:
+        results = await _nearest_chunks(db, owner_id, query_embedding, top_k, exact=True)
+        logger.debug(f"Index scan found too few chunks for user {owner_id}; ranked {len(results)} exactly.")
+    # relaxed_order may return neighbours slightly out of order
+    results.sort(key=lambda item: item[1])
+    logger.debug(f"Retrieved {len(results)} chunks for user {owner_id} (top_k={top_k}).")
+    return results
+
+def reciprocal_rank_fusion(rankings: List[List[int]], k: int = RRF_K) -> List[Tuple[int, float]]:
+    """Fuse ranked id lists: score(id) = sum(1 / (k + rank)) over the lists containing it, best first."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, item_id in enumerate(ranking, start=1):
+            scores[item_id] = scores.get(item_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+async def hybrid_retrieve(db: AsyncSession, owner_id: int, question: str, query_embedding: List[float], top_k: int = RETRIEVAL_TOP_K) -> List[Tuple[models.DocumentChunk, float]]:
+    """Return the top_k chunks by reciprocal rank fusion of BM25 and vector rankings, with their fused score.
+
+    Falls back to vector-only ranking if Elasticsearch is unavailable.
+    """
+    vector_hits = await retrieve_relevant_chunks(db, owner_id, query_embedding, top_k=max(RETRIEVAL_CANDIDATES, top_k))
+    if RETRIEVAL_MODE != "hybrid":
+        return vector_hits[:top_k]
+    try:
+        bm25_hits = await run_in_threadpool(search_chunks_bm25, owner_id, question, max(RETRIEVAL_CANDIDATES, top_k))
+    except Exception as e:
+        logger.warning(f"BM25 search failed for user {owner_id}, using vector ranking only: {e}")
+        return vector_hits[:top_k]
+    fused = reciprocal_rank_fusion([
+        [chunk.id for chunk, _distance in vector_hits],
+        [chunk_id for chunk_id, _score in bm25_hits],
+    ])[:top_k]
+    chunks_by_id = {chunk.id: chunk for chunk, _distance in vector_hits}
+    # BM25-only hits still need their rows; the owner filter guards against a stale index
+    missing_ids = [chunk_id for chunk_id, _score in fused if chunk_id not in chunks_by_id]
+    if missing_ids:
+        rows = (await db.execute(
+            select(models.DocumentChunk)
+            .join(models.Document, models.Document.id == models.DocumentChunk.document_id)
+            .where(models.Document.owner_id == owner_id)
+            .where(models.Document.status != STATUS_DELETING)
+            .where(models.DocumentChunk.id.in_(missing_ids))
+        )).scalars().all()
+        chunks_by_id.update({chunk.id: chunk for chunk in rows})
+    results = [(chunks_by_id[chunk_id], score) for chunk_id, score in fused if chunk_id in chunks_by_id]
+    logger.debug(f"Hybrid retrieval for user {owner_id}: {len(vector_hits)} vector, {len(bm25_hits)} BM25, {len(results)} fused.")
+    return results
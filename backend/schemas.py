@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class DocumentBase(BaseModel):
@@ -13,11 +13,36 @@ class DocumentBase(BaseModel):
     class Config:
         orm_mode = True
 
+class DocumentListItem(BaseModel):
+    id: int
+    filename: str
+    upload_timestamp: Optional[datetime]
+    status: str
+
+class DocumentStatusResponse(BaseModel):
+    id: int
+    filename: str
+    status: str
+    error_message: Optional[str] = None
+    chunk_count: int = 0
+
+class BulkDeleteRequest(BaseModel):
+    document_ids: List[int]
+
+class ChunkMetadata(BaseModel):
+    """Per-chunk provenance stored as JSONB; document-level fields (filename, owner, path) live on Document."""
+    page: Optional[int] = None # first page the chunk comes from
+    page_end: Optional[int] = None # last page, only when the chunk spans pages
+    type: Optional[str] = None # unstructured element category of the chunk's body (NarrativeText, Table, ...)
+    section: Optional[str] = None # enclosing section title(s)
+    elements: Optional[List[int]] = None # [first, last] element index in the parsed document
+    offsets: Optional[List[int]] = None # [start, end) character offsets in the parsed document text
+
 class DocumentChunkBase(BaseModel):
     id: int
     document_id: int
     chunk_text: str
-    chunk_metadata: str
+    chunk_metadata: Optional[ChunkMetadata] = None
 
     class Config:
         orm_mode = True 
\ No newline at end of file
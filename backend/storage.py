@@ -0,0 +1,61 @@
+import os
+import uuid
+import hashlib
+import logging
+from typing import Optional, Tuple
+from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+# Ensure local storage directory exists
+LOCAL_STORAGE_DIR = os.path.join(os.path.dirname(__file__), 'storage')
+os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
+
+# Bytes read from the upload and written to disk per iteration
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+# Uploads larger than this are rejected while streaming
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 200 * 1024 * 1024))
+
+class UploadTooLarge(Exception):
+    """Raised when an upload exceeds MAX_UPLOAD_SIZE."""
+
+def upload_path(owner_id: int, filename: str, document_id: Optional[int] = None) -> str:
+    """A fresh path for an uploaded file, so documents sharing a filename never share or overwrite a stored file.
+
+    Replacements go under the document's own directory: <owner>/<document>/<uuid>-<filename>.
+    """
+    directory = os.path.join(LOCAL_STORAGE_DIR, str(owner_id))
+    if document_id is not None:
+        directory = os.path.join(directory, str(document_id))
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{uuid.uuid4().hex}-{os.path.basename(filename)}")
+
+async def save_upload(file: UploadFile, destination: str, max_size: int = MAX_UPLOAD_SIZE, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Tuple[int, str]:
+    """Stream file to destination in chunk_size pieces; returns (size_in_bytes, sha256_hex).
+
+    The file is written to a temporary path and moved into place only once it is complete,
+    so a rejected or failed upload never leaves a partial file at destination. The temporary name is
+    unique per call, so concurrent uploads to the same destination never interleave their bytes.
+    """
+    temp_path = f"{destination}.{uuid.uuid4().hex}.part"
+    sha256 = hashlib.sha256()
+    size = 0
+    try:
+        with open(temp_path, "wb") as f:
+            while True:
+                chunk = await file.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"File exceeds maximum upload size of {max_size} bytes")
+                sha256.update(chunk)
+                await run_in_threadpool(f.write, chunk)
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    logger.debug(f"Streamed {size} bytes to {destination}.")
+    return size, sha256.hexdigest()
@@ -32,14 +32,16 @@ function DocumentList() {
   const [error, setError] = useState(null);
   const [deleteStatus, setDeleteStatus] = useState({}); // To track deletion status per document
   const [confirmDelete, setConfirmDelete] = useState({ open: false, doc: null });
+  const [nextCursor, setNextCursor] = useState(null); // Keyset cursor for the next page, if any
 
   // Function to fetch documents from the backend
-  const fetchDocuments = async () => {
+  const fetchDocuments = async (cursor = null) => {
     setLoading(true);
     setError(null);
     try {
-      const response = await api.get('/documents/');
-      setDocuments(response.data);
+      const response = await api.get('/documents/', { params: cursor ? { cursor } : {} });
+      setDocuments(prevDocuments => (cursor ? [...prevDocuments, ...response.data] : response.data));
+      setNextCursor(response.headers['x-next-cursor'] || null);
     } catch (err) {
       console.error('Failed to fetch documents:', err);
       // Display the error message from the backend
@@ -92,9 +94,10 @@ function DocumentList() {
   };
 
   const getStatusDot = (status) => {
-    let color = '#22C55E'; // processed
-    if (status === 'processing') color = '#F59E42';
-    if (status === 'failed' || status === 'es_indexing_failed' || status === 'db_save_failed') color = '#EF4444';
+    let color = '#22C55E'; // indexed
+    if (status === 'uploaded' || status === 'parsing' || status === 'embedding') color = '#F59E42';
+    if (status === 'failed') color = '#EF4444';
+    if (status === 'deleting') color = '#9CA3AF';
     return <Box component="span" sx={{ display: 'inline-block', width: 10, height: 10, borderRadius: '50%', background: color, mr: 1, verticalAlign: 'middle' }} />;
   };
 
@@ -180,6 +183,11 @@ function DocumentList() {
           </Table>
         </TableContainer>
       )}
+      {nextCursor && (
+        <Box display="flex" justifyContent="center" sx={{ mt: 2 }}>
+          <Button onClick={() => fetchDocuments(nextCursor)} disabled={loading}>Load more</Button>
+        </Box>
+      )}
       <Dialog open={confirmDelete.open} onClose={handleCancelDelete}>
         <DialogTitle>Delete Document</DialogTitle>
         <DialogContent>
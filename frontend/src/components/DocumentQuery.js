@@ -6,6 +6,7 @@ import SearchIcon from '@mui/icons-material/Search';
 function DocumentQuery() {
   const [query, setQuery] = useState('');
   const [answer, setAnswer] = useState(null);
+  const [sources, setSources] = useState([]);
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
 
@@ -22,17 +23,48 @@ function DocumentQuery() {
     }
     setLoading(true);
     setAnswer(null);
+    setSources([]);
     setError(null);
     try {
-      const response = await api.post('/query/', { query });
-      setAnswer(response.data.answer);
+      // Stream the answer via Server-Sent Events so tokens render as they arrive
+      const response = await fetch(`${api.defaults.baseURL || ''}/query/stream`, {
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+          Authorization: `Bearer ${localStorage.getItem('accessToken')}`,
+        },
+        body: JSON.stringify({ query }),
+      });
+      if (!response.ok) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.detail || 'Query failed. Please try again.');
+      }
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      let streamedAnswer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const events = buffer.split('\n\n');
+        buffer = events.pop();
+        for (const rawEvent of events) {
+          const eventLine = rawEvent.split('\n').find(line => line.startsWith('event: '));
+          const dataLine = rawEvent.split('\n').find(line => line.startsWith('data: '));
+          if (!dataLine) continue;
+          const data = JSON.parse(dataLine.slice(6));
+          if (eventLine && eventLine.slice(7) === 'error') throw new Error(data.detail);
+          if (eventLine && eventLine.slice(7) === 'done' && data.sources) setSources(data.sources);
+          if (data.token) {
+            streamedAnswer += data.token;
+            setAnswer(streamedAnswer);
+          }
+        }
+      }
     } catch (err) {
       setAnswer(null);
-      if (err.response && err.response.data && err.response.data.detail) {
-        setError(`Query failed: ${err.response.data.detail}`);
-      } else {
-        setError('Query failed. Please try again.');
-      }
+      setError(`Query failed: ${err.message}`);
     } finally {
       setLoading(false);
     }
@@ -78,6 +110,11 @@ function DocumentQuery() {
               ✓ Answer
             </Typography>
             <Typography variant="body2" sx={{ lineHeight: 1.7 }}>{answer}</Typography>
+            {sources.length > 0 && (
+              <Typography variant="caption" color="text.secondary" sx={{ display: 'block', mt: 1 }}>
+                Sources: {sources.map((source, index) => `[${index + 1}] ${source.filename}`).join(', ')}
+              </Typography>
+            )}
           </Box>
         )}
         {loading && !answer && (
@@ -96,7 +96,7 @@ function DocumentUpload() {
         {uploadError && <Alert severity="error" sx={{ ml: 2, p: 0.5, fontSize: 12 }}>{uploadError}</Alert>}
         {uploadedDocument && (
           <Alert severity="success" sx={{ ml: 2, p: 0.5, fontSize: 12 }}>
-            Uploaded: {uploadedDocument.filename}
+            Uploaded: {uploadedDocument.filename} (processing in background)
           </Alert>
         )}
       </Box>